@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+修改计划（预览后再执行）
+替换、下载、智能修复等操作先为每个文件计算出要修改的位置，不写入任何文件：
+每处修改记录起止位置、原文本和新文本，并记录文件内容的 SHA-256。
+计划可以显示为统一差异格式（unified diff），保存为JSON，
+之后执行时只要文件哈希没有变化就直接按位置拼接，不再重新解析文件。
+"""
+
+import os
+import json
+import difflib
+import hashlib
+import datetime
+
+PLAN_VERSION = 1
+
+
+def read_text(path):
+    """读取文本文件，返回 (内容, 原始字节的 SHA-256)
+
+    换行符按文本模式统一为 \\n，计划中的位置都基于这样读出的内容。
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    content = data.decode('utf-8').replace('\r\n', '\n').replace('\r', '\n')
+    return content, hashlib.sha256(data).hexdigest()
+
+
+def make_edits(content, spans):
+    """把 (起, 止, 新文本[, 附加信息]) 列表转换为修改记录"""
+    edits = []
+    for span in spans:
+        start, end, new = span[:3]
+        edit = {'start': start, 'end': end, 'old': content[start:end], 'new': new}
+        if len(span) > 3 and span[3] is not None:
+            edit['requires'] = span[3]
+        edits.append(edit)
+    return edits
+
+
+def diff_edits(old, new):
+    """按行比较修改前后的内容，返回修改记录（用于逐段修改文本、无法直接给出位置的操作）"""
+    if old == new:
+        return []
+    old_lines = old.splitlines(True)
+    new_lines = new.splitlines(True)
+    # 每行的起始位置
+    offsets = [0]
+    for line in old_lines:
+        offsets.append(offsets[-1] + len(line))
+
+    edits = []
+    matcher = difflib.SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            continue
+        edits.append({'start': offsets[i1], 'end': offsets[i2],
+                      'old': ''.join(old_lines[i1:i2]), 'new': ''.join(new_lines[j1:j2])})
+    return edits
+
+
+def apply_edits(content, edits):
+    """按位置拼接修改后的内容，edits 按位置排序且互不重叠"""
+    if not edits:
+        return content
+    parts = []
+    last = 0
+    for edit in edits:
+        parts.append(content[last:edit['start']])
+        parts.append(edit['new'])
+        last = edit['end']
+    parts.append(content[last:])
+    return ''.join(parts)
+
+
+class FileChange:
+    """单个文件的修改计划
+
+    pre_hash: 计划基于的文件内容哈希
+    edits: 修改记录列表 {'start', 'end', 'old', 'new'[, 'requires']}，
+           requires 表示这处修改依赖的前置条件（如需要先下载的图片）
+    meta: 操作相关的附加信息（如智能修复的匹配记录）
+    """
+
+    def __init__(self, path, pre_hash, edits=None, meta=None):
+        self.path = path
+        self.pre_hash = pre_hash
+        self.edits = edits or []
+        self.meta = meta
+
+    def to_dict(self):
+        data = {'path': self.path, 'pre_hash': self.pre_hash, 'edits': self.edits}
+        if self.meta is not None:
+            data['meta'] = self.meta
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['path'], data['pre_hash'], data.get('edits', []), data.get('meta'))
+
+
+class ChangePlan:
+    """一次操作的完整修改计划
+
+    operation: 操作名称
+    key: 生成计划时的输入指纹（映射表、图片文件等），变化后计划作废
+    changes: {文件路径: FileChange}，包含检查过但不需要修改的文件
+    """
+
+    def __init__(self, operation, key='', changes=None, errors=None, created=None):
+        self.operation = operation
+        self.key = key
+        self.changes = changes if changes is not None else {}
+        self.errors = errors if errors is not None else []
+        self.created = created or datetime.datetime.now().isoformat(timespec='seconds')
+
+    def add(self, change):
+        self.changes[change.path] = change
+
+    def changed_files(self):
+        """有修改的文件"""
+        return [change for change in self.changes.values() if change.edits]
+
+    def summary(self):
+        changed = self.changed_files()
+        return {
+            'operation': self.operation,
+            'files_checked': len(self.changes),
+            'files_changed': len(changed),
+            'replacements': sum(len(change.edits) for change in changed),
+            'errors': self.errors,
+        }
+
+    def unified_diff(self, relpath=lambda path: path):
+        """返回统一差异格式的预览文本；计划之后又被修改的文件只给出提示"""
+        chunks = []
+        for change in self.changed_files():
+            name = relpath(change.path)
+            try:
+                content, current_hash = read_text(change.path)
+            except (OSError, UnicodeDecodeError) as e:
+                chunks.append(f"# {name}: 无法读取 ({e})\n")
+                continue
+            if current_hash != change.pre_hash:
+                chunks.append(f"# {name}: 生成计划后文件已被修改，执行时将重新计算\n")
+                continue
+            for line in difflib.unified_diff(
+                    content.splitlines(True), apply_edits(content, change.edits).splitlines(True),
+                    fromfile=f"a/{name}", tofile=f"b/{name}"):
+                if not line.endswith('\n'):
+                    line += '\n\\ No newline at end of file\n'
+                chunks.append(line)
+        return ''.join(chunks)
+
+    def to_dict(self):
+        return {
+            'version': PLAN_VERSION,
+            'operation': self.operation,
+            'key': self.key,
+            'created': self.created,
+            'changes': [change.to_dict() for change in self.changes.values()],
+            'errors': self.errors,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        if data.get('version') != PLAN_VERSION:
+            raise ValueError("修改计划版本不兼容")
+        changes = {item['path']: FileChange.from_dict(item) for item in data.get('changes', [])}
+        return cls(data['operation'], data.get('key', ''), changes, data.get('errors', []), data.get('created'))
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls.from_dict(json.load(f))
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+并发下载调度
+图片按主机排队，在全局并发上限和每个主机的并发上限内同时下载：
+1. 每个主机共用一个带连接池的 requests.Session，保持长连接，不再每张图片重新握手；
+   给出限流器时请求经过限流，主机被限流后同时下载数随之减少
+2. 同一目标路径只下载一次，多个文件引用同一图片时共享结果
+3. 一组图片（一个MD文件引用的图片）全部完成后立即回调，回调按完成顺序逐个执行
+"""
+
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from rate_limiter import url_host, RateLimitedAdapter
+
+
+def is_connection_failure(error):
+    """请求异常是否表示主机本身无法连接（连接被拒绝、DNS失败、连接超时）
+
+    读取超时、SSL错误等只与单个请求有关，不算主机无法连接。
+    """
+    return (isinstance(error, requests.exceptions.ConnectionError)
+            and not isinstance(error, (requests.exceptions.SSLError, requests.exceptions.ProxyError)))
+
+
+class HostSessionPool:
+    """每个主机一个 requests.Session，连接池大小与该主机的并发上限一致
+
+    limiter: RateLimiter，给出时所有请求经过限流
+    """
+
+    def __init__(self, pool_size=4, limiter=None):
+        self.pool_size = pool_size
+        self.limiter = limiter
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    def get(self, url):
+        host = url_host(url)
+        with self.lock:
+            session = self.sessions.get(host)
+            if session is None:
+                session = requests.Session()
+                if self.limiter is not None:
+                    adapter = RateLimitedAdapter(self.limiter, pool_connections=1, pool_maxsize=self.pool_size)
+                else:
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                self.sessions[host] = session
+            return session
+
+    def close(self):
+        with self.lock:
+            for session in self.sessions.values():
+                session.close()
+            self.sessions.clear()
+
+
+class DownloadScheduler:
+    """按主机限流的并发下载调度器
+
+    fetch(url, target, session) 在工作线程中执行一次下载（或链接检查），返回值作为该目标的结果，
+    抛出异常时结果为 False。
+    max_workers: 全局同时下载数
+    per_host: 每个主机同时下载数
+    limiter: RateLimiter，给出时请求经过限流，每个主机的同时下载数不超过限流器当前的并发上限
+    """
+
+    def __init__(self, fetch, max_workers=16, per_host=4, limiter=None):
+        self.fetch = fetch
+        self.max_workers = max(1, max_workers)
+        self.per_host = max(1, per_host)
+        self.limiter = limiter
+        self.sessions = HostSessionPool(self.per_host, limiter)
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='download')
+
+        self.lock = threading.Condition()
+        self.callback_lock = threading.Lock()  # 回调逐个执行
+        self.jobs = {}  # target -> {'url', 'host', 'done', 'result', 'groups'}
+        self.pending = {}  # host -> deque[target]，等待下载
+        self.active = {}  # host -> 正在下载数
+        self.running = 0
+        self.open_groups = 0
+        self.callback_error = None
+
+    def add_group(self, jobs, callback):
+        """登记一组下载 {target: url}，全部完成后调用 callback({target: 结果})"""
+        group = {'targets': list(jobs), 'remaining': 0, 'callback': callback}
+        with self.lock:
+            self.open_groups += 1
+            for target, url in jobs.items():
+                job = self.jobs.get(target)
+                if job is None:
+                    host = url_host(url)
+                    job = self.jobs[target] = {'url': url, 'host': host, 'done': False, 'result': None, 'groups': []}
+                    self.pending.setdefault(host, deque()).append(target)
+                if not job['done']:
+                    job['groups'].append(group)
+                    group['remaining'] += 1
+            ready = group['remaining'] == 0
+            self._dispatch()
+        if ready:
+            self._finish_group(group)
+
+    def _dispatch(self):
+        """在并发上限内启动等待中的下载（调用时已持有锁），各主机轮流启动"""
+        while self.running < self.max_workers:
+            started = False
+            for host, queue in list(self.pending.items()):
+                if self.running >= self.max_workers:
+                    break
+                if not queue:
+                    del self.pending[host]
+                    continue
+                if self.active.get(host, 0) >= self.host_limit(host):
+                    continue
+                target = queue.popleft()
+                self.active[host] = self.active.get(host, 0) + 1
+                self.running += 1
+                self.executor.submit(self._run, target)
+                started = True
+            if not started:
+                break
+
+    def host_limit(self, host):
+        """主机当前允许的同时下载数"""
+        if self.limiter is None:
+            return self.per_host
+        return min(self.per_host, self.limiter.concurrency(host))
+
+    def _run(self, target):
+        job = self.jobs[target]
+        try:
+            result = self.fetch(job['url'], target, self.sessions.get(job['url']))
+        except Exception:
+            result = False
+
+        finished = []
+        with self.lock:
+            job['done'] = True
+            job['result'] = result
+            self.active[job['host']] -= 1
+            self.running -= 1
+            for group in job['groups']:
+                group['remaining'] -= 1
+                if group['remaining'] == 0:
+                    finished.append(group)
+            job['groups'] = []
+            self._dispatch()
+        for group in finished:
+            self._finish_group(group)
+
+    def _finish_group(self, group):
+        results = {target: self.jobs[target]['result'] for target in group['targets']}
+        try:
+            with self.callback_lock:
+                group['callback'](results)
+        except Exception as e:
+            if self.callback_error is None:
+                self.callback_error = e
+        finally:
+            with self.lock:
+                self.open_groups -= 1
+                self.lock.notify_all()
+
+    def results(self):
+        """所有目标的结果 {target: 结果}"""
+        with self.lock:
+            return {target: job['result'] for target, job in self.jobs.items() if job['done']}
+
+    def join(self):
+        """等待所有下载和回调完成，关闭线程池和连接；回调出错时在这里抛出"""
+        with self.lock:
+            while self.open_groups or self.running:
+                self.lock.wait()
+        self.executor.shutdown(wait=True)
+        self.sessions.close()
+        if self.callback_error is not None:
+            raise self.callback_error
@@ -3,16 +3,60 @@
 """
 Gitee图片链接修复工具
 专门处理Gitee图床的403 Forbidden问题
+原始链接和各种修复方案同时探测，按优先顺序（原始链接在前）取可用的；记住每个仓库（主机/用户/仓库）用哪种修复方案有效，
+同一仓库的其他图片先只试这一种，学到的规则保存到文件，下次运行继续使用。
+
+用法:
+    python gitee_image_fixer.py <gitee_url> <local_path>
+    python gitee_image_fixer.py --batch pairs.tsv --output results.jsonl
+    cat pairs.jsonl | python gitee_image_fixer.py --batch -
+批量模式每行一对 "URL<TAB>本地路径[<TAB>字节数]" 或 {"url": ..., "path": ...[, "size": ...]}，
+在同一个连接池上并发处理，每个结果输出一行JSON。
 """
 
 import re
+import sys
+import json
+import time
+import argparse
+import threading
 import requests
 import os
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
 from urllib.parse import urlparse
+from image_download import stream_to_file, DEFAULT_MAX_BYTES
+from rate_limiter import RateLimiter, RateLimitedAdapter, RequestDeferred, THROTTLE_STATUSES, url_host, parse_retry_after
+from write_journal import atomic_write_bytes
+
+DEFAULT_RULES_FILE = ".gitee_fix_rules.json"  # 学到的修复规则 {仓库前缀: 方案名称}
+ORIGINAL_RULE = '原始链接'
+DEFAULT_PROBE_WORKERS = 5  # 每张图片同时探测的候选链接数
+
+
+def repo_prefix(url):
+    """URL所属的仓库前缀：Gitee/GitHub 类地址为 主机/用户/仓库，其他地址为主机"""
+    parsed = urlparse(url)
+    host = parsed.netloc.lower()
+    parts = [part for part in parsed.path.split('/') if part]
+    if len(parts) >= 3 and ('/raw/' in parsed.path or '/blob/' in parsed.path):
+        return f"{host}/{parts[0]}/{parts[1]}"
+    return host
+
 
 class GiteeImageFixer:
-    def __init__(self):
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, limiter=None, rules_file=DEFAULT_RULES_FILE,
+                 probe_workers=DEFAULT_PROBE_WORKERS, pool_size=10):
+        self.max_bytes = max_bytes  # 单张图片大小上限
+        self.probe_workers = probe_workers  # 同时探测的候选链接数
+        self.rules_file = rules_file  # 学到的修复规则文件，为空时不保存
+        self.rules_lock = threading.Lock()
+        self.rules = self.load_rules()
+        # 请求经过按主机限流（可以与引擎共用同一个限流器），避免连续探测触发 Gitee 的 403/429
+        self.limiter = limiter or RateLimiter()
         self.session = requests.Session()
+        adapter = RateLimitedAdapter(self.limiter, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
         self.session.headers.update({
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
             'Referer': 'https://gitee.com/',
@@ -46,63 +90,255 @@ class GiteeImageFixer:
         
         return fixes
     
+    def probe(self, url):
+        """探测URL，可访问时返回 Content-Length（未知时为 -1），不可访问时返回 None；
+        被限流时等待 Retry-After 后再试一次，仍被限流时抛出 RequestDeferred"""
+        for attempt in range(2):
+            try:
+                response = self.session.head(url, timeout=10, allow_redirects=True)
+            except RequestDeferred:
+                raise
+            except:
+                return None
+            if response.status_code not in THROTTLE_STATUSES:
+                if response.status_code != 200:
+                    return None
+                length = response.headers.get('content-length', '')
+                return int(length) if length.isdigit() else -1
+        raise RequestDeferred(url_host(url), 0)
+    
     def test_url(self, url):
         """测试URL是否可访问"""
+        return self.probe(url) is not None
+    
+    def load_rules(self):
+        """读取学到的修复规则，文件不存在或损坏时返回空表"""
+        if not self.rules_file:
+            return {}
         try:
-            response = self.session.head(url, timeout=10, allow_redirects=True)
-            return response.status_code == 200
-        except:
-            return False
+            with open(self.rules_file, 'r', encoding='utf-8') as f:
+                rules = json.load(f)
+            return rules if isinstance(rules, dict) else {}
+        except (OSError, ValueError):
+            return {}
+    
+    def learn_rule(self, url, rule):
+        """记住这个仓库有效的修复方案，变化时写入文件"""
+        prefix = repo_prefix(url)
+        with self.rules_lock:
+            if self.rules.get(prefix) == rule:
+                return
+            self.rules[prefix] = rule
+            if self.rules_file:
+                try:
+                    atomic_write_bytes(self.rules_file, json.dumps(self.rules, ensure_ascii=False, indent=2).encode('utf-8'))
+                except OSError:
+                    pass
+    
+    def candidates(self, url):
+        """原始链接和所有修复方案 [(方案名称, URL)]，URL相同的只保留第一个"""
+        seen = set()
+        result = []
+        for name, candidate in [(ORIGINAL_RULE, url)] + self.fix_gitee_url(url):
+            if candidate not in seen:
+                seen.add(candidate)
+                result.append((name, candidate))
+        return result
     
     def find_working_url(self, original_url):
         """找到可用的URL"""
-        # 首先测试原始URL
-        if self.test_url(original_url):
-            return original_url
+        return self.locate(original_url)[0]
+    
+    def locate(self, original_url):
+        """找到可用的URL，返回 (URL, Content-Length)，找不到时返回 (None, None)，长度未知时为 -1
+
+        先只试这个仓库之前有效的方案；没有记录或不再有效时同时探测所有候选，按候选顺序取第一个可用的，
+        原始链接可用时不会采用修复方案。排在可用候选之前的候选被限流时抛出 RequestDeferred。
+        """
+        candidates = self.candidates(original_url)
+        with self.rules_lock:
+            learned = self.rules.get(repo_prefix(original_url))
+        for name, candidate in candidates:
+            if name == learned:
+                length = self.probe(candidate)
+                if length is not None:
+                    return candidate, length
+                candidates = [item for item in candidates if item[0] != name]
+                break
+        if not candidates:
+            return None, None
         
-        # 尝试各种修复方案
-        fixes = self.fix_gitee_url(original_url)
-        for fix_name, fixed_url in fixes:
-            if self.test_url(fixed_url):
-                return fixed_url
+        executor = ThreadPoolExecutor(max_workers=max(1, min(self.probe_workers, len(candidates))))
+        futures = [(name, candidate, executor.submit(self.probe, candidate)) for name, candidate in candidates]
+        try:
+            # 同时探测，但按候选顺序取结果：原始链接优先，其次按修复方案的顺序；
+            # 排在前面的候选都确定不可用后，第一个可用的才被采用
+            for name, candidate, future in futures:
+                length = future.result()
+                if length is not None:
+                    self.learn_rule(original_url, name)
+                    return candidate, length
+        finally:
+            # 取得结果后不再等待其余探测；前面的候选被限流（RequestDeferred）时无法确定该用哪个，整体推迟
+            executor.shutdown(wait=False, cancel_futures=True)
+        return None, None
+    
+    def download_from(self, working_url, local_path):
+        """从可用的URL下载图片，返回 stream_to_file 的结果；被限流时抛出 RequestDeferred"""
+        response = self.session.get(working_url, timeout=30, stream=True)
+        if response.status_code in THROTTLE_STATUSES:
+            response.close()
+            raise RequestDeferred(url_host(working_url), parse_retry_after(response.headers.get('Retry-After')) or 0)
+        if not response.ok:
+            response.close()
+        response.raise_for_status()
         
-        return None
+        os.makedirs(os.path.dirname(os.path.abspath(local_path)), exist_ok=True)
+        # 流式写入临时文件，校验是图片后再替换目标文件
+        return stream_to_file(response, local_path, self.max_bytes)
     
     def download_image(self, url, local_path):
-        """下载图片"""
-        working_url = self.find_working_url(url)
+        """下载图片，返回 (结果, 说明)；结果为 None 表示服务器限流，推迟到以后再试"""
+        try:
+            working_url = self.find_working_url(url)
+        except RequestDeferred as e:
+            return None, f"服务器限流，已推迟: {e}"
         if not working_url:
             return False, "找不到可用的URL"
         
         try:
-            response = self.session.get(working_url, timeout=30)
-            response.raise_for_status()
+            info = self.download_from(working_url, local_path)
+            return True, f"成功下载: {working_url} ({info['size']} 字节)"
+        except RequestDeferred as e:
+            return None, f"服务器限流，已推迟: {e}"
+        except Exception as e:
+            return False, str(e)
+    
+    def process_entry(self, entry):
+        """批量模式处理一项 {'url', 'path'[, 'size']}，返回结果记录
+
+        status: ok 下载成功、skipped 本地文件已存在且大小一致、failed 失败、deferred 被限流推迟
+        """
+        start = time.monotonic()
+        url, local_path = entry.get('url'), entry.get('path')
+        result = {'url': url, 'path': local_path, 'status': 'failed', 'working_url': None, 'bytes': 0}
+        try:
+            if entry.get('error'):
+                raise ValueError(entry['error'])
+            # 给出了期望大小时，本地文件大小一致就不访问网络
+            expected = entry.get('size')
+            exists = os.path.isfile(local_path)
+            if exists and expected is not None and os.path.getsize(local_path) == expected:
+                result.update(status='skipped', bytes=expected)
+                return result
             
-            with open(local_path, 'wb') as f:
-                f.write(response.content)
+            working_url, length = self.locate(url)
+            if not working_url:
+                raise ValueError("找不到可用的URL")
+            result['working_url'] = working_url
+            if exists and length is not None and length >= 0 and os.path.getsize(local_path) == length:
+                result.update(status='skipped', bytes=length)
+                return result
             
-            return True, f"成功下载: {working_url}"
+            info = self.download_from(working_url, local_path)
+            result.update(status='ok', bytes=info['size'])
+        except RequestDeferred as e:
+            result.update(status='deferred', error=str(e))
         except Exception as e:
-            return False, str(e)
+            result['error'] = str(e)
+        finally:
+            result['elapsed'] = round(time.monotonic() - start, 3)
+        return result
+
+
+def read_batch(stream):
+    """读取批量任务：每行 "URL<TAB>路径[<TAB>字节数]" 或 JSON 对象，跳过空行和 # 开头的注释"""
+    for number, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        try:
+            if line.startswith('{'):
+                item = json.loads(line)
+                entry = {'url': item['url'], 'path': item['path']}
+                if item.get('size') is not None:
+                    entry['size'] = int(item['size'])
+            else:
+                fields = line.split('\t')
+                entry = {'url': fields[0], 'path': fields[1]}
+                if len(fields) > 2 and fields[2].strip():
+                    entry['size'] = int(fields[2])
+        except (ValueError, KeyError, IndexError, TypeError) as e:
+            entry = {'url': None, 'path': None, 'error': f"第 {number} 行格式错误: {e}"}
+        yield entry
 
-def main():
+
+def run_batch(fixer, entries, out, workers=8):
+    """并发处理批量任务，每完成一项向 out 写一行JSON，返回各状态的数量
+
+    边读边提交，同时排队的任务不超过并发数的两倍，输入很大时也不会一次建立所有任务。
+    """
+    counts = {'ok': 0, 'skipped': 0, 'failed': 0, 'deferred': 0}
+    workers = max(1, workers)
+    
+    def write(done):
+        for future in done:
+            result = future.result()
+            counts[result['status']] += 1
+            out.write(json.dumps(result, ensure_ascii=False) + '\n')
+            out.flush()
+    
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = set()
+        for entry in entries:
+            if len(pending) >= workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                write(done)
+            pending.add(executor.submit(fixer.process_entry, entry))
+        write(as_completed(pending))
+    return counts
+
+
+def main(argv=None):
     """命令行工具"""
-    import sys
+    parser = argparse.ArgumentParser(description="Gitee图片链接修复工具")
+    parser.add_argument('url', nargs='?', help="图片URL")
+    parser.add_argument('local_path', nargs='?', help="保存路径")
+    parser.add_argument('--batch', metavar='FILE', help="批量模式：从文件读取 URL 和路径（TSV 或 JSONL），- 表示标准输入")
+    parser.add_argument('--output', metavar='FILE', help="批量模式的结果文件（JSONL），默认输出到标准输出")
+    parser.add_argument('--workers', type=int, default=8, help="批量模式同时处理的图片数")
+    parser.add_argument('--rules', default=DEFAULT_RULES_FILE, help="学到的修复规则文件")
+    args = parser.parse_args(argv)
     
-    if len(sys.argv) != 3:
-        print("用法: python gitee_image_fixer.py <gitee_url> <local_path>")
-        return
+    if args.batch:
+        # 每项最多同时探测 DEFAULT_PROBE_WORKERS 个候选，连接池按总并发数设置
+        fixer = GiteeImageFixer(rules_file=args.rules, pool_size=max(10, args.workers * DEFAULT_PROBE_WORKERS))
+        source = sys.stdin if args.batch == '-' else open(args.batch, 'r', encoding='utf-8')
+        out = sys.stdout if not args.output else open(args.output, 'w', encoding='utf-8')
+        try:
+            counts = run_batch(fixer, read_batch(source), out, args.workers)
+        finally:
+            if source is not sys.stdin:
+                source.close()
+            if out is not sys.stdout:
+                out.close()
+        print(" ".join(f"{status}: {count}" for status, count in counts.items()), file=sys.stderr)
+        return 1 if counts['failed'] else 0
     
-    url = sys.argv[1]
-    local_path = sys.argv[2]
+    if not args.url or not args.local_path:
+        parser.print_usage()
+        return 2
     
-    fixer = GiteeImageFixer()
-    success, message = fixer.download_image(url, local_path)
+    fixer = GiteeImageFixer(rules_file=args.rules)
+    success, message = fixer.download_image(args.url, args.local_path)
     
     if success:
         print(f"✅ {message}")
+    elif success is None:
+        print(f"⏸ {message}")
     else:
         print(f"❌ 下载失败: {message}")
+    return 0 if success else 1
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+HTTP 元数据缓存
+按URL持久保存服务器上次的响应：状态码、ETag、Last-Modified、Content-Length、下载内容的 SHA-256 和检查时间。
+1. 有效期内的记录直接使用，不发请求
+2. 过期后发送条件请求（If-None-Match / If-Modified-Since），内容没有变化时服务器只返回 304
+重复检查没有变化的链接几乎不需要时间，下载过的图片也不必重新传输。
+"""
+
+import time
+import sqlite3
+import threading
+from rate_limiter import RequestDeferred, THROTTLE_STATUSES
+from download_scheduler import is_connection_failure
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS http_meta (
+    url TEXT PRIMARY KEY,
+    status INTEGER,
+    etag TEXT,
+    last_modified TEXT,
+    content_length INTEGER,
+    sha256 TEXT,
+    error TEXT,
+    checked REAL NOT NULL
+);
+'''
+
+DEFAULT_TTL = 24 * 3600  # 正常响应的有效期（秒）
+ERROR_TTL = 600  # 请求出错（超时、连接失败）的记录只保留较短时间
+OK_STATUSES = (200, 301, 302)
+
+
+class HttpCache:
+    """基于 SQLite 的 HTTP 元数据缓存（线程安全）
+
+    ttl: 记录的有效期（秒），0 表示每次都发送条件请求
+    """
+
+    SCHEMA_VERSION = 1
+
+    def __init__(self, db_path, ttl=DEFAULT_TTL):
+        self.db_path = db_path
+        self.ttl = ttl
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode = WAL')
+        self.conn.execute('PRAGMA synchronous = NORMAL')
+        with self.lock, self.conn:
+            version = self.conn.execute('PRAGMA user_version').fetchone()[0]
+            if version not in (0, self.SCHEMA_VERSION):
+                self.conn.execute('DROP TABLE IF EXISTS http_meta')
+            self.conn.executescript(SCHEMA)
+            self.conn.execute(f'PRAGMA user_version = {self.SCHEMA_VERSION}')
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def get(self, url):
+        """返回URL的记录（字典），没有时返回 None"""
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT status, etag, last_modified, content_length, sha256, error, checked '
+                'FROM http_meta WHERE url = ?', (url,)).fetchone()
+        if row is None:
+            return None
+        keys = ('status', 'etag', 'last_modified', 'content_length', 'sha256', 'error', 'checked')
+        return dict(zip(keys, row))
+
+    def is_fresh(self, record):
+        """记录是否仍在有效期内"""
+        if record is None:
+            return False
+        ttl = min(self.ttl, ERROR_TTL) if record['error'] else self.ttl
+        return time.time() - record['checked'] < ttl
+
+    @staticmethod
+    def conditional_headers(record):
+        """由记录生成条件请求头"""
+        headers = {}
+        if record and record.get('etag'):
+            headers['If-None-Match'] = record['etag']
+        if record and record.get('last_modified'):
+            headers['If-Modified-Since'] = record['last_modified']
+        return headers
+
+    def store(self, url, status=None, headers=None, sha256=None, error=None):
+        """记录一次响应；304 时只刷新检查时间，保留原有的状态和校验信息"""
+        now = time.time()
+        with self.lock, self.conn:
+            if status == 304:
+                self.conn.execute('UPDATE http_meta SET checked = ?, error = NULL WHERE url = ?', (now, url))
+                return
+            headers = headers or {}
+            etag = headers.get('etag')
+            last_modified = headers.get('last-modified')
+            old = self.get(url)
+            if sha256 is None and old and not error and (
+                    (etag and etag == old['etag']) or (last_modified and last_modified == old['last_modified'])):
+                # HEAD 请求没有内容，校验信息没变时保留上次下载的哈希
+                sha256 = old['sha256']
+            length = headers.get('content-length')
+            self.conn.execute(
+                'INSERT OR REPLACE INTO http_meta(url, status, etag, last_modified, content_length, sha256, error, checked) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (url, status, etag, last_modified, int(length) if length and length.isdigit() else None,
+                 sha256, error, now))
+
+    def check(self, session, url, timeout=10):
+        """检查URL是否可访问，返回 (状态码或错误信息, 是否来自缓存)
+
+        有效期内直接返回记录；过期后发送条件 HEAD 请求，304 表示与上次相同。
+        被限流（429/503）的结果不记录；限流器推迟的请求抛出 RequestDeferred。
+        无法连接主机时记录错误后重新抛出异常，由调用方判断同一主机的其他链接是否还需要检查。
+        """
+        record = self.get(url)
+        if self.is_fresh(record):
+            return (record['error'] or record['status']), True
+        try:
+            response = session.head(url, timeout=timeout, allow_redirects=True,
+                                    headers=self.conditional_headers(record))
+        except RequestDeferred:
+            raise
+        except Exception as e:
+            self.store(url, error=str(e))
+            if is_connection_failure(e):
+                raise
+            return str(e), False
+        if response.status_code in THROTTLE_STATUSES:
+            return response.status_code, False
+        if response.status_code == 304 and record and not record['error']:
+            self.store(url, 304)
+            return record['status'], False
+        self.store(url, response.status_code, response.headers)
+        return response.status_code, False
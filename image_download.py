@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+流式图片下载
+响应按块直接写入目标文件旁的临时文件，写完后原子替换为目标文件，内存占用与图片大小无关：
+1. Content-Length 超过上限时不读取响应体，读取过程中超过上限立即中止
+2. 只看前几KB：Content-Type 和文件头（魔数）都不像图片时立即中止，不再下载整个响应
+3. 边下载边计算 SHA-256
+4. 可续传：内容写入部分文件，清单记录已接收的字节数和校验信息（ETag / Last-Modified），
+   连接中断或程序退出后，下次用 Range 请求从断点继续
+"""
+
+import os
+import re
+import json
+import time
+import uuid
+import shutil
+import hashlib
+
+DEFAULT_MAX_BYTES = 50 * 1024 * 1024  # 单张图片大小上限
+SNIFF_BYTES = 4096  # 用于判断文件类型的开头字节数
+CHUNK_SIZE = 64 * 1024
+MANIFEST_INTERVAL = 1024 * 1024  # 每接收这么多字节更新一次续传清单
+
+# 文件头 -> 图片类型
+MAGIC_SIGNATURES = [
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'\xff\xd8\xff', 'jpeg'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+    (b'BM', 'bmp'),
+    (b'\x00\x00\x01\x00', 'ico'),
+    (b'II*\x00', 'tiff'),
+    (b'MM\x00*', 'tiff'),
+]
+
+
+class DownloadError(Exception):
+    """响应不是可用的图片（过大、类型不符等）"""
+
+
+class IncompleteDownload(Exception):
+    """传输中断（连接断开、内容不完整），已接收的部分已保存，可以续传"""
+
+
+def parse_content_range(value):
+    """解析 Content-Range: bytes 起-止/总数，返回 (起始位置, 总大小)，总大小未知时为 None，格式不对时返回 (None, None)"""
+    match = re.fullmatch(r'bytes\s+(\d+)-(\d+)/(\d+|\*)', (value or '').strip())
+    if not match:
+        return None, None
+    return int(match.group(1)), None if match.group(3) == '*' else int(match.group(3))
+
+
+class PartialDownload:
+    """可续传的下载
+
+    已接收的内容保存在 part_path，清单（part_path + '.json'）记录URL、已接收字节数、总大小和校验信息。
+    只有服务器提供强 ETag 或 Last-Modified 时才续传，并用 If-Range 保证接上的是同一份内容，
+    内容变化时服务器返回完整响应，从头下载。
+    """
+
+    def __init__(self, part_path, url):
+        self.part_path = part_path
+        self.manifest_path = f"{part_path}.json"
+        self.url = url
+        self.manifest = self._load()
+
+    def _load(self):
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            size = os.path.getsize(self.part_path)
+        except (OSError, ValueError):
+            return {}
+        # 清单在写入内容之后更新，部分文件只会比清单记录的长
+        if manifest.get('url') != self.url or manifest.get('received', 0) > size:
+            return {}
+        return manifest
+
+    @property
+    def received(self):
+        return self.manifest.get('received', 0)
+
+    def validator(self):
+        """用于 If-Range 的校验信息，弱 ETag 不能用于续传"""
+        etag = self.manifest.get('etag')
+        if etag and not etag.startswith('W/'):
+            return etag
+        return self.manifest.get('last_modified')
+
+    def resume_headers(self):
+        """续传的请求头，没有可续传的内容时返回空字典"""
+        validator = self.validator()
+        if not self.received or not validator:
+            return {}
+        return {'Range': f'bytes={self.received}-', 'If-Range': validator}
+
+    def start(self, response):
+        """根据响应确定写入位置，返回 (已有字节数, 总大小或 None)
+
+        206 响应接着部分文件写入，其他响应从头开始并记录新的校验信息。
+        """
+        headers = response.headers
+        if response.status_code == 206:
+            start, total = parse_content_range(headers.get('content-range'))
+            if not self.received or start != self.received or (
+                    total and self.manifest.get('total') and total != self.manifest['total']):
+                self.discard()
+                raise IncompleteDownload(f"服务器返回的范围与已下载部分不一致: {headers.get('content-range')}")
+            return start, total or self.manifest.get('total')
+        length = headers.get('content-length')
+        self.manifest = {
+            'url': self.url,
+            'etag': headers.get('etag'),
+            'last_modified': headers.get('last-modified'),
+            'total': int(length) if length and length.isdigit() else None,
+            'received': 0,
+        }
+        return 0, self.manifest['total']
+
+    def save(self, received):
+        """记录已接收的字节数（调用前部分文件已写入这些字节）"""
+        self.manifest['received'] = received
+        self.manifest['updated'] = time.time()
+        with open(self.manifest_path, 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f, ensure_ascii=False)
+
+    def finish(self):
+        """下载完成后删除清单"""
+        self.manifest = {}
+        try:
+            os.remove(self.manifest_path)
+        except FileNotFoundError:
+            pass
+
+    def discard(self):
+        """丢弃部分内容和清单"""
+        self.finish()
+        try:
+            os.remove(self.part_path)
+        except FileNotFoundError:
+            pass
+
+
+def sniff_image_type(head):
+    """根据文件开头的字节判断图片类型，无法识别时返回 None"""
+    for signature, kind in MAGIC_SIGNATURES:
+        if head.startswith(signature):
+            return kind
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'webp'
+    if head[4:8] == b'ftyp' and head[8:12] in (b'avif', b'avis', b'heic', b'heix', b'mif1'):
+        return 'avif' if head[8:11] == b'avi' else 'heic'
+    text = head.lstrip(b'\xef\xbb\xbf \t\r\n').lower()
+    if text.startswith(b'<svg') or (text.startswith(b'<?xml') and b'<svg' in text):
+        return 'svg'
+    return None
+
+
+def check_image_head(head, content_type):
+    """根据文件头和 Content-Type 判断响应是否为图片，返回图片类型，不是图片时抛出 DownloadError"""
+    kind = sniff_image_type(head)
+    if kind:
+        return kind
+    if content_type.startswith('image/'):
+        # 服务器声明是图片，但文件头无法识别（少见的格式），仍然接受
+        return content_type.split('/', 1)[1]
+    raise DownloadError(f"响应不是图片内容: {content_type or '未知类型'}")
+
+
+def stream_to_file(response, local_path, max_bytes=DEFAULT_MAX_BYTES, sniff_bytes=SNIFF_BYTES, partial=None):
+    """把 requests 的流式响应（stream=True）写入 local_path
+
+    返回 {'size', 'sha256', 'content_type', 'kind'}；不是图片或超过大小上限时抛出 DownloadError，
+    目标文件保持不变。
+    partial: PartialDownload，给出时内容写入部分文件，206 响应接着已接收的部分写入；
+    传输中断时保留已接收的内容并抛出 IncompleteDownload。
+    """
+    content_type = response.headers.get('content-type', '').split(';')[0].strip().lower()
+    try:
+        if partial is not None:
+            offset, total = partial.start(response)
+        else:
+            content_length = response.headers.get('content-length')
+            offset, total = 0, int(content_length) if content_length and content_length.isdigit() else None
+        if max_bytes and total and total > max_bytes:
+            raise DownloadError(f"图片过大: {total} 字节（上限 {max_bytes} 字节）")
+    except BaseException:
+        response.close()
+        if partial is not None:
+            partial.discard()
+        raise
+
+    digest = hashlib.sha256()
+    head = b''
+    kind = None
+    size = offset
+    saved = offset
+    temp_path = partial.part_path if partial is not None else f"{local_path}.{uuid.uuid4().hex[:8]}.tmp"
+    try:
+        with open(temp_path, 'r+b' if offset else 'wb') as f:
+            if offset:
+                # 续传：已接收的部分计入哈希和文件头，清单之后多写的字节丢弃
+                f.truncate(offset)
+                for block in iter(lambda: f.read(CHUNK_SIZE), b''):
+                    digest.update(block)
+                    if len(head) < sniff_bytes:
+                        head += block[:sniff_bytes - len(head)]
+                if len(head) >= sniff_bytes:
+                    kind = check_image_head(head, content_type)
+            for chunk in response.iter_content(CHUNK_SIZE):
+                if not chunk:
+                    continue
+                if kind is None and len(head) < sniff_bytes:
+                    head += chunk[:sniff_bytes - len(head)]
+                    if len(head) >= sniff_bytes:
+                        kind = check_image_head(head, content_type)
+                size += len(chunk)
+                if max_bytes and size > max_bytes:
+                    raise DownloadError(f"图片过大: 超过 {max_bytes} 字节")
+                digest.update(chunk)
+                f.write(chunk)
+                if partial is not None and size - saved >= MANIFEST_INTERVAL:
+                    f.flush()
+                    partial.save(size)
+                    saved = size
+            if total and size < total:
+                raise IncompleteDownload(f"连接提前结束: 已接收 {size} / {total} 字节")
+        if kind is None:
+            # 响应比判断所需的字节数还短
+            if not head:
+                raise DownloadError("响应内容为空")
+            kind = check_image_head(head, content_type)
+        os.replace(temp_path, local_path)
+        if partial is not None:
+            partial.finish()
+    except DownloadError:
+        if partial is not None:
+            partial.discard()
+        else:
+            _remove(temp_path)
+        raise
+    except BaseException as e:
+        if partial is None:
+            _remove(temp_path)
+            raise
+        # 保留已接收的部分，下次续传
+        partial.save(size)
+        if isinstance(e, Exception) and not isinstance(e, IncompleteDownload):
+            raise IncompleteDownload(f"传输中断（已接收 {size} 字节）: {e}") from e
+        raise
+    finally:
+        response.close()
+
+    return {'size': size, 'sha256': digest.hexdigest(), 'content_type': content_type, 'kind': kind}
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def copy_file(source, local_path):
+    """复制已有的图片到 local_path（先写临时文件再替换）"""
+    temp_path = f"{local_path}.{uuid.uuid4().hex[:8]}.tmp"
+    try:
+        shutil.copyfile(source, temp_path)
+        os.replace(temp_path, local_path)
+    except BaseException:
+        _remove(temp_path)
+        raise
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+图片引用分词器
+单次扫描文档，按出现顺序产出图片引用记录：
+- Markdown图片 ![alt](path)
+- HTML图片 <img src="path">
+围栏代码块（``` 或 ~~~，按 CommonMark 规则识别）中的内容会被整体跳过。
+"""
+
+import re
+from typing import Iterator, NamedTuple
+
+# 所有语法合并为一个预编译正则，每个文档只需扫描一遍
+# 围栏代码块作为一个整体匹配，匹配到后直接跳过
+TOKEN_RE = re.compile(r'''
+    (?P<fence>^[ ]{0,3}                                       # 围栏开始行（最多缩进3个空格）
+        (?:(?P<tick>`{3,})[^`\n]*|(?P<tilde>~{3,})[^\n]*)\n   # 反引号围栏的信息字符串不能含反引号
+        (?s:.*?)                                              # 代码内容
+        (?:^[ ]{0,3}(?:(?P=tick)`*|(?P=tilde)~*)[ \t]*$|\Z))  # 同种字符、不短于开始行的结束行，或文档结尾
+    |
+    !\[(?P<alt>.*?)\]\((?P<md_path>.*?)\)                      # ![alt](path)
+    |
+    <img[^>]+src=["'](?P<html_path>[^"']+)["'][^>]*>           # <img src="path">
+''', re.IGNORECASE | re.MULTILINE | re.VERBOSE)
+
+ALT_ATTR_RE = re.compile(r'''\balt=["']([^"']*)["']''', re.IGNORECASE)
+REMOTE_RE = re.compile(r'https?://', re.IGNORECASE)
+
+MARKDOWN = 'markdown'
+HTML = 'html'
+
+
+class ImageRef(NamedTuple):
+    """一条图片引用记录（位置均为字符偏移）"""
+    kind: str        # MARKDOWN 或 HTML
+    path: str        # 去除首尾空白后的图片路径/URL
+    alt: str         # 替代文本
+    is_remote: bool  # 是否为远程图片
+    start: int       # 整个引用的起始位置
+    end: int         # 整个引用的结束位置
+    path_start: int  # 路径在文档中的起始位置
+    path_end: int    # 路径在文档中的结束位置
+
+
+def is_remote_path(path):
+    """判断图片路径是否为远程URL"""
+    return bool(REMOTE_RE.match(path))
+
+
+def iter_image_refs(content) -> Iterator[ImageRef]:
+    """按文档顺序产出图片引用，跳过围栏代码块和空路径"""
+    for match in TOKEN_RE.finditer(content):
+        if match.group('fence') is not None:
+            continue
+
+        if match.group('md_path') is not None:
+            kind = MARKDOWN
+            group = 'md_path'
+            alt = match.group('alt')
+        else:
+            kind = HTML
+            group = 'html_path'
+            alt_match = ALT_ATTR_RE.search(match.group(0))
+            alt = alt_match.group(1) if alt_match else ''
+
+        raw_path = match.group(group)
+        path = raw_path.strip()
+        if not path:
+            continue
+
+        # 路径位置取去除空白后的部分，便于精确替换
+        path_start = match.start(group) + (len(raw_path) - len(raw_path.lstrip()))
+        yield ImageRef(
+            kind=kind,
+            path=path,
+            alt=alt,
+            is_remote=is_remote_path(path),
+            start=match.start(),
+            end=match.end(),
+            path_start=path_start,
+            path_end=path_start + len(path),
+        )
+
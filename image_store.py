@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+图片库（按内容寻址）
+下载的图片统一保存在工作目录下的一个目录中，按内容的 SHA-256 命名和去重：
+1. 文件名为 "<哈希前16位><扩展名>"，与URL和下载顺序无关，同一内容总是得到同一个文件名
+2. 前缀相同但内容不同（极少见）时改用完整哈希，结果同样确定
+3. 内容相同的图片只保存一份，多个URL、多个笔记共用；笔记可以直接引用，也可以在笔记旁建立硬链接
+下载中的内容放在 .incoming 目录，未完成的下载按URL保存部分文件，下次运行时续传。
+"""
+
+import os
+import re
+import json
+import time
+import uuid
+import shutil
+import hashlib
+import threading
+from urllib.parse import urlparse, unquote
+from write_journal import file_sha256, atomic_write_bytes
+from image_download import sniff_image_type, SNIFF_BYTES
+
+INDEX_FILE = ".index.json"  # {sha256: 文件名}
+INCOMING_DIR = ".incoming"  # 下载中的临时文件
+HASH_LENGTHS = (16, 64)
+PARTIAL_MAX_AGE = 7 * 24 * 3600  # 超过这么久没有续传的部分文件清除
+
+# 文件头识别出的类型 -> 扩展名
+KIND_EXTENSIONS = {
+    'png': '.png', 'jpeg': '.jpg', 'gif': '.gif', 'bmp': '.bmp', 'ico': '.ico', 'tiff': '.tiff',
+    'webp': '.webp', 'avif': '.avif', 'heic': '.heic', 'svg': '.svg',
+}
+
+
+def url_extension(url):
+    """URL路径中的扩展名（小写），没有或不像扩展名时返回空字符串"""
+    ext = os.path.splitext(unquote(urlparse(url).path))[1].lower()
+    return ext if re.fullmatch(r'\.[a-z0-9]{1,5}', ext) else ''
+
+
+class ImageStore:
+    """工作目录级的图片库
+
+    root: 图片库目录
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.lock = threading.Lock()
+        self.index_path = os.path.join(root, INDEX_FILE)
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                self.index = json.load(f)
+        except (OSError, ValueError):
+            self.index = {}
+
+    def incoming_path(self):
+        """下载用的临时文件路径（与图片库在同一磁盘，完成后直接改名）"""
+        incoming = os.path.join(self.root, INCOMING_DIR)
+        os.makedirs(incoming, exist_ok=True)
+        return os.path.join(incoming, f"{uuid.uuid4().hex}.tmp")
+
+    def partial_path(self, url):
+        """URL的续传部分文件路径（同一URL每次都相同，中断后下次运行可以接着下载）"""
+        incoming = os.path.join(self.root, INCOMING_DIR)
+        os.makedirs(incoming, exist_ok=True)
+        return os.path.join(incoming, f"{hashlib.sha256(url.encode('utf-8')).hexdigest()[:32]}.part")
+
+    def prune_incoming(self, max_age=PARTIAL_MAX_AGE):
+        """清除长时间没有更新的临时文件和续传部分文件，返回清除的文件数"""
+        incoming = os.path.join(self.root, INCOMING_DIR)
+        try:
+            entries = list(os.scandir(incoming))
+        except FileNotFoundError:
+            return 0
+        removed = 0
+        cutoff = time.time() - max_age
+        for entry in entries:
+            try:
+                if entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+                    removed += 1
+            except OSError:
+                pass
+        return removed
+
+    def preview_path(self, url):
+        """下载前预估的保存位置（哈希未知，仅用于预览）"""
+        return os.path.join(self.root, f"<sha256>{url_extension(url) or '.img'}")
+
+    def add(self, temp_path, url):
+        """把下载好的临时文件放入图片库，返回图片库中的路径；内容已存在时删除临时文件并返回已有的文件
+
+        扩展名优先按文件头识别的类型确定，无法识别时使用URL中的扩展名。
+        """
+        sha256 = file_sha256(temp_path)
+        with open(temp_path, 'rb') as f:
+            kind = sniff_image_type(f.read(SNIFF_BYTES))
+        ext = KIND_EXTENSIONS.get(kind) or url_extension(url) or '.img'
+        with self.lock:
+            existing = self.index.get(sha256)
+            if existing and os.path.exists(os.path.join(self.root, existing)):
+                os.remove(temp_path)
+                return os.path.join(self.root, existing)
+
+            for length in HASH_LENGTHS:
+                name = f"{sha256[:length]}{ext}"
+                path = os.path.join(self.root, name)
+                if not os.path.exists(path):
+                    os.replace(temp_path, path)
+                    break
+                if file_sha256(path) == sha256:
+                    os.remove(temp_path)
+                    break
+            self.index[sha256] = name
+            atomic_write_bytes(self.index_path, json.dumps(self.index, ensure_ascii=False, indent=2).encode('utf-8'))
+            return path
+
+    def link(self, path, target_dir):
+        """在 target_dir 中建立图片的硬链接（不支持时复制），返回链接路径"""
+        os.makedirs(target_dir, exist_ok=True)
+        link_path = os.path.join(target_dir, os.path.basename(path))
+        if os.path.exists(link_path):
+            if os.path.samefile(link_path, path) or file_sha256(link_path) == file_sha256(path):
+                return link_path
+            raise FileExistsError(f"已存在不同内容的同名文件: {link_path}")
+        try:
+            os.link(path, link_path)
+        except OSError:
+            shutil.copyfile(path, link_path)
+        return link_path
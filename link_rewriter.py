@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+图片链接改写
+每个文档只分词一次，逐个引用查表决定替换目标，最后一次性拼接输出，
+只替换引用中的路径部分，替代文本和HTML属性保持原样。
+改写器给出替换位置（edits），由修改计划统一写入。
+"""
+
+import os
+import re
+import json
+import hashlib
+from typing import Callable, List, Optional
+from image_ref_tokenizer import ImageRef, iter_image_refs
+from change_plan import make_edits
+from markdown_scanner import resolve_ref_path
+
+
+def image_ref_edits(content, replace: Callable[[ImageRef], Optional[str]]) -> List[dict]:
+    """按 replace 的返回值计算文档中图片路径的修改记录
+
+    replace 对每个引用返回新路径，返回 None 表示不修改。
+    """
+    spans = []
+    for ref in iter_image_refs(content):
+        new_path = replace(ref)
+        if new_path is None or new_path == ref.path:
+            continue
+        spans.append((ref.path_start, ref.path_end, new_path))
+    return make_edits(content, spans)
+
+
+class RemoteRewriter:
+    """本地图片 → 远程URL
+
+    映射表按规范化的绝对路径建立字典，每个本地引用解析为绝对路径后直接查表。
+    """
+
+    def __init__(self, image_mapping):
+        self.remote_by_path = {resolve_ref_path('', local_path): remote_url
+                               for local_path, remote_url in image_mapping.items()}
+
+    def edits(self, content, md_file):
+        """返回修改记录"""
+        md_dir = os.path.dirname(md_file)
+
+        def to_remote(ref):
+            if ref.is_remote:
+                return None
+            return self.remote_by_path.get(resolve_ref_path(md_dir, ref.path))
+
+        return image_ref_edits(content, to_remote)
+
+
+class UrlMatcher:
+    """Aho-Corasick 多模式匹配
+
+    用所有URL建立一个自动机，一次线性扫描找出文档中全部URL出现的位置。
+    状态在根节点时用正则跳到下一个可能的起始字符，大段无关文本不逐字处理。
+    """
+
+    def __init__(self, patterns):
+        self.patterns = [p for p in dict.fromkeys(patterns) if p]
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [()]  # 每个状态结束的模式长度
+
+        for pattern in self.patterns:
+            state = 0
+            for char in pattern:
+                next_state = self.goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self.goto)
+                    self.goto[state][char] = next_state
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append(())
+                state = next_state
+            self.output[state] = (len(pattern),)
+
+        # 按层次计算失败链接，输出合并后缀状态的结果
+        queue = list(self.goto[0].values())
+        for state in queue:
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                target = self.goto[fallback].get(char, 0)
+                self.fail[next_state] = target if target != next_state else 0
+                self.output[next_state] = self.output[next_state] + self.output[self.fail[next_state]]
+
+        first_chars = ''.join(sorted(self.goto[0]))
+        self.start_re = re.compile('[' + re.escape(first_chars) + ']') if first_chars else None
+
+    def find_spans(self, text):
+        """返回所有匹配的位置集合 {(start, end)}"""
+        spans = set()
+        if self.start_re is None:
+            return spans
+
+        goto = self.goto
+        fail = self.fail
+        output = self.output
+        state = 0
+        i = 0
+        length = len(text)
+        while i < length:
+            if state == 0:
+                match = self.start_re.search(text, i)
+                if match is None:
+                    break
+                i = match.start()
+            char = text[i]
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            i += 1
+            for pattern_length in output[state]:
+                spans.add((i - pattern_length, i))
+        return spans
+
+
+class LocalRewriter:
+    """远程URL → 本地相对路径
+
+    自动机先找出文档中出现的映射URL，没有出现任何URL的文档不再分词；
+    只有整个图片路径恰好是某个URL时才替换，正文中的普通链接和代码块不受影响。
+    """
+
+    def __init__(self, image_mapping, relpath, aliases=None):
+        # aliases: {URL: 本地路径}，与映射表中的图片内容相同的其他URL
+        self.local_by_url = dict(aliases or {})
+        self.local_by_url.update((remote_url, local_path) for local_path, remote_url in image_mapping.items())
+        self.matcher = UrlMatcher(self.local_by_url)
+        self.relpath = relpath
+
+    def edits(self, content, md_file):
+        """返回修改记录"""
+        spans = self.matcher.find_spans(content)
+        if not spans:
+            return []
+        md_dir = os.path.dirname(md_file)
+
+        def to_local(ref):
+            if (ref.path_start, ref.path_end) not in spans:
+                return None
+            # 计算相对路径，处理跨驱动器情况
+            return self.relpath(self.local_by_url[ref.path], md_dir)
+
+        return image_ref_edits(content, to_local)
+
+
+def mapping_fingerprint(image_mapping):
+    """映射表内容的指纹（与进程无关），用于判断缓存的改写器是否仍然有效"""
+    data = json.dumps(sorted(image_mapping.items()), ensure_ascii=False)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+日志队列
+工作线程只把日志放进线程安全的队列，界面线程定时批量取出显示，
+工作线程不再等待界面刷新。同时把日志以JSON行的形式写入滚动日志文件，
+文件写入由独立的后台线程完成。
+"""
+
+import json
+import queue
+import logging
+import datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+ERROR_MARKERS = ('❌', '失败', '出错')
+
+
+class JsonLineFormatter(logging.Formatter):
+    """每条日志输出为一行JSON"""
+
+    def format(self, record):
+        return json.dumps({
+            'time': datetime.datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'thread': record.threadName,
+            'message': record.getMessage(),
+        }, ensure_ascii=False)
+
+
+class LogSink:
+    """线程安全的日志队列
+
+    log_file: 日志文件路径，为空时不写文件
+    max_bytes / backup_count: 日志文件达到 max_bytes 后滚动，保留 backup_count 个旧文件
+    """
+
+    def __init__(self, log_file=None, max_bytes=1024 * 1024, backup_count=3):
+        self.queue = queue.SimpleQueue()
+        self.logger = None
+        self.listener = None
+        self.file_handler = None
+        if log_file:
+            try:
+                self._open_log_file(log_file, max_bytes, backup_count)
+            except OSError:
+                # 日志文件不可写时只在界面显示
+                self.logger = None
+
+    def _open_log_file(self, log_file, max_bytes, backup_count):
+        handler = RotatingFileHandler(log_file, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8')
+        handler.setFormatter(JsonLineFormatter())
+        self.file_handler = handler
+        file_queue = queue.SimpleQueue()
+        self.listener = QueueListener(file_queue, handler)
+        self.listener.start()
+
+        self.logger = logging.getLogger(f'{__name__}.{id(self)}')
+        self.logger.setLevel(logging.INFO)
+        self.logger.propagate = False
+        self.logger.addHandler(QueueHandler(file_queue))
+
+    def emit(self, message):
+        """登记一条日志（任意线程中都可以调用）"""
+        message = str(message)
+        self.queue.put(message)
+        if self.logger:
+            level = logging.ERROR if any(marker in message for marker in ERROR_MARKERS) else logging.INFO
+            self.logger.log(level, message)
+
+    def drain(self, limit=None):
+        """取出队列中的日志，最多 limit 条"""
+        messages = []
+        while limit is None or len(messages) < limit:
+            try:
+                messages.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return messages
+
+    def close(self):
+        """停止文件写入线程，写完剩余的日志"""
+        if self.listener:
+            self.listener.stop()
+            self.listener = None
+        if self.file_handler:
+            self.file_handler.close()
+            self.file_handler = None
+        if self.logger:
+            for handler in list(self.logger.handlers):
+                self.logger.removeHandler(handler)
+            self.logger = None
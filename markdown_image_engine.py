@@ -0,0 +1,2226 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Markdown图片管家 - 核心引擎
+不依赖界面，扫描、上传、替换、下载、删除、检查、修复等操作都在这里完成，
+每个操作同步执行并返回结果摘要，可以在脚本、定时任务或CI中直接调用。
+图形界面（markdown_image_manager.py）只负责交互和显示。
+
+命令行用法:
+    python markdown_image_engine.py scan <工作目录> [--json]
+    python markdown_image_engine.py replace-remote <工作目录> --mapping image_mapping.json
+    python markdown_image_engine.py smart-fix <工作目录> --dry-run
+"""
+
+import os
+import re
+import sys
+import json
+import shutil
+import argparse
+import hashlib
+import datetime
+import threading
+import requests
+from pathlib import Path
+from urllib.parse import urlparse, unquote
+from typing import Dict, List, Set, Tuple
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+from image_ref_tokenizer import iter_image_refs, is_remote_path
+from reference_store import ReferenceStore
+from link_rewriter import RemoteRewriter, LocalRewriter, mapping_fingerprint
+from download_scheduler import DownloadScheduler, is_connection_failure
+from piclist_uploader import PicListUploader, DEFAULT_ENDPOINT, DEFAULT_BATCH_SIZE
+from rate_limiter import RateLimiter, RequestDeferred, THROTTLE_STATUSES, url_host, DEFAULT_RATE
+from image_download import stream_to_file, copy_file, DownloadError, IncompleteDownload, PartialDownload, DEFAULT_MAX_BYTES
+from image_store import ImageStore
+from http_cache import HttpCache, DEFAULT_TTL, OK_STATUSES
+from change_plan import ChangePlan, FileChange, read_text, make_edits, diff_edits, apply_edits
+from write_journal import WriteJournal, find_journals, recover_journals, prune_journals, file_sha256, COMMITTED, DEFAULT_KEEP
+from markdown_scanner import (ScanCache, ReferenceIndex, normalize_path, DEFAULT_IGNORE_PATTERNS, walk_workspace,
+                              extract_refs_parallel, read_file_refs, resolve_ref_path, is_ignored_path)
+
+
+class EngineError(Exception):
+    """操作无法执行（前置条件不满足等），消息可直接展示给用户"""
+
+
+class MarkdownImageEngine:
+    """Markdown图片管理引擎
+
+    workspace_path: 工作目录
+    log: 日志回调，参数为一条日志文本（可能在工作线程中调用）
+    """
+
+    def __init__(self, workspace_path="", log=None):
+        self.log = log or (lambda message: None)
+        
+        # 数据存储
+        self.workspace_path = workspace_path
+        self.md_files = []
+        self.image_files = []
+        self.image_references = {}  # {md_file: [image_paths]}
+        self.unused_images = []
+        self.invalid_images = {}  # {md_file: [invalid_image_paths]}
+        self.image_mapping = {}  # {local_path: remote_url}
+        self.url_aliases = {}  # {remote_url: local_path}，内容与映射表中已有图片相同的其他URL（共用同一文件）
+        self.mapping_file = "image_mapping.json"
+        self.scan_cache_file = ".markdown_image_cache.json"  # 增量扫描缓存（保存在工作目录）
+        self.refs_db_file = ".markdown_image_refs.db"  # 引用关系库（保存在工作目录）
+        self.http_cache_file = ".markdown_image_http.db"  # HTTP元数据缓存（保存在工作目录）
+        self.http_cache_ttl = DEFAULT_TTL  # HTTP元数据缓存的有效期（秒）
+        self.scan_workers = 0  # 并行解析进程数，0 表示使用CPU核心数
+        self.io_workers = 8  # 并行读写MD文件的线程数
+        self.ignore_patterns = list(DEFAULT_IGNORE_PATTERNS)  # 扫描时跳过的目录（glob规则）
+        
+        # 统计数据
+        self.referenced_local_images = []  # 被引用的本地图片
+        self.remote_images = []  # 远程图片列表
+        self.last_scan_stat_calls = 0  # 最近一次扫描的文件状态查询次数
+        self.last_scan_cache_stats = {'parsed': 0, 'cached': 0}  # 最近一次扫描重新解析/复用缓存的文件数
+        self.reference_index = None  # 最近一次扫描建立的引用索引
+        self.reference_store = None  # 当前工作目录的引用关系库
+        self.http_cache = None  # 当前工作目录的HTTP元数据缓存
+        self.local_rewriter = None  # 缓存的 远程URL→本地路径 改写器
+        self.local_rewriter_key = None  # 建立改写器时映射表的指纹
+        self.download_workers = 16  # 同时下载的图片数
+        self.download_per_host = 4  # 每个主机的同时连接数（下载和链接检查）
+        self.check_workers = 32  # 链接检查的同时请求数
+        self.check_timeout = 10  # 检查单个链接的超时时间（秒）
+        self.piclist_endpoint = DEFAULT_ENDPOINT  # PicList HTTP上传服务地址
+        self.piclist_key = ""  # PicList 上传密钥（没有设置时留空）
+        self.upload_batch_size = DEFAULT_BATCH_SIZE  # 每次请求上传的图片数
+        self.host_rate = DEFAULT_RATE  # 每个主机每秒最多请求数，0 表示不限制（Gitee 另有更低的默认值）
+        self.rate_limiter = None  # 所有网络请求共用的按主机限流器
+        self.max_image_bytes = DEFAULT_MAX_BYTES  # 单张图片大小上限，超过时中止下载
+        self.download_retries = 3  # 暂时性错误（超时、连接中断、5xx）的重试次数，中断的下载从断点续传
+        self.retry_backoff = 1.0  # 第一次重试前的等待时间（秒），之后每次加倍
+        self.retry_backoff_max = 30.0  # 重试等待时间上限（秒）
+        self.image_store_dir = "assets"  # 下载图片的图片库（工作目录下，按内容去重）
+        self.download_layout = 'shared'  # shared: 链接直接指向图片库；hardlink: 在MD文件旁的 images 目录建立硬链接
+        self.image_store = None  # 当前工作目录的图片库
+        self.active_journals = set()  # 进行中的写入日志目录
+        self.journal_keep = DEFAULT_KEEP  # 保留的写入日志数（可回滚的操作数）
+        self.plans = {}  # 操作名称 -> 最近生成的修改计划
+        
+        # 支持的图片格式
+        self.image_extensions = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp', '.svg'}
+    
+    def set_workspace(self, workspace_path):
+        """切换工作目录，清空上一个目录的分析结果"""
+        self.close()
+        self.workspace_path = workspace_path
+        self.reference_index = None
+        self.md_files = []
+        self.image_files = []
+        self.image_references = {}
+        self.unused_images = []
+        self.invalid_images = {}
+        self.referenced_local_images = []
+        self.remote_images = []
+    
+    def normalize_path(self, path):
+        """统一路径分隔符，确保跨平台兼容性"""
+        return normalize_path(path)
+    
+    def mapping_path(self):
+        """映射表文件的路径：相对路径相对于工作目录（而不是当前目录），绝对路径保持不变"""
+        return os.path.join(self.workspace_path, self.mapping_file)
+    
+    def migrate_image_mapping(self):
+        """迁移现有图片映射表，修复路径分隔符问题"""
+        
+        mapping_file = self.mapping_path()
+        
+        if not os.path.exists(mapping_file):
+            return True
+        
+        try:
+            # 读取现有映射
+            with open(mapping_file, 'r', encoding='utf-8') as f:
+                original_mapping = json.load(f)
+            
+            if not original_mapping:
+                return True
+            
+            # 分析是否需要迁移
+            needs_migration = False
+            problematic_count = 0
+            
+            for local_path in original_mapping.keys():
+                if '\\' in local_path and '/' in local_path:
+                    needs_migration = True
+                    problematic_count += 1
+            
+            if not needs_migration:
+                return True
+            
+            # 创建备份
+            timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+            backup_file = f"{mapping_file}.backup_{timestamp}"
+            shutil.copy2(mapping_file, backup_file)
+            
+            # 执行迁移
+            new_mapping = {}
+            normalized_count = 0
+            
+            for local_path, remote_url in original_mapping.items():
+                normalized_path = self.normalize_path(local_path)
+                
+                if normalized_path != local_path:
+                    normalized_count += 1
+                
+                # 处理重复项（保留第一个）
+                if normalized_path not in new_mapping:
+                    new_mapping[normalized_path] = remote_url
+            
+            # 保存新映射
+            with open(mapping_file, 'w', encoding='utf-8') as f:
+                json.dump(new_mapping, f, ensure_ascii=False, indent=2)
+            
+            if normalized_count > 0:
+                self.log(f"✅ 映射表迁移完成: 规范化了 {normalized_count} 个路径")
+            
+            return True
+            
+        except Exception as e:
+            self.log(f"❌ 映射表迁移失败: {e}")
+            return False
+    
+    @staticmethod
+    def alias_file_path(mapping_file):
+        """URL别名表保存在映射表旁：image_mapping.json -> image_mapping.aliases.json"""
+        return f"{os.path.splitext(mapping_file)[0]}.aliases.json"
+    
+    def load_url_aliases(self, mapping_file=None):
+        """加载映射表对应的URL别名表（mapping_file 为空时使用 mapping_path()）"""
+        mapping_file = mapping_file or self.mapping_path()
+        try:
+            with open(self.alias_file_path(mapping_file), 'r', encoding='utf-8') as f:
+                self.url_aliases = {url: self.normalize_path(path) for url, path in json.load(f).items()}
+        except FileNotFoundError:
+            self.url_aliases = {}
+        except Exception as e:
+            self.log(f"加载URL别名表失败: {e}")
+            self.url_aliases = {}
+    
+    def save_url_aliases(self, mapping_file=None):
+        """保存URL别名表，没有别名时删除文件（mapping_file 为空时使用 mapping_path()）"""
+        alias_file = self.alias_file_path(mapping_file or self.mapping_path())
+        try:
+            if self.url_aliases:
+                with open(alias_file, 'w', encoding='utf-8') as f:
+                    json.dump(self.url_aliases, f, ensure_ascii=False, indent=2)
+            elif os.path.exists(alias_file):
+                os.remove(alias_file)
+        except Exception as e:
+            self.log(f"保存URL别名表失败: {e}")
+    
+    def record_mapping(self, local_path, remote_url):
+        """记录本地图片与URL的对应关系
+
+        多个URL下载到同一个文件（内容相同）时，映射表保留第一个URL，其他URL记入别名表，
+        每个URL都能找到对应的本地文件。
+        """
+        current = self.image_mapping.get(local_path)
+        if current is None or current == remote_url:
+            self.image_mapping[local_path] = remote_url
+            self.url_aliases.pop(remote_url, None)
+        else:
+            self.url_aliases[remote_url] = local_path
+    
+    def url_to_local(self):
+        """{URL: 本地路径}，包括映射表和别名表中的所有URL"""
+        local_by_url = dict(self.url_aliases)
+        local_by_url.update((remote_url, local_path) for local_path, remote_url in self.image_mapping.items())
+        return local_by_url
+    
+    def load_image_mapping_with_migration(self):
+        """加载图片映射表，如果需要则自动迁移"""
+        
+        # 先尝试迁移
+        self.migrate_image_mapping()
+        
+        # 然后加载映射表
+        mapping_file = self.mapping_path()
+        
+        if os.path.exists(mapping_file):
+            try:
+                with open(mapping_file, 'r', encoding='utf-8') as f:
+                    self.image_mapping = json.load(f)
+                
+                # 确保所有路径都是规范化的
+                normalized_mapping = {}
+                for local_path, remote_url in self.image_mapping.items():
+                    normalized_path = self.normalize_path(local_path)
+                    normalized_mapping[normalized_path] = remote_url
+                
+                self.image_mapping = normalized_mapping
+                
+            except Exception as e:
+                self.log(f"❌ 加载映射表失败: {e}")
+                self.image_mapping = {}
+        else:
+            self.image_mapping = {}
+        self.load_url_aliases(mapping_file)
+    
+    def save_image_mapping_normalized(self):
+        """保存图片映射表，确保所有路径都是规范化的"""
+        
+        if not self.image_mapping:
+            return
+        
+        # 规范化所有路径
+        normalized_mapping = {}
+        for local_path, remote_url in self.image_mapping.items():
+            normalized_path = self.normalize_path(local_path)
+            normalized_mapping[normalized_path] = remote_url
+        
+        mapping_file = self.mapping_path()
+        
+        try:
+            with open(mapping_file, 'w', encoding='utf-8') as f:
+                json.dump(normalized_mapping, f, ensure_ascii=False, indent=2)
+            
+            # 更新内存中的映射
+            self.image_mapping = normalized_mapping
+            self.save_url_aliases(mapping_file)
+            
+        except Exception as e:
+            self.log(f"❌ 保存映射表失败: {e}")
+    
+    def safe_relpath(self, path, start):
+        """安全的相对路径计算，处理跨驱动器情况"""
+        try:
+            # 先规范化输入路径
+            path = self.normalize_path(path)
+            start = self.normalize_path(start)
+            
+            rel_path = os.path.relpath(path, start)
+            return self.normalize_path(rel_path)
+        except ValueError:
+            # 跨驱动器情况，返回规范化的绝对路径
+            return self.normalize_path(path)
+    
+    def download_image_with_retry(self, url, local_path, max_retries=None, log=None, session=None, cached_copy=None, partial=None):
+        """图片下载，失败后按指数退避重试（log 为空时使用引擎日志）
+
+        返回 True 成功、False 失败、None 被服务器限流而推迟（429/503 或 Retry-After 等待过长）
+
+        max_retries: 第一次失败后的重试次数，为空时使用 download_retries；
+                     只有超时、连接中断、5xx 等暂时性错误才重试，404、内容不是图片等直接失败
+        session: 复用的 requests.Session（按主机共用连接池），为空时新建
+        cached_copy: 之前下载过的同一图片，有缓存记录时发送条件请求，服务器返回 304 时直接复制
+        partial: PartialDownload，给出时已接收的内容在中断后保留，重试和下次运行时用 Range 请求续传
+        """
+        import time
+        import random
+        log = log or self.log
+        if max_retries is None:
+            max_retries = self.download_retries
+        
+        # 不同的请求头配置
+        headers_list = [
+            {
+                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+                'Referer': 'https://gitee.com/',
+                'Accept': 'image/webp,image/apng,image/*,*/*;q=0.8',
+                'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
+                'Cache-Control': 'no-cache',
+            },
+            {
+                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:89.0) Gecko/20100101 Firefox/89.0',
+                'Accept': 'image/webp,*/*',
+                'Accept-Language': 'zh-CN,zh;q=0.8,zh-TW;q=0.7,zh-HK;q=0.5,en-US;q=0.3,en;q=0.2',
+            },
+            {
+                'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/14.1.1 Safari/605.1.15',
+            }
+        ]
+        
+        # 处理Gitee URL的特殊情况
+        original_url = url
+        if 'gitee.com' in url and '//img/' in url:
+            # 修复双斜杠问题
+            url = url.replace('//img/', '/img/')
+            log(f"    修复Gitee URL: {url}")
+        
+        cache = self.http_cache
+        record = cache.get(original_url) if cache and cached_copy else None
+        
+        def store_ok(response, info):
+            # 206 响应的 Content-Length 只是剩余部分，记录完整大小
+            if cache:
+                headers = {'etag': response.headers.get('etag'), 'last-modified': response.headers.get('last-modified'),
+                           'content-length': str(info['size'])}
+                cache.store(original_url, 200, headers, sha256=info['sha256'])
+        
+        throttled = False  # 上一次失败是否因为服务器限流（由限流器按 Retry-After 等待，不再另外退避）
+        for attempt in range(max_retries + 1):
+            if attempt and not throttled:
+                # 指数退避，加随机抖动避免同时重试
+                delay = min(self.retry_backoff_max, self.retry_backoff * 2 ** (attempt - 1)) * random.uniform(0.5, 1)
+                log(f"    {delay:.1f} 秒后重试（第 {attempt}/{max_retries} 次）")
+                time.sleep(delay)
+            throttled = False
+            try:
+                headers = dict(headers_list[attempt % len(headers_list)])
+                headers.update(HttpCache.conditional_headers(record))
+                if partial is not None:
+                    resume = partial.resume_headers()
+                    if resume:
+                        headers.update(resume)
+                        log(f"    从 {partial.received} 字节处续传")
+                
+                # 没有传入共用的session时新建一个
+                if session is None:
+                    session = requests.Session()
+                
+                log(f"    下载: {os.path.basename(urlparse(url).path) or url}")
+                
+                # 流式下载：边下载边写入临时文件，前几KB不像图片时立即中止
+                response = session.get(url, headers=headers, timeout=30, allow_redirects=True, stream=True)
+                
+                # 检查响应状态
+                if response.status_code == 304 and record:
+                    response.close()
+                    copy_file(cached_copy, local_path)
+                    cache.store(original_url, 304)
+                    if partial is not None:
+                        partial.discard()
+                    log(f"    内容未变化，使用已下载的副本")
+                    return True
+                elif response.status_code in (200, 206):
+                    info = stream_to_file(response, local_path, self.max_image_bytes, partial=partial)
+                    store_ok(response, info)
+                    return True
+                elif response.status_code == 416 and partial is not None:
+                    # 已接收的部分与服务器上的内容对不上，从头下载
+                    response.close()
+                    partial.discard()
+                    log(f"    续传范围无效，重新下载")
+                    continue
+                elif response.status_code == 403:
+                    response.close()
+                    log(f"    403 Forbidden - 尝试其他方法")
+                    # 对于403错误，尝试不同的URL格式
+                    if 'gitee.com' in url and attempt == 0:
+                        # 尝试去掉raw参数
+                        alt_url = url.replace('/raw/master/', '/master/')
+                        try:
+                            alt_response = session.get(alt_url, headers=headers_list[0], timeout=30, stream=True)
+                            if alt_response.status_code == 200:
+                                info = stream_to_file(alt_response, local_path, self.max_image_bytes)
+                                store_ok(alt_response, info)
+                                return True
+                            alt_response.close()
+                        except:
+                            pass
+                    return False
+                elif response.status_code in THROTTLE_STATUSES:
+                    # 被限流：限流器已记录 Retry-After，下一次请求前自动等待
+                    response.close()
+                    log(f"    HTTP {response.status_code}: 服务器限流")
+                    throttled = True
+                else:
+                    response.close()
+                    log(f"    HTTP {response.status_code}: {response.reason}")
+                    if cache:
+                        cache.store(original_url, response.status_code, response.headers)
+                    if response.status_code < 500:
+                        return False
+                
+            except RequestDeferred as e:
+                log(f"    {e}，推迟下载")
+                return None
+            except DownloadError as e:
+                log(f"    {e}")
+                return False
+            except IncompleteDownload as e:
+                log(f"    {e}")
+            except requests.exceptions.Timeout:
+                log(f"    下载超时")
+            except requests.exceptions.ConnectionError:
+                log(f"    连接错误")
+            except Exception as e:
+                log(f"    下载错误: {str(e)}")
+                return False
+        
+        return None if throttled else False
+    
+    def load_mapping(self):
+        """加载图片映射表"""
+        mapping_file = self.mapping_path()
+        try:
+            if os.path.exists(mapping_file):
+                with open(mapping_file, 'r', encoding='utf-8') as f:
+                    self.image_mapping = json.load(f)
+                self.log(f"加载映射表: {len(self.image_mapping)} 条记录")
+        except Exception as e:
+            self.log(f"加载映射表失败: {e}")
+        self.load_url_aliases(mapping_file)
+    
+    def save_mapping(self):
+        """保存图片映射表"""
+        mapping_file = self.mapping_path()
+        try:
+            with open(mapping_file, 'w', encoding='utf-8') as f:
+                json.dump(self.image_mapping, f, ensure_ascii=False, indent=2)
+            self.log(f"保存映射表: {len(self.image_mapping)} 条记录")
+        except Exception as e:
+            self.log(f"保存映射表失败: {e}")
+        self.save_url_aliases(mapping_file)
+    
+    def summary(self):
+        """当前分析结果的统计信息"""
+        return {
+            'workspace': self.workspace_path,
+            'md_files': len(self.md_files),
+            'image_files': len(self.image_files),
+            'referenced_local_images': len(self.referenced_local_images),
+            'remote_images': len(self.remote_images),
+            'unused_images': len(self.unused_images),
+            'invalid_references': sum(len(imgs) for imgs in self.invalid_images.values()),
+            'mapping_records': len(self.image_mapping),
+            'stat_calls': self.last_scan_stat_calls,
+            'parsed_files': self.last_scan_cache_stats['parsed'],
+            'cached_files': self.last_scan_cache_stats['cached'],
+        }
+    
+    def sync_reference_store(self):
+        """把引用索引的最新状态写入引用关系库"""
+        if self.reference_store and self.reference_index:
+            try:
+                self.reference_store.sync_from_index(self.reference_index)
+            except Exception as e:
+                self.log(f"更新引用关系库失败: {e}")
+    
+    def scan(self):
+        """扫描分析MD文件和图片"""
+        if not self.workspace_path:
+            raise EngineError("请先选择工作目录")
+        
+        self.log("开始扫描文件...")
+        self.recover_interrupted_writes()
+        
+        # 扫描MD文件
+        self.md_files = []
+        self.image_files = []
+        self.image_references = {}
+        self.invalid_images = {}
+        self.referenced_local_images = []
+        self.remote_images = []
+        
+        # 根目录规范化一次，子路径由遍历器直接拼接
+        root_path = self.normalize_path(os.path.normpath(self.workspace_path))
+        walk = walk_workspace(root_path, self.image_extensions, self.ignore_patterns)
+        self.md_files = walk.md_files
+        self.image_files = walk.image_files
+        md_stats = walk.md_stats
+        
+        self.log(f"找到 {len(self.md_files)} 个MD文件")
+        self.log(f"找到 {len(self.image_files)} 个图片文件")
+        
+        # 显示图片文件的一些示例路径
+        if self.image_files:
+            self.log("本地图片文件示例:")
+            for i, img in enumerate(self.image_files[:3]):
+                rel_path = self.safe_relpath(img, self.workspace_path)
+                self.log(f"  {i+1}. {rel_path}")
+            if len(self.image_files) > 3:
+                self.log(f"  ... 还有 {len(self.image_files) - 3} 个文件")
+        
+        # 分析图片引用（使用增量扫描缓存，只重新解析有变化的文件）
+        scan_cache = ScanCache(os.path.join(self.workspace_path, self.scan_cache_file))
+        scan_cache.load()
+        
+        file_refs = {}
+        pending_files = []
+        for md_file in self.md_files:
+            refs = scan_cache.get(md_file, md_stats[md_file])
+            if refs is None:
+                pending_files.append(md_file)
+            else:
+                file_refs[md_file] = refs
+        
+        # 有变化的文件交给进程池并行解析
+        if pending_files:
+            results = extract_refs_parallel(pending_files, self.scan_workers, log=self.log)
+            for md_file, (_, refs, error) in zip(pending_files, results):
+                if error:
+                    self.log(f"分析文件 {md_file} 时出错: {error}")
+                    continue
+                # 缓存键使用遍历时取得的文件状态（早于读取内容）
+                scan_cache.put(md_file, md_stats[md_file], refs)
+                file_refs[md_file] = refs
+        
+        # 建立引用索引（按MD文件顺序合并结果，保证输出顺序确定）
+        # 本地引用通过存在性索引判断，不再逐个访问文件系统
+        reference_index = ReferenceIndex(root_path, self.image_extensions, self.ignore_patterns)
+        reference_index.build(walk, file_refs)
+        self.reference_index = reference_index
+        self.apply_reference_index()
+        
+        # 写入引用关系库（只更新有变化的文件）
+        store = self.open_reference_store()
+        if store:
+            try:
+                changed = store.sync_from_index(reference_index)
+                self.log(f"引用关系库已更新: {changed} 个文件有变化")
+            except Exception as e:
+                self.log(f"更新引用关系库失败: {e}")
+        
+        # 更新扫描缓存
+        scan_cache.prune(self.md_files)
+        try:
+            scan_cache.save()
+        except Exception as e:
+            self.log(f"保存扫描缓存失败: {e}")
+        self.log(f"增量扫描: 重新解析 {scan_cache.misses} 个文件，复用缓存 {scan_cache.hits} 个")
+        self.last_scan_stat_calls = walk.stat_calls + reference_index.stat_calls
+        self.log(f"文件状态查询: {self.last_scan_stat_calls} 次"
+                 f"（遍历 {walk.stat_calls} 次，引用检查 {reference_index.stat_calls} 次）")
+        
+        self.log("扫描完成!")
+        self.last_scan_cache_stats = {'parsed': scan_cache.misses, 'cached': scan_cache.hits}
+        return self.summary()
+    
+    def close(self):
+        """关闭引用关系库和HTTP元数据缓存"""
+        if self.reference_store:
+            self.reference_store.close()
+            self.reference_store = None
+        if self.http_cache:
+            self.http_cache.close()
+            self.http_cache = None
+    
+    def open_http_cache(self):
+        """打开当前工作目录的HTTP元数据缓存，失败时返回 None"""
+        db_path = os.path.join(self.workspace_path, self.http_cache_file)
+        if self.http_cache and self.http_cache.db_path == db_path:
+            self.http_cache.ttl = self.http_cache_ttl
+            return self.http_cache
+        if self.http_cache:
+            self.http_cache.close()
+            self.http_cache = None
+        try:
+            self.http_cache = HttpCache(db_path, self.http_cache_ttl)
+        except Exception as e:
+            self.log(f"打开HTTP缓存失败: {e}")
+        return self.http_cache
+    
+    def get_rate_limiter(self):
+        """所有网络请求共用的按主机限流器，限流状态（Retry-After、降低的并发）在多次操作之间保留"""
+        if self.rate_limiter is None:
+            self.rate_limiter = RateLimiter(self.host_rate)
+        self.rate_limiter.rate = self.host_rate
+        self.rate_limiter.max_concurrency = self.download_per_host
+        return self.rate_limiter
+    
+    def open_reference_store(self):
+        """打开当前工作目录的引用关系库，失败时返回 None"""
+        db_path = os.path.join(self.workspace_path, self.refs_db_file)
+        if self.reference_store and self.reference_store.db_path == db_path:
+            return self.reference_store
+        if self.reference_store:
+            self.reference_store.close()
+            self.reference_store = None
+        try:
+            self.reference_store = ReferenceStore(db_path)
+        except Exception as e:
+            self.log(f"打开引用关系库失败: {e}")
+        return self.reference_store
+    
+    def load_saved_results(self):
+        """加载工作目录中保存的上次扫描结果，返回是否加载成功"""
+        if self.reference_store:
+            self.reference_store.close()
+            self.reference_store = None
+        self.reference_index = None
+        if not os.path.exists(os.path.join(self.workspace_path, self.refs_db_file)):
+            return False
+        
+        store = self.open_reference_store()
+        if not store:
+            return False
+        try:
+            self.md_files = store.md_files()
+            self.image_files = store.image_files()
+            self.image_references = store.references()
+            self.invalid_images = store.broken_refs()
+            self.unused_images = store.orphan_images()
+            self.referenced_local_images = store.referenced_images()
+            self.remote_images = store.remote_urls()
+            self.log(f"已加载上次扫描结果: {len(self.md_files)} 个MD文件，{len(self.image_files)} 个图片文件")
+            return True
+        except Exception as e:
+            self.log(f"加载上次扫描结果失败: {e}")
+            return False
+    
+    def apply_reference_index(self):
+        """从引用索引同步分析结果"""
+        index = self.reference_index
+        with index.lock:
+            self.md_files = list(index.md_files)
+            self.image_files = list(index.image_files)
+            self.image_references = dict(index.image_references)
+            self.invalid_images = dict(index.invalid_images)
+            self.unused_images = index.unused_images()
+            self.referenced_local_images = index.referenced_local_images()
+            self.remote_images = index.remote_images()
+    
+    def files_referencing(self, targets):
+        """反查引用了任一目标（本地图片路径或远程URL）的MD文件，按扫描顺序返回"""
+        targets = set(targets)
+        if self.reference_store:
+            try:
+                return self.reference_store.files_referencing(targets)
+            except Exception as e:
+                self.log(f"查询引用关系库失败: {e}")
+        return [md_file for md_file in self.md_files
+                if any(img in targets for img in self.image_references.get(md_file, ()))]
+    
+    def ordered_files(self, md_files):
+        """去重并按扫描顺序排列"""
+        wanted = set(md_files)
+        return [md_file for md_file in self.md_files if md_file in wanted]
+    
+    def process_files(self, md_files, process):
+        """用有界线程池并行处理文件，按 md_files 的顺序产出 (md_file, 结果, 日志, 异常)
+
+        process(md_file, log) 在工作线程中执行，log 收集的日志随结果一起按顺序返回，
+        多个文件的日志不会交错。
+        """
+        def run(md_file):
+            messages = []
+            try:
+                return md_file, process(md_file, messages.append), messages, None
+            except Exception as e:
+                return md_file, None, messages, e
+        
+        if not md_files:
+            return
+        with ThreadPoolExecutor(max_workers=max(1, min(self.io_workers, len(md_files)))) as executor:
+            yield from executor.map(run, md_files)
+    
+    def plan_key(self, operation):
+        """生成修改计划所依据的输入（映射表、图片文件）的指纹，变化后缓存的计划作废"""
+        data = [operation, sorted(self.image_mapping.items()), sorted(self.url_aliases.items()), sorted(self.image_files)]
+        if operation == 'download':
+            data.append([self.image_store_dir, self.download_layout])
+        data = json.dumps(data, ensure_ascii=False)
+        return hashlib.sha256(data.encode('utf-8')).hexdigest()
+    
+    def plan_file_path(self, operation):
+        """修改计划的保存位置"""
+        return os.path.join(self.workspace_path, ".backup", f"plan_{operation}.json")
+    
+    def plan_context(self, operation):
+        """返回 (需要处理的MD文件, 单个文件的计划函数)
+
+        计划函数的参数为 (md_file, 文件内容, log)，返回 (修改记录, 附加信息)，在工作线程中执行
+        """
+        if operation in ('replace_remote', 'replace_local') and not self.image_mapping:
+            raise EngineError("没有找到图片映射记录")
+        
+        if operation == 'replace_remote':
+            rewriter = RemoteRewriter(self.image_mapping)
+            # 只处理引用了已上传图片的文件；无效引用可能指向上传后删除的本地图片，一并处理
+            md_files = self.ordered_files(self.files_referencing(rewriter.remote_by_path) + list(self.invalid_images))
+            return md_files, lambda md_file, content, log: (rewriter.edits(content, md_file), None)
+        
+        if operation == 'replace_local':
+            # 一次扫描找出所有映射URL，只替换图片路径恰好为URL的引用
+            rewriter = self.get_local_rewriter()
+            md_files = self.files_referencing(rewriter.local_by_url)
+            return md_files, lambda md_file, content, log: (rewriter.edits(content, md_file), None)
+        
+        if operation == 'download':
+            # 只处理引用了远程图片的文件；已在图片库中的URL预览时直接给出文件名
+            store_root = self.normalize_path(self.open_image_store().root)
+            known = {remote_url: local_path for remote_url, local_path in self.url_to_local().items()
+                     if os.path.dirname(local_path) == store_root}
+            plan_edits = lambda md_file, content, log: self.plan_download_file(md_file, content, log, known)
+            return self.files_referencing(self.remote_images), plan_edits
+        
+        if operation == 'smart_fix':
+            if not self.invalid_images:
+                raise EngineError("没有发现无效引用需要修复")
+            # 创建文件名到路径的映射
+            filename_to_paths = {}
+            for img_path in self.image_files:
+                filename = os.path.basename(img_path).lower()
+                if filename not in filename_to_paths:
+                    filename_to_paths[filename] = []
+                filename_to_paths[filename].append(img_path)
+            self.log(f"建立了 {len(filename_to_paths)} 个文件名映射")
+            plan_edits = lambda md_file, content, log: self.plan_smart_fix_file(md_file, content, log, filename_to_paths)
+            return list(self.invalid_images), plan_edits
+        
+        raise EngineError(f"不支持预览的操作: {operation}")
+    
+    def plan_change(self, md_file, plan_edits, log, content=None, pre_hash=None):
+        """计算单个文件的修改计划"""
+        if content is None:
+            content, pre_hash = read_text(md_file)
+        edits, meta = plan_edits(md_file, content, log)
+        return FileChange(md_file, pre_hash, edits, meta)
+    
+    def plan(self, operation, save=True, context=None):
+        """生成修改计划，不写入任何MD文件
+
+        计划保存在内存和 .backup/plan_<操作>.json 中（save 为 False 时不保存），
+        之后执行同一操作时，内容没有变化的文件直接使用计划中的修改。
+        context 为 plan_context 的返回值，为空时在这里计算。
+        """
+        md_files, plan_edits = context or self.plan_context(operation)
+        self.log(f"生成修改计划: 需要检查 {len(md_files)} 个文件")
+        plan = ChangePlan(operation, self.plan_key(operation))
+        results = self.process_files(md_files, lambda md_file, log: self.plan_change(md_file, plan_edits, log))
+        for md_file, change, messages, error in results:
+            for message in messages:
+                self.log(message)
+            if error:
+                rel_md = self.safe_relpath(md_file, self.workspace_path)
+                self.log(f"❌ 处理 {rel_md} 时出错: {error}")
+                plan.errors.append({'file': md_file, 'error': str(error)})
+                continue
+            plan.add(change)
+        
+        if save:
+            self.plans[operation] = plan
+            try:
+                plan.save(self.plan_file_path(operation))
+            except OSError as e:
+                self.log(f"保存修改计划失败: {e}")
+        summary = plan.summary()
+        self.log(f"修改计划: {summary['files_changed']} 个文件，共 {summary['replacements']} 处修改")
+        return plan
+    
+    def cached_plan(self, operation):
+        """返回仍然有效的修改计划（本次运行生成的或上次保存的），没有时返回 None"""
+        plan = self.plans.get(operation)
+        if plan is None:
+            try:
+                plan = ChangePlan.load(self.plan_file_path(operation))
+            except (OSError, ValueError, KeyError):
+                return None
+        if plan.operation != operation or plan.key != self.plan_key(operation):
+            return None
+        return plan
+    
+    def discard_plan(self, operation):
+        """删除已经执行（或作废）的修改计划"""
+        self.plans.pop(operation, None)
+        try:
+            os.remove(self.plan_file_path(operation))
+        except FileNotFoundError:
+            pass
+    
+    def prepare_plan(self, operation):
+        """执行操作前取得修改计划：有有效的缓存计划时直接使用，否则为所有文件生成计划
+
+        返回 (需要处理的MD文件, 单个文件的计划函数, 计划)
+        """
+        context = self.plan_context(operation)
+        plan = self.cached_plan(operation)
+        if plan:
+            self.log(f"使用已生成的修改计划（{plan.created}）")
+            self.discard_plan(operation)
+        else:
+            plan = self.plan(operation, save=False, context=context)
+        md_files, plan_edits = context
+        return md_files, plan_edits, plan
+    
+    def current_change(self, md_file, plan, plan_edits, log):
+        """读取文件并返回 (内容, 修改计划)，文件在计划之后被修改或不在计划中时重新计算"""
+        content, pre_hash = read_text(md_file)
+        change = plan.changes.get(md_file)
+        if change is None or change.pre_hash != pre_hash:
+            change = self.plan_change(md_file, plan_edits, log, content, pre_hash)
+        return content, change
+    
+    def apply_plan(self, operation, journal, select=None):
+        """按修改计划写入，产出 (md_file, (FileChange, 写入的修改记录, 写入日志记录), 日志, 异常)
+
+        没有有效的计划时先为所有文件生成计划，再统一写入；文件哈希没有变化时直接按位置拼接，
+        不再解析文件，计划之后被修改或新出现的文件在这里重新计算。
+        select(change, log) 返回实际要写入的修改记录，默认全部写入。
+        """
+        md_files, plan_edits, plan = self.prepare_plan(operation)
+        
+        def apply(md_file, log):
+            content, change = self.current_change(md_file, plan, plan_edits, log)
+            edits = select(change, log) if select else change.edits
+            # 有修改时登记到写入日志（提交时统一替换）
+            entry = journal.stage(md_file, apply_edits(content, edits), expected_hash=change.pre_hash) if edits else None
+            return change, edits, entry
+        
+        return self.process_files(md_files, apply)
+    
+    def begin_journal(self, operation, journal_dir=None):
+        """为修改MD文件的操作创建写入日志"""
+        if journal_dir is None:
+            timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+            journal_dir = os.path.join(self.workspace_path, ".backup", f"journal_{operation}_{timestamp}")
+        journal = WriteJournal.create(journal_dir, operation)
+        self.active_journals.add(journal_dir)
+        return journal
+    
+    def finish_journal(self, journal, keep_empty=False):
+        """提交写入日志中登记的所有修改；提交失败时回滚已替换的文件
+
+        返回登记之后又被修改、因此没有写入的文件
+        """
+        try:
+            if not journal.entries:
+                journal.abort()
+                if not keep_empty:
+                    shutil.rmtree(journal.journal_dir, ignore_errors=True)
+                return []
+            try:
+                stale = journal.commit()
+            except Exception:
+                journal.rollback()
+                raise
+            for path in stale:
+                self.log(f"⚠️ 文件在操作期间被修改，未写入（请重新执行）: {self.safe_relpath(path, self.workspace_path)}")
+            self.log(f"已提交 {len(journal.entries)} 个文件的修改（写入日志: {journal.journal_dir}）")
+        finally:
+            self.active_journals.discard(journal.journal_dir)
+        self.prune_journals()
+        self.refresh_written_files([entry['file'] for entry in journal.entries])
+        return stale
+    
+    def prune_journals(self):
+        """只保留最近 journal_keep 个写入日志"""
+        backup_base = os.path.join(self.workspace_path, ".backup")
+        try:
+            removed = prune_journals(backup_base, self.journal_keep, skip=self.active_journals)
+        except Exception as e:
+            self.log(f"清理写入日志失败: {e}")
+            return
+        if removed:
+            self.log(f"已清除 {len(removed)} 个较早的写入日志")
+    
+    def refresh_written_files(self, md_files):
+        """写入MD文件后更新引用索引、分析结果和引用关系库，之后的操作按新的引用查找文件"""
+        index = self.reference_index
+        if index is None:
+            # 只加载了上次保存的结果，没有引用索引：增量重新扫描
+            self.scan()
+            return
+        for md_file in md_files:
+            _, refs, error = read_file_refs(md_file)
+            if error:
+                self.log(f"❌ 读取 {md_file} 失败: {error}")
+                continue
+            # 新下载到图片库或建立的硬链接先登记为图片文件，引用才能解析
+            md_dir = os.path.dirname(md_file)
+            root_prefix = index.root.rstrip('/') + '/'
+            for img_path in refs:
+                if is_remote_path(img_path):
+                    continue
+                abs_path = resolve_ref_path(md_dir, img_path)
+                if (abs_path.startswith(root_prefix)
+                        and not is_ignored_path(abs_path[len(root_prefix):], index.ignore_re)
+                        and os.path.splitext(abs_path)[1].lower() in self.image_extensions
+                        and os.path.isfile(abs_path)):
+                    index.add_image(abs_path)
+            index.update_md(md_file, refs)
+        self.apply_reference_index()
+        self.sync_reference_store()
+    
+    def recover_interrupted_writes(self):
+        """清理或回滚上次中断的写入操作"""
+        backup_base = os.path.join(self.workspace_path, ".backup")
+        try:
+            recovered = recover_journals(backup_base, skip=self.active_journals)
+        except Exception as e:
+            self.log(f"检查中断的写入操作失败: {e}")
+            return
+        for journal_dir, state in recovered:
+            action = "已清理临时文件" if state == 'staged' else "已回滚部分完成的修改"
+            self.log(f"⚠️ 发现中断的写入操作，{action}: {journal_dir}")
+    
+    def rollback_last_operation(self, force=False):
+        """回滚最近一次已提交的写入操作"""
+        backup_base = os.path.join(self.workspace_path, ".backup")
+        for journal_dir in reversed(find_journals(backup_base)):
+            journal = WriteJournal.load(journal_dir)
+            if journal.state != COMMITTED:
+                continue
+            self.log(f"回滚操作: {journal.operation}（{journal_dir}）")
+            restored, conflicts = journal.rollback(force=force)
+            for path in restored:
+                self.log(f"✅ 已恢复: {self.safe_relpath(path, self.workspace_path)}")
+            for path in conflicts:
+                self.log(f"⚠️ 操作之后文件又被修改，已跳过: {self.safe_relpath(path, self.workspace_path)}")
+            return {'operation': journal.operation, 'journal': journal_dir,
+                    'restored': len(restored), 'conflicts': conflicts}
+        raise EngineError("没有可以回滚的写入操作")
+    
+    def upload(self, md_files=None):
+        """上传图片到图床（通过PicList的HTTP上传服务批量上传），md_files 为空时处理所有包含图片的MD文件"""
+        if not self.image_references:
+            raise EngineError("请先扫描分析文件")
+        if md_files is None:
+            md_files = list(self.image_references.keys())
+        
+        self.log("开始上传图片到图床...")
+        uploaded = 0
+        failed = 0
+        skipped = 0
+        
+        # 汇总所有文件引用的本地图片，同一图片只上传一次
+        pending = {}
+        for md_file in md_files:
+            images = self.image_references.get(md_file, [])
+            for img_path in images:
+                if img_path.startswith('http') or img_path in pending:
+                    continue
+                if img_path in self.image_mapping:
+                    self.log(f"  跳过已上传: {os.path.basename(img_path)}")
+                    skipped += 1
+                    continue
+                pending[img_path] = md_file
+        
+        self.log(f"需要上传 {len(pending)} 张图片（每批 {self.upload_batch_size} 张）")
+        uploader = PicListUploader(self.piclist_endpoint, self.piclist_key or None)
+        try:
+            for img_path, remote_url, error in uploader.upload(pending, self.upload_batch_size):
+                if remote_url:
+                    self.image_mapping[img_path] = remote_url
+                    uploaded += 1
+                    self.log(f"  ✅ 上传成功: {os.path.basename(img_path)} -> {remote_url}")
+                else:
+                    failed += 1
+                    self.log(f"  ❌ 上传失败: {os.path.basename(img_path)} - {error}")
+        finally:
+            uploader.close()
+        
+        self.save_mapping()
+        self.log("图片上传完成!")
+        return {'uploaded': uploaded, 'failed': failed, 'skipped': skipped}
+    
+    def replace_to_remote(self):
+        """替换图片链接为远程URL"""
+        if not self.image_mapping:
+            raise EngineError("没有找到图片映射记录")
+        
+        self.log("开始替换为远程链接...")
+        files_changed = 0
+        total_replaced = 0
+        errors = []
+        
+        # 单次分词，逐个引用查表替换
+        journal = self.begin_journal('replace_remote')
+        for md_file, result, messages, error in self.apply_plan('replace_remote', journal):
+            rel_md = self.safe_relpath(md_file, self.workspace_path)
+            if error:
+                self.log(f"❌ 处理 {rel_md} 时出错: {error}")
+                errors.append({'file': md_file, 'error': str(error)})
+            elif result[1]:
+                self.log(f"✅ {rel_md}: 替换了 {len(result[1])} 个图片链接")
+                files_changed += 1
+                total_replaced += len(result[1])
+        for md_file in self.finish_journal(journal):
+            errors.append({'file': md_file, 'error': "文件在操作期间被修改，未写入"})
+            files_changed -= 1
+        
+        self.log("替换为远程链接完成!")
+        return {'files_changed': files_changed, 'replacements': total_replaced, 'errors': errors}
+    
+    def get_local_rewriter(self):
+        """返回 远程URL→本地路径 的改写器，映射表不变时复用上次建立的自动机"""
+        key = (mapping_fingerprint(self.image_mapping), mapping_fingerprint(self.url_aliases))
+        if self.local_rewriter is None or self.local_rewriter_key != key:
+            self.local_rewriter = LocalRewriter(self.image_mapping, self.safe_relpath, self.url_aliases)
+            self.local_rewriter_key = key
+        return self.local_rewriter
+    
+    def replace_to_local(self):
+        """替换图片链接为本地路径"""
+        if not self.image_mapping:
+            raise EngineError("没有找到图片映射记录")
+        
+        self.log("开始替换为本地链接...")
+        files_changed = 0
+        total_replaced = 0
+        errors = []
+        
+        # 只处理引用了映射表中远程URL的文件
+        journal = self.begin_journal('replace_local')
+        for md_file, result, messages, error in self.apply_plan('replace_local', journal):
+            rel_md = self.safe_relpath(md_file, self.workspace_path)
+            if error:
+                self.log(f"❌ 处理 {rel_md} 时出错: {error}")
+                errors.append({'file': md_file, 'error': str(error)})
+            elif result[1]:
+                self.log(f"✅ {rel_md}: 替换了 {len(result[1])} 个图片链接")
+                files_changed += 1
+                total_replaced += len(result[1])
+        for md_file in self.finish_journal(journal):
+            errors.append({'file': md_file, 'error': "文件在操作期间被修改，未写入"})
+            files_changed -= 1
+        
+        self.log("替换为本地链接完成!")
+        return {'files_changed': files_changed, 'replacements': total_replaced, 'errors': errors}
+    
+    def download_images(self):
+        """下载远程图片到本地图片库
+
+        图片按主机排队并发下载（共用连接），每个URL只下载一次；图片按内容保存在图片库中，
+        多个文件引用同一图片时共用一份。一个MD文件引用的图片全部完成后立即登记该文件的修改：
+        链接指向图片库中的文件，或者（hardlink 布局）指向MD文件旁 images 目录中的硬链接。
+        """
+        self.log("开始下载远程图片...")
+        md_files, plan_edits, plan = self.prepare_plan('download')
+        journal = self.begin_journal('download')
+        counts = {'skipped': 0, 'files_changed': 0, 'stale': []}
+        store = self.open_image_store()
+        store.prune_incoming()
+        self.open_http_cache()
+        # 之前下载过的副本，内容与缓存记录一致时直接使用或发送条件请求
+        copies = {}
+        for local_path, remote_url in self.image_mapping.items():
+            copies.setdefault(remote_url, []).append(local_path)
+        for remote_url, local_path in self.url_aliases.items():
+            copies.setdefault(remote_url, []).append(local_path)
+        fetch = lambda remote_url, target, session: self.fetch_image(remote_url, session, copies)
+        scheduler = DownloadScheduler(fetch, self.download_workers, self.download_per_host, self.get_rate_limiter())
+        
+        def on_file_done(md_file, change, results):
+            """文件引用的图片全部完成：只替换下载成功的图片链接（回调逐个执行）
+
+            下载期间文件被修改时按新内容重新计算，新出现的URL留到下次下载。
+            """
+            rel_md = self.safe_relpath(md_file, self.workspace_path)
+            md_dir = os.path.dirname(md_file)
+            try:
+                content, pre_hash = read_text(md_file)
+                edits = change.edits
+                if pre_hash != change.pre_hash:
+                    self.log(f"⚠️ {rel_md} 在下载期间被修改，按新内容重新计算")
+                    edits, _ = plan_edits(md_file, content, self.log)
+            except Exception as e:
+                self.log(f"❌ 处理 {rel_md} 时出错: {e}")
+                return
+            done = []
+            for edit in edits:
+                remote_url = edit['requires'][0]
+                stored = results.get(remote_url)
+                if not stored:
+                    continue
+                local_path = stored
+                if self.download_layout == 'hardlink':
+                    try:
+                        local_path = store.link(stored, os.path.join(md_dir, 'images'))
+                    except OSError as e:
+                        self.log(f"  跳过 {remote_url}: {e}")
+                        counts['skipped'] += 1
+                        continue
+                local_path = self.normalize_path(local_path)
+                self.record_mapping(local_path, remote_url)
+                done.append(dict(edit, new=self.safe_relpath(local_path, md_dir)))
+            if not done:
+                return
+            try:
+                journal.stage(md_file, apply_edits(content, done), expected_hash=pre_hash)
+            except Exception as e:
+                self.log(f"❌ 处理 {rel_md} 时出错: {e}")
+                return
+            counts['files_changed'] += 1
+            self.log(f"✅ {rel_md}: 替换了 {len(done)} 个图片链接")
+        
+        try:
+            # 读取文件、核对计划在读写线程池中进行，下载在下载线程池中进行
+            results = self.process_files(md_files, lambda md_file, log: self.current_change(md_file, plan, plan_edits, log))
+            for md_file, prepared, messages, error in results:
+                for message in messages:
+                    self.log(message)
+                if error:
+                    rel_md = self.safe_relpath(md_file, self.workspace_path)
+                    self.log(f"❌ 处理 {rel_md} 时出错: {error}")
+                    continue
+                _, change = prepared
+                if not change.edits:
+                    continue
+                # 以URL为下载目标，所有文件中的同一URL只下载一次
+                jobs = {edit['requires'][0]: edit['requires'][0] for edit in change.edits}
+                scheduler.add_group(jobs, lambda results, md_file=md_file, change=change:
+                                    on_file_done(md_file, change, results))
+        finally:
+            try:
+                scheduler.join()
+            finally:
+                counts['stale'] = self.finish_journal(journal)
+        
+        self.save_mapping()
+        outcomes = list(scheduler.results().values())
+        if outcomes.count(None):
+            hosts = ', '.join(f"{host}（{count} 次）" for host, count in sorted(self.rate_limiter.throttled_hosts().items()))
+            self.log(f"⏸ {outcomes.count(None)} 张图片因服务器限流推迟下载: {hosts}，再次执行下载即可继续")
+        self.log("下载远程图片完成!")
+        return {
+            'downloaded': len(outcomes) - outcomes.count(False) - outcomes.count(None),
+            'failed': outcomes.count(False),
+            'deferred': outcomes.count(None),
+            'skipped': counts['skipped'],
+            'files_changed': counts['files_changed'] - len(counts['stale']),
+            'stale': counts['stale'],
+        }
+    
+    def open_image_store(self):
+        """打开当前工作目录的图片库"""
+        root = os.path.join(self.workspace_path, self.image_store_dir)
+        if self.image_store is None or self.image_store.root != root:
+            self.image_store = ImageStore(root)
+        return self.image_store
+    
+    def plan_download_file(self, md_file, content, log, known=None):
+        """计算单个MD文件的下载计划（在工作线程中执行）
+
+        每个远程图片引用对应一处修改，requires 记录需要下载的 [URL]。
+        新链接在下载完成后才能确定（图片库中的文件名包含内容哈希），预览中为预计的路径。
+        known: {URL: 图片库中已有的文件}
+        """
+        refs = [ref for ref in iter_image_refs(content) if ref.is_remote]
+        if not refs:
+            return [], None
+        
+        rel_md = self.safe_relpath(md_file, self.workspace_path)
+        log(f"处理文件: {rel_md}")
+        
+        md_dir = os.path.dirname(md_file)
+        spans = []
+        for ref in refs:
+            remote_url = ref.path
+            local_path = (known or {}).get(remote_url) or self.image_store.preview_path(remote_url)
+            if self.download_layout == 'hardlink':
+                local_path = os.path.join(md_dir, 'images', os.path.basename(local_path))
+            spans.append((ref.path_start, ref.path_end, self.safe_relpath(local_path, md_dir), [remote_url]))
+        
+        return make_edits(content, spans), None
+    
+    def fetch_image(self, remote_url, session, copies=None):
+        """下载一张图片到图片库（在下载线程中执行），返回图片库中的路径，失败时返回 False，被限流推迟时返回 None
+
+        copies: {URL: [之前下载到的本地路径]}，与缓存中记录的哈希一致的副本在缓存有效期内直接使用，
+        过期后发送条件请求。
+        """
+        filename = os.path.basename(urlparse(remote_url).path) or remote_url
+        store = self.image_store
+        try:
+            record = self.http_cache.get(remote_url) if self.http_cache else None
+            if self.http_cache and self.http_cache.is_fresh(record) and record['status'] in (404, 410):
+                # 有效期内确认过不存在的图片不再请求
+                self.log(f"  ❌ 下载失败: {filename} - HTTP {record['status']}（缓存结果）")
+                return False
+            
+            cached_copy = self.find_cached_copy(remote_url, (copies or {}).get(remote_url, ()))
+            if cached_copy and self.http_cache.is_fresh(record):
+                self.log(f"  ✅ 使用已下载的副本: {filename}")
+                if os.path.dirname(cached_copy) == self.normalize_path(store.root):
+                    return cached_copy
+                # 旧版本下载到MD文件旁的副本，复制一份放入图片库
+                temp_path = store.incoming_path()
+                copy_file(cached_copy, temp_path)
+                return store.add(temp_path, remote_url)
+            # 下载图片（带重试、续传和特殊处理）
+            temp_path = store.incoming_path()
+            partial = PartialDownload(store.partial_path(remote_url), remote_url)
+            success = self.download_image_with_retry(remote_url, temp_path, session=session, cached_copy=cached_copy,
+                                                     partial=partial)
+            if success is None:
+                self.log(f"  ⏸ 推迟下载: {filename} - 服务器限流，下次运行时继续")
+                return None
+            if not success:
+                self.log(f"  ❌ 下载失败: {filename} - 所有重试都失败")
+                return False
+            stored = store.add(temp_path, remote_url)
+        except Exception as e:
+            self.log(f"  ❌ 下载失败 {remote_url}: {e}")
+            return False
+        
+        self.log(f"  ✅ 下载成功: {filename} -> {os.path.basename(stored)}")
+        return stored
+    
+    def find_cached_copy(self, remote_url, local_paths):
+        """在图片库和之前下载过的本地文件中找出内容与缓存记录一致的一个，没有时返回 None"""
+        record = self.http_cache.get(remote_url) if self.http_cache else None
+        if not record or not record['sha256']:
+            return None
+        # 图片库按内容索引，同一内容的其他URL下载过即可使用
+        stored = self.image_store.index.get(record['sha256']) if self.image_store else None
+        if stored:
+            local_paths = [self.normalize_path(os.path.join(self.image_store.root, stored))] + list(local_paths)
+        for path in local_paths:
+            if file_sha256(path) == record['sha256']:
+                return path
+        return None
+    
+    def deletion_candidates(self):
+        """delete_local_images 将删除的文件：{'unused': [未引用图片], 'uploaded': [已上传的本地图片]}（只列出存在的文件）"""
+        return {
+            'unused': [path for path in self.unused_images if os.path.exists(path)],
+            'uploaded': [path for path in dict.fromkeys(list(self.image_mapping) + list(self.url_aliases.values()))
+                         if os.path.exists(path)],
+        }
+    
+    def delete_local_images(self):
+        """删除未被引用的图片和已上传的本地图片，并清空映射记录"""
+        if not self.unused_images and not self.image_mapping:
+            raise EngineError("没有找到可删除的图片")
+        
+        self.log("开始删除本地图片...")
+        
+        deleted_count = 0
+        
+        # 删除未被引用的图片
+        for img_path in self.unused_images:
+            try:
+                if os.path.exists(img_path):
+                    os.remove(img_path)
+                    deleted_count += 1
+                    rel_path = self.safe_relpath(img_path, self.workspace_path)
+                    self.log(f"✅ 删除未引用图片: {rel_path}")
+            except Exception as e:
+                rel_path = self.safe_relpath(img_path, self.workspace_path)
+                self.log(f"❌ 删除失败 {rel_path}: {e}")
+        
+        # 删除已上传的本地图片（包括别名对应的文件）
+        for local_path in list(dict.fromkeys(list(self.image_mapping) + list(self.url_aliases.values()))):
+            try:
+                if os.path.exists(local_path):
+                    os.remove(local_path)
+                    deleted_count += 1
+                    rel_path = self.safe_relpath(local_path, self.workspace_path)
+                    self.log(f"✅ 删除已上传图片: {rel_path}")
+            except Exception as e:
+                rel_path = self.safe_relpath(local_path, self.workspace_path)
+                self.log(f"❌ 删除失败 {rel_path}: {e}")
+        
+        # 清空映射记录
+        self.image_mapping.clear()
+        self.url_aliases.clear()
+        self.save_mapping()
+        
+        # 清空分析结果
+        self.unused_images.clear()
+        
+        self.log(f"删除完成! 共删除 {deleted_count} 个文件")
+        return {'deleted': deleted_count}
+    
+    def check_links(self):
+        """检查远程图片链接是否失效"""
+        self.log("开始检查远程链接...")
+        
+        broken_links = []
+        
+        # 检查扫描结果中的远程链接（来自引用关系库，无需重新读取文件）
+        if self.reference_store:
+            remote_refs = self.reference_store.remote_refs()
+        else:
+            remote_refs = {md_file: [img for img in images if is_remote_path(img)]
+                           for md_file, images in self.image_references.items()}
+        
+        # 先汇总所有文件中不重复的URL，按主机排队并发检查（共用连接）；
+        # 有效期内的结果直接使用缓存，过期后发送条件请求
+        urls = list(dict.fromkeys(url for remote_urls in remote_refs.values() for url in remote_urls))
+        self.log(f"需要检查 {len(urls)} 个不同的远程链接")
+        cache = self.open_http_cache()
+        unreachable = {}  # 主机 -> 连接失败的错误信息，同一主机的其余链接不再请求
+        unreachable_lock = threading.Lock()  # 同一主机可能有多个检查线程
+        
+        def check(url, target, session):
+            """返回 (状态码或错误信息, 是否来自缓存)，主机无法连接的链接状态为 None"""
+            host = url_host(url)
+            with unreachable_lock:
+                if host in unreachable:
+                    return None, False
+            # 被限流时再试一次：限流器会先等到 Retry-After 指定的时间
+            for attempt in range(2):
+                try:
+                    status, from_cache = self.check_url(session, url, cache)
+                except RequestDeferred:
+                    # 主机要求等待的时间过长，按被限流处理
+                    return THROTTLE_STATUSES[0], False
+                except Exception as e:
+                    # 只有连接层面的失败说明整个主机无法访问（check_url 只抛出这类异常）；
+                    # 这个链接和同一主机的其余链接一样记为未检查，不因为先请求而算作失效
+                    with unreachable_lock:
+                        unreachable.setdefault(host, str(e))
+                    return None, False
+                if status not in THROTTLE_STATUSES:
+                    break
+            return status, from_cache
+        
+        scheduler = DownloadScheduler(check, self.check_workers, self.download_per_host, self.get_rate_limiter())
+        if urls:
+            scheduler.add_group({url: url for url in urls}, lambda results: None)
+        scheduler.join()
+        results = scheduler.results()
+        cached = sum(1 for status, from_cache in results.values() if from_cache)
+        if cached:
+            self.log(f"使用缓存的检查结果: {cached} 个链接")
+        
+        # 按 (文件, URL) 汇报检查结果；被限流的链接不算失效，记为推迟；
+        # 主机无法连接的链接也不算失效，记为未检查并附上主机的错误信息
+        deferred_links = []
+        unchecked_links = []
+        for md_file, remote_urls in remote_refs.items():
+            for url in dict.fromkeys(remote_urls):
+                result = results.get(url)
+                status = result[0] if result else "检查出错"
+                if isinstance(status, int) and status in OK_STATUSES:
+                    continue
+                if status in THROTTLE_STATUSES:
+                    deferred_links.append((md_file, url, status))
+                    continue
+                if status is None:
+                    unchecked_links.append((md_file, url, unreachable.get(url_host(url), "主机无法连接")))
+                    continue
+                broken_links.append((md_file, url, status))
+                if isinstance(status, int):
+                    self.log(f"  ❌ 失效链接: {url} (状态码: {status})")
+                else:
+                    self.log(f"  ❌ 无法访问: {url} ({status})")
+        
+        if deferred_links:
+            hosts = ', '.join(sorted({url_host(url) for _, url, _ in deferred_links}))
+            self.log(f"⏸ {len(deferred_links)} 个链接因服务器限流未能检查（{hosts}），请稍后重试")
+        if unchecked_links:
+            hosts = ', '.join(f"{host}（{error}）" for host, error in sorted(unreachable.items()))
+            self.log(f"⏸ {len(unchecked_links)} 个链接所在的主机无法连接，没有检查: {hosts}")
+        
+        if broken_links:
+            self.log(f"\n发现 {len(broken_links)} 个失效链接")
+            
+            # 提供修复建议
+            gitee_links = [link for link in broken_links if 'gitee.com' in link[1]]
+            if gitee_links:
+                self.log("\n=== Gitee链接修复建议 ===")
+                self.log("Gitee图床经常出现403错误，建议:")
+                self.log("1. 将图片重新上传到其他图床（如GitHub、七牛云等）")
+                self.log("2. 使用本地图片存储")
+                self.log("3. 检查Gitee仓库的访问权限设置")
+                
+                for md_file, url, error in gitee_links:
+                    rel_md = self.safe_relpath(md_file, self.workspace_path)
+                    self.log(f"  📄 {rel_md}")
+                    self.log(f"     🔗 {url}")
+        elif not deferred_links and not unchecked_links:
+            self.log("✅ 所有远程链接都可以正常访问")
+        
+        self.log("失效链接检查完成!")
+        return {
+            'checked': len(results),
+            'cached': cached,
+            'broken': [{'file': md_file, 'url': url, 'error': str(error)} for md_file, url, error in broken_links],
+            'deferred': [{'file': md_file, 'url': url, 'status': status} for md_file, url, status in deferred_links],
+            'unchecked': [{'file': md_file, 'url': url, 'error': error} for md_file, url, error in unchecked_links],
+        }
+    
+    def check_url(self, session, url, cache=None):
+        """检查单个URL，返回 (状态码或错误信息, 是否来自缓存)；无法连接主机时抛出异常"""
+        if cache:
+            return cache.check(session, url, self.check_timeout)
+        try:
+            return session.head(url, timeout=self.check_timeout, allow_redirects=True).status_code, False
+        except RequestDeferred:
+            raise
+        except Exception as e:
+            if is_connection_failure(e):
+                raise
+            return str(e), False
+    
+    def smart_fix_paths(self):
+        """智能修复路径问题 - 处理文件夹移动等情况"""
+        if not self.invalid_images:
+            raise EngineError("没有发现无效引用需要修复")
+        
+        import datetime
+        import shutil
+        
+        self.log("开始智能修复路径...")
+        total_invalid = sum(len(imgs) for imgs in self.invalid_images.values())
+        self.log(f"发现 {total_invalid} 个无效引用")
+        
+        # 创建备份和日志目录
+        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        backup_base = os.path.join(self.workspace_path, ".backup")
+        backup_dir = os.path.join(backup_base, f"smart_fix_{timestamp}")
+        # 备份目录同时是写入日志目录，只保存实际被修改的文件
+        journal = self.begin_journal('smart_fix', backup_dir)
+        
+        # 创建修复记录文件
+        fix_log_file = os.path.join(backup_dir, "fix_log.json")
+        fix_records = {
+            "timestamp": timestamp,
+            "total_files_processed": 0,
+            "total_fixes": 0,
+            "modifications": []
+        }
+        
+        self.log(f"创建备份目录: {backup_dir}")
+        
+        total_fixed = 0
+        for md_file, result, messages, error in self.apply_plan('smart_fix', journal):
+            for message in messages:
+                self.log(message)
+            rel_md = self.safe_relpath(md_file, self.workspace_path)
+            if error:
+                self.log(f"❌ 处理文件 {rel_md} 时出错: {error}")
+                # 记录错误
+                fix_records["modifications"].append({"file": rel_md, "error": str(error)})
+                continue
+            
+            change, edits, entry = result
+            file_record = dict(change.meta)
+            
+            # 保存修改后的文件
+            if entry:
+                file_record["backup_file"] = journal.blob_path(entry["pre_hash"])
+                self.log(f"💾 {rel_md}: 已保存，修复了 {len(file_record['fixes'])} 个引用")
+                fix_records["total_files_processed"] += 1
+                total_fixed += len(file_record["fixes"])
+            
+            # 添加文件记录到总记录中
+            if file_record["fixes"]:
+                fix_records["modifications"].append(file_record)
+        
+        # 提交所有修改
+        self.finish_journal(journal, keep_empty=True)
+        
+        # 保存修复记录
+        fix_records["total_fixes"] = total_fixed
+        with open(fix_log_file, 'w', encoding='utf-8') as f:
+            json.dump(fix_records, f, ensure_ascii=False, indent=2)
+        
+        # 生成撤销脚本
+        self.generate_undo_script(backup_dir, fix_records)
+        
+        self.log(f"\n智能修复完成!")
+        self.log(f"总计处理: {total_invalid} 个无效引用")
+        self.log(f"成功修复: {total_fixed} 个引用")
+        self.log(f"修复率: {total_fixed/total_invalid*100:.1f}%")
+        self.log(f"备份目录: {backup_dir}")
+        self.log(f"修复记录: {fix_log_file}")
+        
+        if total_fixed > 0:
+            self.log("✅ 所有修改已记录，可以撤销")
+            self.log("建议重新扫描以更新统计信息")
+        
+        return {'total_invalid': total_invalid, 'fixed': total_fixed, 'backup_dir': backup_dir, 'fix_log': fix_log_file}
+    
+    def plan_smart_fix_file(self, md_file, content, log, filename_to_paths):
+        """计算单个MD文件中无效引用的修复（在工作线程中执行），返回 (修改记录, 修复记录)"""
+        invalid_imgs = self.invalid_images.get(md_file, [])
+        original_content = content
+        
+        rel_md = self.safe_relpath(md_file, self.workspace_path)
+        log(f"\n处理文件: {rel_md}")
+        
+        # 记录文件处理（备份文件在保存修改时由写入日志生成）
+        file_record = {
+            "file": rel_md,
+            "backup_file": None,
+            "original_invalid_count": len(invalid_imgs),
+            "fixes": []
+        }
+        
+        for invalid_path in invalid_imgs:
+            log(f"  🔍 检查路径: {invalid_path}")
+            
+            # 首先用原始路径的文件名查找
+            original_filename = os.path.basename(invalid_path).lower()
+            
+            # 查找同名文件
+            if original_filename in filename_to_paths:
+                candidates = filename_to_paths[original_filename]
+                
+                if len(candidates) == 1:
+                    # 只有一个候选，直接替换
+                    correct_path = candidates[0]
+                    rel_correct_path = self.safe_relpath(correct_path, os.path.dirname(md_file))
+                    
+                    # 替换内容中的路径
+                    old_patterns = [
+                        f'!\\[([^\\]]*)\\]\\({re.escape(invalid_path)}\\)',
+                        f'<img([^>]+)src=["\']{re.escape(invalid_path)}["\'](.*?)>',
+                    ]
+                    
+                    for pattern in old_patterns:
+                        if '!\\[' in pattern:
+                            new_content = re.sub(pattern, f'![\\1]({rel_correct_path})', content)
+                        else:
+                            new_content = re.sub(pattern, f'<img\\1src="{rel_correct_path}"\\2>', content)
+                        
+                        if new_content != content:
+                            content = new_content
+                            
+                            # 记录修复操作
+                            fix_detail = {
+                                "type": "exact_match",
+                                "original_path": invalid_path,
+                                "new_path": rel_correct_path,
+                                "absolute_path": correct_path,
+                                "confidence": "high"
+                            }
+                            file_record["fixes"].append(fix_detail)
+                            
+                            log(f"  ✅ 修复: {invalid_path} -> {rel_correct_path}")
+                            break
+                
+                elif len(candidates) > 1:
+                    # 多个候选，选择最相似的路径
+                    best_match = self.find_best_path_match(invalid_path, candidates)
+                    if best_match:
+                        rel_best_path = self.safe_relpath(best_match, os.path.dirname(md_file))
+                        
+                        # 替换内容中的路径
+                        old_patterns = [
+                            f'!\\[([^\\]]*)\\]\\({re.escape(invalid_path)}\\)',
+                            f'<img([^>]+)src=["\']{re.escape(invalid_path)}["\'](.*?)>',
+                        ]
+                        
+                        for pattern in old_patterns:
+                            if '!\\[' in pattern:
+                                new_content = re.sub(pattern, f'![\\1]({rel_best_path})', content)
+                            else:
+                                new_content = re.sub(pattern, f'<img\\1src="{rel_best_path}"\\2>', content)
+                            
+                            if new_content != content:
+                                content = new_content
+                                
+                                # 记录智能匹配操作
+                                similarity_score = self.calculate_similarity(invalid_path, best_match)
+                                fix_detail = {
+                                    "type": "smart_match",
+                                    "original_path": invalid_path,
+                                    "new_path": rel_best_path,
+                                    "absolute_path": best_match,
+                                    "confidence": "medium" if similarity_score > 0.7 else "low",
+                                    "similarity_score": similarity_score,
+                                    "candidates_count": len(candidates)
+                                }
+                                file_record["fixes"].append(fix_detail)
+                                
+                                log(f"  ✅ 智能匹配: {invalid_path} -> {rel_best_path} (相似度: {similarity_score:.2f})")
+                                break
+            else:
+                # 原始文件名找不到，尝试URL解码
+                decoded_path = unquote(invalid_path)
+                if decoded_path != invalid_path:
+                    log(f"  🔓 尝试URL解码: {decoded_path}")
+                    
+                    # 用解码后的文件名再次查找
+                    decoded_filename = os.path.basename(decoded_path).lower()
+                    if decoded_filename in filename_to_paths:
+                        candidates = filename_to_paths[decoded_filename]
+                        
+                        if len(candidates) == 1:
+                            # 只有一个候选，直接替换
+                            correct_path = candidates[0]
+                            rel_correct_path = self.safe_relpath(correct_path, os.path.dirname(md_file))
+                            
+                            # 替换内容中的路径
+                            old_patterns = [
+                                f'!\\[([^\\]]*)\\]\\({re.escape(invalid_path)}\\)',
+                                f'<img([^>]+)src=["\']{re.escape(invalid_path)}["\'](.*?)>',
+                            ]
+                            
+                            for pattern in old_patterns:
+                                if '!\\[' in pattern:
+                                    new_content = re.sub(pattern, f'![\\1]({rel_correct_path})', content)
+                                else:
+                                    new_content = re.sub(pattern, f'<img\\1src="{rel_correct_path}"\\2>', content)
+                                
+                                if new_content != content:
+                                    content = new_content
+                                    
+                                    # 记录解码修复操作
+                                    fix_detail = {
+                                        "type": "decoded_exact_match",
+                                        "original_path": invalid_path,
+                                        "decoded_path": decoded_path,
+                                        "new_path": rel_correct_path,
+                                        "absolute_path": correct_path,
+                                        "confidence": "high"
+                                    }
+                                    file_record["fixes"].append(fix_detail)
+                                    
+                                    log(f"  ✅ 解码修复: {invalid_path} -> {rel_correct_path}")
+                                    break
+                        
+                        elif len(candidates) > 1:
+                            # 多个候选，选择最相似的路径
+                            best_match = self.find_best_path_match(decoded_path, candidates)
+                            if best_match:
+                                rel_best_path = self.safe_relpath(best_match, os.path.dirname(md_file))
+                                
+                                # 替换内容中的路径
+                                old_patterns = [
+                                    f'!\\[([^\\]]*)\\]\\({re.escape(invalid_path)}\\)',
+                                    f'<img([^>]+)src=["\']{re.escape(invalid_path)}["\'](.*?)>',
+                                ]
+                                
+                                for pattern in old_patterns:
+                                    if '!\\[' in pattern:
+                                        new_content = re.sub(pattern, f'![\\1]({rel_best_path})', content)
+                                    else:
+                                        new_content = re.sub(pattern, f'<img\\1src="{rel_best_path}"\\2>', content)
+                                    
+                                    if new_content != content:
+                                        content = new_content
+                                        
+                                        # 记录解码智能匹配操作
+                                        similarity_score = self.calculate_similarity(decoded_path, best_match)
+                                        fix_detail = {
+                                            "type": "decoded_smart_match",
+                                            "original_path": invalid_path,
+                                            "decoded_path": decoded_path,
+                                            "new_path": rel_best_path,
+                                            "absolute_path": best_match,
+                                            "confidence": "medium" if similarity_score > 0.7 else "low",
+                                            "similarity_score": similarity_score,
+                                            "candidates_count": len(candidates)
+                                        }
+                                        file_record["fixes"].append(fix_detail)
+                                        
+                                        log(f"  ✅ 解码智能匹配: {invalid_path} -> {rel_best_path} (相似度: {similarity_score:.2f})")
+                                        break
+                    
+                    else:
+                        # 解码后的文件名也找不到，尝试完整路径匹配
+                        decoded_match = self.find_decoded_path_match(decoded_path, self.image_files)
+                        if decoded_match:
+                            rel_decoded_path = self.safe_relpath(decoded_match, os.path.dirname(md_file))
+                            
+                            # 替换内容中的路径
+                            old_patterns = [
+                                f'!\\[([^\\]]*)\\]\\({re.escape(invalid_path)}\\)',
+                                f'<img([^>]+)src=["\']{re.escape(invalid_path)}["\'](.*?)>',
+                            ]
+                            
+                            for pattern in old_patterns:
+                                if '!\\[' in pattern:
+                                    new_content = re.sub(pattern, f'![\\1]({rel_decoded_path})', content)
+                                else:
+                                    new_content = re.sub(pattern, f'<img\\1src="{rel_decoded_path}"\\2>', content)
+                                
+                                if new_content != content:
+                                    content = new_content
+                                    
+                                    # 记录解码路径匹配操作
+                                    fix_detail = {
+                                        "type": "decoded_path_match",
+                                        "original_path": invalid_path,
+                                        "decoded_path": decoded_path,
+                                        "new_path": rel_decoded_path,
+                                        "absolute_path": decoded_match,
+                                        "confidence": "medium"
+                                    }
+                                    file_record["fixes"].append(fix_detail)
+                                    
+                                    log(f"  ✅ 解码路径匹配: {invalid_path} -> {rel_decoded_path}")
+                                    break
+                
+                # 所有方法都失败了
+                if invalid_path in [fix["original_path"] for fix in file_record["fixes"]]:
+                    # 已经修复过了，跳过
+                    pass
+                else:
+                    log(f"  ❌ 未找到匹配文件: {invalid_path}")
+                    if decoded_path != invalid_path:
+                        log(f"      解码路径: {decoded_path}")
+        
+        return diff_edits(original_content, content), file_record
+    
+    def find_best_path_match(self, invalid_path, candidates):
+        """找到最匹配的路径 - 严格匹配标准"""
+        import difflib
+        
+        # 提取无效路径的目录结构和文件名
+        invalid_parts = invalid_path.replace('\\', '/').split('/')
+        invalid_filename = os.path.basename(invalid_path).lower()
+        
+        best_score = 0
+        best_match = None
+        
+        for candidate in candidates:
+            candidate_parts = candidate.replace('\\', '/').split('/')
+            candidate_filename = os.path.basename(candidate).lower()
+            
+            # 首先检查文件名相似度
+            filename_similarity = difflib.SequenceMatcher(None, invalid_filename, candidate_filename).ratio()
+            
+            # 只有文件名相似度很高才考虑路径匹配
+            if filename_similarity < 0.95:  # 文件名必须95%相似
+                continue
+            
+            # 计算完整路径相似度
+            path_similarity = difflib.SequenceMatcher(None, invalid_parts, candidate_parts).ratio()
+            
+            # 综合评分：文件名相似度 * 0.8 + 路径相似度 * 0.2
+            combined_score = filename_similarity * 0.8 + path_similarity * 0.2
+            
+            if combined_score > best_score:
+                best_score = combined_score
+                best_match = candidate
+        
+        # 只有综合相似度超过0.9才认为是有效匹配
+        return best_match if best_score > 0.9 else None
+    
+    def find_decoded_path_match(self, decoded_path, image_files):
+        """通过解码后的路径查找匹配的图片文件 - 严格匹配"""
+        import difflib
+        
+        # 标准化解码后的路径
+        decoded_normalized = decoded_path.replace('\\', '/').lower()
+        decoded_filename = os.path.basename(decoded_normalized)
+        
+        # 首先尝试精确的文件名匹配
+        for img_file in image_files:
+            img_normalized = img_file.replace('\\', '/').lower()
+            img_filename = os.path.basename(img_normalized)
+            
+            # 精确文件名匹配
+            if decoded_filename == img_filename:
+                return img_file
+        
+        # 如果精确匹配失败，尝试路径包含匹配（但要求很高的相似度）
+        best_score = 0
+        best_match = None
+        
+        for img_file in image_files:
+            img_normalized = img_file.replace('\\', '/').lower()
+            
+            # 检查是否是完全路径匹配
+            if decoded_normalized == img_normalized:
+                return img_file
+            
+            # 检查路径是否包含关系（严格）
+            if decoded_normalized in img_normalized or img_normalized.endswith(decoded_normalized):
+                # 但要求路径长度相近，避免误匹配
+                length_ratio = min(len(decoded_normalized), len(img_normalized)) / max(len(decoded_normalized), len(img_normalized))
+                if length_ratio > 0.8:  # 路径长度相似度要求80%以上
+                    return img_file
+            
+            # 计算文件名相似度（只有文件名相似度很高才考虑）
+            decoded_filename = os.path.basename(decoded_normalized)
+            img_filename = os.path.basename(img_normalized)
+            filename_similarity = difflib.SequenceMatcher(None, decoded_filename, img_filename).ratio()
+            
+            # 只有文件名相似度超过0.9才考虑（几乎完全相同）
+            if filename_similarity > 0.9 and filename_similarity > best_score:
+                best_score = filename_similarity
+                best_match = img_file
+        
+        # 只返回文件名几乎完全相同的匹配
+        return best_match if best_score > 0.9 else None
+    
+    def calculate_similarity(self, path1, path2):
+        """计算两个路径的相似度"""
+        import difflib
+        parts1 = path1.replace('\\', '/').split('/')
+        parts2 = path2.replace('\\', '/').split('/')
+        return difflib.SequenceMatcher(None, parts1, parts2).ratio()
+    
+    def generate_undo_script(self, backup_dir, fix_records):
+        """生成撤销脚本"""
+        undo_script = os.path.join(backup_dir, "undo_fixes.py")
+        
+        # 避免变量名冲突，并统一路径格式
+        backup_dir_path = backup_dir.replace('\\', '/')
+        workspace_path = self.workspace_path.replace('\\', '/')
+        
+        script_content = f'''#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+智能修复撤销脚本
+生成时间: {fix_records["timestamp"]}
+修复文件数: {fix_records["total_files_processed"]}
+修复引用数: {fix_records["total_fixes"]}
+"""
+
+import os
+import shutil
+import json
+
+def undo_fixes():
+    backup_dir = r"{backup_dir_path}"
+    
+    print("开始撤销智能修复操作...")
+    
+    # 读取修复记录
+    with open(os.path.join(backup_dir, "fix_log.json"), 'r', encoding='utf-8') as f:
+        records = json.load(f)
+    
+    restored_count = 0
+    
+    for mod in records["modifications"]:
+        try:
+            backup_file = mod["backup_file"]
+            original_file = mod["file"]
+            
+            if os.path.exists(backup_file):
+                # 恢复原始文件
+                workspace_path = r"{workspace_path}"
+                target_file = os.path.join(workspace_path, original_file)
+                
+                shutil.copy2(backup_file, target_file)
+                restored_count += 1
+                print(f"✅ 已恢复: {{original_file}}")
+            else:
+                print(f"❌ 备份文件不存在: {{backup_file}}")
+        
+        except Exception as e:
+            print(f"❌ 恢复失败 {{mod['file']}}: {{e}}")
+    
+    print(f"\\n撤销完成! 共恢复 {{restored_count}} 个文件")
+    print("建议重新扫描以更新统计信息")
+
+if __name__ == "__main__":
+    undo_fixes()
+'''
+        
+        with open(undo_script, 'w', encoding='utf-8') as f:
+            f.write(script_content)
+        
+        self.log(f"生成撤销脚本: {undo_script}")
+        self.log("如需撤销修改，运行: python undo_fixes.py")
+    
+    def find_latest_fix_backup(self):
+        """查找最近一次智能修复的备份目录"""
+        # 检查是否已选择工作目录
+        if not self.workspace_path:
+            raise EngineError("请先选择工作目录")
+        
+        # 查找最新的备份目录
+        backup_base = os.path.join(self.workspace_path, ".backup")
+        if not os.path.exists(backup_base):
+            raise EngineError("没有找到备份目录，无法撤销\n\n可能原因：\n1. 还没有执行过智能修复操作\n2. 备份目录被删除了")
+        
+        # 获取所有备份目录，按时间排序
+        backup_dirs = []
+        for item in os.listdir(backup_base):
+            backup_path = os.path.join(backup_base, item)
+            if os.path.isdir(backup_path) and item.startswith("smart_fix_"):
+                backup_dirs.append(backup_path)
+        
+        if not backup_dirs:
+            raise EngineError("没有找到智能修复的备份记录\n\n可能原因：\n1. 还没有执行过智能修复操作\n2. 备份记录被删除了\n3. 备份目录中没有以'smart_fix_'开头的目录")
+        
+        # 选择最新的备份
+        latest_backup = max(backup_dirs, key=os.path.getctime)
+        if not os.path.exists(os.path.join(latest_backup, "fix_log.json")):
+            raise EngineError("备份记录文件不存在")
+        
+        return latest_backup
+    
+    def undo_fixes(self, backup_dir=None):
+        """撤销智能修复操作，默认撤销最近一次"""
+        if backup_dir is None:
+            backup_dir = self.find_latest_fix_backup()
+        fix_log_file = os.path.join(backup_dir, "fix_log.json")
+        
+        # 通过写入日志完成的修复，按日志回滚
+        if os.path.exists(os.path.join(backup_dir, "journal.json")):
+            self.log("开始撤销智能修复操作...")
+            restored, conflicts = WriteJournal.load(backup_dir).rollback()
+            for path in restored:
+                self.log(f"✅ 已恢复: {self.safe_relpath(path, self.workspace_path)}")
+            for path in conflicts:
+                self.log(f"⚠️ 修复之后文件又被修改，已跳过: {self.safe_relpath(path, self.workspace_path)}")
+            self.log(f"\n撤销完成! 共恢复 {len(restored)} 个文件")
+            self.log("建议重新扫描以更新统计信息")
+            return {'restored': len(restored), 'backup_dir': backup_dir}
+        
+        # 读取修复记录
+        with open(fix_log_file, 'r', encoding='utf-8') as f:
+            records = json.load(f)
+        
+        self.log("开始撤销智能修复操作...")
+        restored_count = 0
+        
+        for mod in records["modifications"]:
+            try:
+                backup_file = mod["backup_file"]
+                original_file = mod["file"]
+                
+                if os.path.exists(backup_file):
+                    # 恢复原始文件
+                    target_file = os.path.join(self.workspace_path, original_file)
+                    shutil.copy2(backup_file, target_file)
+                    restored_count += 1
+                    self.log(f"✅ 已恢复: {original_file}")
+                else:
+                    self.log(f"❌ 备份文件不存在: {backup_file}")
+            
+            except Exception as e:
+                self.log(f"❌ 恢复失败 {mod['file']}: {e}")
+        
+        self.log(f"\n撤销完成! 共恢复 {restored_count} 个文件")
+        self.log("建议重新扫描以更新统计信息")
+        return {'restored': restored_count, 'backup_dir': backup_dir}
+    
+    def export_report(self):
+        """导出分析报告，返回报告文件路径"""
+        if not self.md_files:
+            raise EngineError("请先扫描分析文件")
+        
+        report_file = os.path.join(self.workspace_path, "markdown_image_report.md")
+        
+        # 优先使用引用关系库中的数据，避免重新整理扫描结果
+        if self.reference_store:
+            stats = self.reference_store.stats()
+            image_references = self.reference_store.references()
+            invalid_images = self.reference_store.broken_refs()
+            unused_images = self.reference_store.orphan_images()
+        else:
+            referenced_local_count = len(getattr(self, 'referenced_local_images', []))
+            stats = {
+                'md_files': len(self.md_files),
+                'image_files': len(self.image_files),
+                'referenced_local_images': referenced_local_count,
+                'remote_images': len(getattr(self, 'remote_images', [])),
+                'unused_images': len(self.image_files) - referenced_local_count if referenced_local_count > 0 else len(self.unused_images),
+                'invalid_references': sum(len(imgs) for imgs in self.invalid_images.values()),
+            }
+            image_references = self.image_references
+            invalid_images = self.invalid_images
+            unused_images = self.unused_images
+        
+        with open(report_file, 'w', encoding='utf-8') as f:
+            f.write("# Markdown图片管理报告\n\n")
+            f.write(f"生成时间: {os.path.basename(__file__)}\n")
+            f.write(f"工作目录: {self.workspace_path}\n\n")
+            
+            # 统计信息
+            f.write("## 统计信息\n\n")
+            f.write(f"- MD文件总数: {stats['md_files']}\n")
+            f.write(f"- 本地图片文件总数: {stats['image_files']}\n")
+            f.write(f"- 被引用的本地图片数: {stats['referenced_local_images']}\n")
+            f.write(f"- 被引用的远程图片数: {stats['remote_images']}\n")
+            f.write(f"- 未被引用的本地图片数: {stats['unused_images']}\n")
+            f.write(f"- 无效引用数: {stats['invalid_references']}\n")
+            f.write(f"- 图片映射记录数: {len(self.image_mapping)}\n\n")
+            
+            # MD文件图片引用
+            f.write("## MD文件图片引用\n\n")
+            for md_file, images in image_references.items():
+                rel_md = self.safe_relpath(md_file, self.workspace_path)
+                f.write(f"### {rel_md}\n\n")
+                for img in images:
+                    if img.startswith('http'):
+                        f.write(f"- 🌐 {img}\n")
+                    else:
+                        rel_img = self.safe_relpath(img, self.workspace_path)
+                        f.write(f"- 🖼️ {rel_img}\n")
+                f.write("\n")
+            
+            # 无效图片引用
+            if invalid_images:
+                f.write("## 无效图片引用\n\n")
+                for md_file, invalid_imgs in invalid_images.items():
+                    rel_md = self.safe_relpath(md_file, self.workspace_path)
+                    f.write(f"### {rel_md}\n\n")
+                    for img in invalid_imgs:
+                        f.write(f"- ❌ {img}\n")
+                    f.write("\n")
+            
+            # 未被引用的图片
+            if unused_images:
+                f.write("## 未被引用的图片\n\n")
+                for img in unused_images:
+                    rel_img = self.safe_relpath(img, self.workspace_path)
+                    f.write(f"- 🗑️ {rel_img}\n")
+                f.write("\n")
+            
+            # 图片映射表
+            if self.image_mapping:
+                f.write("## 图片映射表\n\n")
+                for local_path, remote_url in self.image_mapping.items():
+                    rel_local = self.safe_relpath(local_path, self.workspace_path)
+                    f.write(f"- **本地**: {rel_local}\n")
+                    f.write(f"  **远程**: {remote_url}\n\n")
+                for remote_url, local_path in self.url_aliases.items():
+                    rel_local = self.safe_relpath(local_path, self.workspace_path)
+                    f.write(f"- **本地**: {rel_local}（内容相同的其他URL）\n")
+                    f.write(f"  **远程**: {remote_url}\n\n")
+        
+        self.log(f"报告已导出: {report_file}")
+        return report_file
+
+
+COMMANDS = {
+    'scan': '扫描分析MD文件和图片',
+    'upload': '上传图片到图床（通过PicList）',
+    'replace-remote': '替换图片链接为远程URL',
+    'replace-local': '替换图片链接为本地路径',
+    'download': '下载远程图片到本地',
+    'delete': '删除未引用和已上传的本地图片',
+    'check-links': '检查远程图片链接是否失效',
+    'smart-fix': '智能修复无效的图片路径',
+    'undo': '撤销最近一次智能修复',
+    'rollback': '回滚最近一次修改MD文件的操作（替换、下载、智能修复）',
+    'report': '导出分析报告',
+}
+
+# 支持 --dry-run 预览的命令 -> 修改计划的操作名称
+PLAN_OPERATIONS = {
+    'replace-remote': 'replace_remote',
+    'replace-local': 'replace_local',
+    'download': 'download',
+    'smart-fix': 'smart_fix',
+}
+
+
+def run_command(engine, command, dry_run=False, yes=False):
+    """执行一个命令，返回结果摘要
+
+    dry_run 为 True 时只生成修改计划，结果中的 diff 为统一差异格式的预览
+    delete 不可恢复，yes 不为 True 时只列出将删除的文件
+    """
+    if dry_run and command not in PLAN_OPERATIONS and command != 'delete':
+        raise EngineError(f"命令 {command} 不支持预览")
+    
+    # 除撤销和回滚外，所有操作都基于最新的扫描结果
+    if command not in ('undo', 'rollback'):
+        result = engine.scan()
+        if command == 'scan':
+            return result
+    
+    if command == 'delete' and (dry_run or not yes):
+        candidates = engine.deletion_candidates()
+        relpath = lambda path: engine.safe_relpath(path, engine.workspace_path).replace('\\', '/')
+        result = {key: [relpath(path) for path in paths] for key, paths in candidates.items()}
+        for path in result['unused']:
+            engine.log(f"  将删除未引用图片: {path}")
+        for path in result['uploaded']:
+            engine.log(f"  将删除已上传图片: {path}")
+        result['deleted'] = 0
+        engine.log("未删除任何文件：以上为将删除的文件，确认后加 --yes 执行（不可恢复）")
+        return result
+    
+    if dry_run:
+        operation = PLAN_OPERATIONS[command]
+        plan = engine.plan(operation)
+        result = plan.summary()
+        result['plan_file'] = engine.plan_file_path(operation)
+        result['diff'] = plan.unified_diff(lambda path: engine.safe_relpath(path, engine.workspace_path).replace('\\', '/'))
+        return result
+    
+    if command == 'upload':
+        return engine.upload()
+    if command == 'replace-remote':
+        return engine.replace_to_remote()
+    if command == 'replace-local':
+        return engine.replace_to_local()
+    if command == 'download':
+        return engine.download_images()
+    if command == 'delete':
+        return engine.delete_local_images()
+    if command == 'check-links':
+        return engine.check_links()
+    if command == 'smart-fix':
+        return engine.smart_fix_paths()
+    if command == 'undo':
+        return engine.undo_fixes()
+    if command == 'rollback':
+        engine.recover_interrupted_writes()
+        return engine.rollback_last_operation()
+    if command == 'report':
+        return {'report_file': engine.export_report()}
+    raise EngineError(f"未知命令: {command}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Markdown图片管家（命令行）",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="命令:\n" + "\n".join(f"  {name:<16}{desc}" for name, desc in COMMANDS.items()))
+    parser.add_argument('command', choices=list(COMMANDS), metavar='command', help="要执行的命令")
+    parser.add_argument('workspace', help="工作目录")
+    parser.add_argument('--mapping', help="图片映射表文件（默认为工作目录下的 image_mapping.json）")
+    parser.add_argument('--workers', type=int, default=0, help="并行解析进程数，0 表示使用CPU核心数")
+    parser.add_argument('--io-workers', type=int, default=8, help="并行读写MD文件的线程数")
+    parser.add_argument('--download-workers', type=int, default=16, help="同时下载的图片数")
+    parser.add_argument('--per-host', type=int, default=4, help="每个主机的同时连接数（下载和链接检查）")
+    parser.add_argument('--rate', type=float, default=DEFAULT_RATE,
+                        help="每个主机每秒最多请求数，0 表示不限制（Gitee 默认每秒 2 次）")
+    parser.add_argument('--piclist', default=DEFAULT_ENDPOINT, metavar='URL', help="PicList HTTP上传服务地址")
+    parser.add_argument('--piclist-key', default="", help="PicList 上传密钥")
+    parser.add_argument('--upload-batch', type=int, default=DEFAULT_BATCH_SIZE, help="每次请求上传的图片数")
+    parser.add_argument('--check-workers', type=int, default=32, help="链接检查的同时请求数")
+    parser.add_argument('--retries', type=int, default=3,
+                        help="下载遇到超时、连接中断等暂时性错误时的重试次数（指数退避，从断点续传）")
+    parser.add_argument('--cache-ttl', type=float, default=DEFAULT_TTL / 3600,
+                        help="链接检查和下载的HTTP缓存有效期（小时），0 表示每次都向服务器确认")
+    parser.add_argument('--max-size', type=float, default=DEFAULT_MAX_BYTES / 1024 / 1024,
+                        help="单张图片大小上限（MB），超过时中止下载")
+    parser.add_argument('--hardlink', action='store_true',
+                        help="下载时在MD文件旁的 images 目录建立指向图片库的硬链接（默认直接引用图片库中的文件）")
+    parser.add_argument('--ignore', action='append', metavar='PATTERN', help="扫描时跳过的目录（glob规则，可重复）")
+    parser.add_argument('--dry-run', action='store_true',
+                        help="只预览修改（输出差异并保存修改计划），再次执行同一命令时直接使用计划")
+    parser.add_argument('--yes', action='store_true', help="确认执行 delete（不加时只列出将删除的文件）")
+    parser.add_argument('--json', action='store_true', help="以JSON格式输出结果")
+    parser.add_argument('--quiet', action='store_true', help="不输出日志")
+    args = parser.parse_args(argv)
+    
+    if not os.path.isdir(args.workspace):
+        print(f"目录不存在: {args.workspace}", file=sys.stderr)
+        return 2
+    
+    # 日志写到标准错误，标准输出只留给结果；整行一次写入，多个下载线程的日志不会交错
+    log = None if args.quiet else (lambda message: (sys.stderr.write(f"{message}\n"), sys.stderr.flush()))
+    engine = MarkdownImageEngine(os.path.abspath(args.workspace), log=log)
+    engine.scan_workers = args.workers
+    engine.io_workers = args.io_workers
+    engine.download_workers = args.download_workers
+    engine.download_per_host = args.per_host
+    engine.check_workers = args.check_workers
+    engine.host_rate = args.rate
+    engine.piclist_endpoint = args.piclist
+    engine.piclist_key = args.piclist_key
+    engine.upload_batch_size = max(1, args.upload_batch)
+    engine.max_image_bytes = int(args.max_size * 1024 * 1024)
+    engine.download_retries = max(0, args.retries)
+    engine.http_cache_ttl = args.cache_ttl * 3600
+    if args.hardlink:
+        engine.download_layout = 'hardlink'
+    if args.ignore:
+        engine.ignore_patterns = list(DEFAULT_IGNORE_PATTERNS) + args.ignore
+    if args.mapping:
+        # 命令行给出的相对路径按当前目录解析
+        engine.mapping_file = os.path.abspath(args.mapping)
+    engine.load_image_mapping_with_migration()
+    
+    try:
+        result = run_command(engine, args.command, dry_run=args.dry_run, yes=args.yes)
+    except EngineError as e:
+        print(f"错误: {e}", file=sys.stderr)
+        return 1
+    finally:
+        engine.close()
+    
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+    else:
+        diff = result.pop('diff', None)
+        if diff:
+            print(diff)
+        for key, value in result.items():
+            if isinstance(value, list):
+                value = len(value)
+            print(f"{key}: {value}")
+    return 0
+
+
+if __name__ == '__main__':
+    multiprocessing.freeze_support()
+    sys.exit(main())
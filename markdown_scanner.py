@@ -0,0 +1,485 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Markdown扫描工具
+1. 提取MD文件中的图片引用
+2. 增量扫描缓存（按文件 mtime/size/inode 判断是否需要重新解析）
+3. 多进程并行解析
+4. 基于 os.scandir 的工作目录遍历（支持忽略规则）
+5. 文件存在性索引（引用检查不再逐个调用 os.path.exists）
+6. 引用索引（保存扫描结果，支持按文件增量更新）
+"""
+
+import os
+import re
+import sys
+import json
+import fnmatch
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, NamedTuple
+from image_ref_tokenizer import iter_image_refs, is_remote_path
+
+
+# 默认忽略的目录（glob规则，同时匹配目录名和相对工作目录的路径）
+DEFAULT_IGNORE_PATTERNS = [
+    '.git',
+    '.svn',
+    '.hg',
+    'node_modules',
+    '__pycache__',
+    '.backup/smart_fix_*',  # 智能修复生成的备份目录
+    '.backup/journal_*',  # 替换、下载等操作的写入日志
+]
+
+
+def normalize_path(path):
+    """统一路径分隔符，确保跨平台兼容性"""
+    if not path:
+        return path
+    
+    # 统一使用正斜杠
+    normalized = path.replace('\\\\', '/').replace('\\', '/')
+    
+    # 去除重复的分隔符
+    normalized = re.sub(r'/+', '/', normalized)
+    
+    # 去除末尾的分隔符（除非是根目录或Windows驱动器根目录）
+    if len(normalized) > 1 and normalized.endswith('/'):
+        # 保留Windows驱动器根目录的斜杠 (如 D:/)
+        if not (len(normalized) >= 3 and normalized[1:3] == ':/'):
+            normalized = normalized.rstrip('/')
+    
+    return normalized
+
+
+def resolve_ref_path(md_dir, img_path):
+    """把MD文件中的本地图片引用解析为规范化的绝对路径（相对于MD文件所在目录）"""
+    return normalize_path(os.path.normpath(os.path.join(md_dir, img_path)))
+
+
+def compile_ignore_patterns(patterns):
+    """把忽略规则编译为一个正则，没有规则时返回 None"""
+    if not patterns:
+        return None
+    flags = re.IGNORECASE if os.name == 'nt' else 0
+    return re.compile('|'.join(fnmatch.translate(p) for p in patterns), flags)
+
+
+class WalkResult(NamedTuple):
+    """工作目录遍历结果"""
+    md_files: List[str]
+    image_files: List[str]
+    md_stats: Dict[str, list]  # {md_file: stat_key}
+    pruned_dirs: List[str]     # 被忽略规则跳过的目录
+    stat_calls: int            # 遍历过程中的文件状态查询次数
+
+
+def is_ignored_path(rel_path, ignore_re):
+    """判断相对工作目录的路径本身或其上级目录是否匹配忽略规则"""
+    if not ignore_re:
+        return False
+    parts = rel_path.strip('/').split('/')
+    for i, name in enumerate(parts):
+        if ignore_re.match(name) or ignore_re.match('/'.join(parts[:i + 1])):
+            return True
+    return False
+
+
+def walk_workspace(root, image_extensions, ignore_patterns=DEFAULT_IGNORE_PATTERNS, rel_root=''):
+    """遍历工作目录，返回 WalkResult
+
+    root 需要是已规范化的路径（正斜杠分隔）。子路径直接用 '/' 拼接，
+    因此结果无需再逐个规范化；只为保留下来的文件构造路径字符串。
+    目录类型判断复用 DirEntry 的信息，MD文件的状态用于增量扫描缓存。
+    与 os.walk 一致，不进入指向目录的符号链接。
+    只遍历工作目录中的某个子目录时，rel_root 传入该子目录的相对路径，
+    以便按相对路径匹配忽略规则。
+    """
+    ignore_re = compile_ignore_patterns(ignore_patterns)
+    md_files = []
+    image_files = []
+    md_stats = {}  # {md_file: stat_key}
+    pruned_dirs = []
+    stat_calls = 0
+    
+    # 栈中保存 (目录路径, 相对路径前缀)
+    base = root.rstrip('/') if root != '/' else ''
+    stack = [(root, base, rel_root.strip('/') + '/' if rel_root.strip('/') else '')]
+    while stack:
+        dir_path, prefix, rel_prefix = stack.pop()
+        try:
+            entries = os.scandir(dir_path)
+        except OSError:
+            continue
+        
+        subdirs = []
+        with entries:
+            for entry in entries:
+                name = entry.name
+                try:
+                    if entry.is_dir():
+                        if entry.is_symlink():
+                            continue
+                        rel_path = rel_prefix + name
+                        if ignore_re and (ignore_re.match(name) or ignore_re.match(rel_path)):
+                            pruned_dirs.append(f"{prefix}/{name}")
+                            continue
+                        subdirs.append((entry.path, f"{prefix}/{name}", rel_path + '/'))
+                        continue
+                    
+                    ext = os.path.splitext(name)[1].lower()
+                    if ext == '.md':
+                        file_path = f"{prefix}/{name}"
+                        st = entry.stat()
+                        stat_calls += 1
+                        md_stats[file_path] = [st.st_mtime_ns, st.st_size, entry.inode()]
+                        md_files.append(file_path)
+                    elif ext in image_extensions:
+                        image_files.append(f"{prefix}/{name}")
+                except OSError:
+                    continue
+        
+        # 逆序入栈，保持与 os.walk 相同的目录访问顺序
+        stack.extend(reversed(subdirs))
+    
+    return WalkResult(md_files, image_files, md_stats, pruned_dirs, stat_calls)
+
+
+def is_case_insensitive_fs():
+    """Windows 和 macOS 的默认文件系统不区分大小写"""
+    return os.name == 'nt' or sys.platform == 'darwin'
+
+
+class ExistenceIndex:
+    """文件存在性索引
+
+    用遍历得到的图片文件建立哈希索引，工作目录内的图片引用直接查表，
+    只有指向工作目录之外、被忽略目录之内或非图片扩展名的引用才会访问文件系统。
+    在不区分大小写的文件系统上按小写匹配，并返回磁盘上的实际路径。
+    """
+
+    def __init__(self, root, image_files, image_extensions, pruned_dirs=(), case_insensitive=None):
+        if case_insensitive is None:
+            case_insensitive = is_case_insensitive_fs()
+        self.case_insensitive = case_insensitive
+        self.image_extensions = image_extensions
+        self.root_prefix = self._key(root).rstrip('/') + '/'
+        self.pruned_prefixes = tuple(self._key(d) + '/' for d in pruned_dirs)
+        self.files = {self._key(path): path for path in image_files}
+        self.stat_calls = 0
+
+    def _key(self, path):
+        return path.lower() if self.case_insensitive else path
+
+    def add(self, path):
+        """记录新出现的图片文件"""
+        self.files[self._key(path)] = path
+
+    def discard(self, path):
+        """移除已删除的图片文件"""
+        self.files.pop(self._key(path), None)
+
+    def resolve(self, path):
+        """返回已存在文件的路径，不存在时返回 None（path 需已规范化）"""
+        key = self._key(path)
+        if (key.startswith(self.root_prefix)
+                and not key.startswith(self.pruned_prefixes)
+                and os.path.splitext(key)[1].lower() in self.image_extensions):
+            return self.files.get(key)
+        
+        # 遍历范围之外的引用才需要访问文件系统
+        self.stat_calls += 1
+        return path if os.path.exists(path) else None
+
+
+def extract_image_refs(content):
+    """提取文档中的图片引用，返回原始路径列表（按出现顺序）"""
+    return [ref.path for ref in iter_image_refs(content)]
+
+
+def stat_key(st):
+    """由 os.stat 结果生成缓存校验键 [mtime_ns, size, inode]"""
+    return [st.st_mtime_ns, st.st_size, st.st_ino]
+
+
+def read_file_refs(md_file):
+    """读取单个MD文件并提取图片引用，返回 (校验键, 引用列表, 错误信息)"""
+    try:
+        # 先取文件状态再读取内容，读取期间的修改会在下次扫描时被发现
+        key = stat_key(os.stat(md_file))
+        with open(md_file, 'r', encoding='utf-8') as f:
+            content = f.read()
+        return key, extract_image_refs(content), None
+    except Exception as e:
+        return None, [], str(e)
+
+
+def extract_refs_batch(md_files):
+    """进程池工作函数：解析一批MD文件"""
+    return [read_file_refs(md_file) for md_file in md_files]
+
+
+def extract_refs_parallel(md_files, workers=0, batch_size=64, log=None):
+    """并行解析MD文件，结果顺序与输入顺序一致
+
+    workers 为 0 时使用CPU核心数。文件数不足两批或只有一个工作进程时
+    直接在当前线程解析，避免进程启动开销。
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1 or len(md_files) < batch_size * 2:
+        return extract_refs_batch(md_files)
+    
+    batches = [md_files[i:i + batch_size] for i in range(0, len(md_files), batch_size)]
+    results = []
+    try:
+        # 使用spawn方式创建子进程，避免在带界面的多线程进程中fork
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=min(workers, len(batches)), mp_context=context) as executor:
+            # map按提交顺序返回结果，保证输出顺序确定
+            for batch_result in executor.map(extract_refs_batch, batches):
+                results.extend(batch_result)
+    except Exception as e:
+        if log:
+            log(f"⚠️ 并行解析不可用，改为单线程解析: {e}")
+        return extract_refs_batch(md_files)
+    return results
+
+
+class ScanCache:
+    """增量扫描缓存
+
+    缓存文件保存在工作目录中，为每个MD文件记录 (mtime, size, inode)
+    以及提取出的原始图片引用。只有校验键变化的文件才需要重新读取和解析。
+    缓存的是原始引用而不是解析结果，引用是否有效仍在每次扫描时判断，
+    因此图片被移动或删除后结果与完整扫描一致。
+    """
+
+    CACHE_VERSION = 2
+
+    def __init__(self, cache_path):
+        self.cache_path = cache_path
+        self.entries = {}  # {md_file: {"stat": [...], "refs": [...]}}
+        self.dirty = False
+        self.hits = 0
+        self.misses = 0
+
+    def load(self):
+        """加载缓存文件，版本不符或文件损坏时视为空缓存"""
+        self.entries = {}
+        self.dirty = False
+        if not os.path.exists(self.cache_path):
+            return
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') == self.CACHE_VERSION:
+                self.entries = data.get('files', {})
+        except Exception:
+            self.entries = {}
+
+    def get(self, md_file, key):
+        """返回缓存的引用列表，文件有变化时返回 None"""
+        entry = self.entries.get(md_file)
+        if entry and entry.get('stat') == key:
+            self.hits += 1
+            return entry['refs']
+        self.misses += 1
+        return None
+
+    def put(self, md_file, key, refs):
+        """记录文件的解析结果"""
+        self.entries[md_file] = {'stat': key, 'refs': refs}
+        self.dirty = True
+
+    def prune(self, live_files):
+        """移除已不存在的文件的缓存记录"""
+        live = set(live_files)
+        stale = [path for path in self.entries if path not in live]
+        for path in stale:
+            del self.entries[path]
+        if stale:
+            self.dirty = True
+
+    def save(self):
+        """有变化时写回缓存文件（先写临时文件再替换）"""
+        if not self.dirty:
+            return
+        tmp_path = f"{self.cache_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': self.CACHE_VERSION, 'files': self.entries}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.cache_path)
+        self.dirty = False
+
+
+class ReferenceIndex:
+    """图片引用索引
+
+    保存一次扫描的全部结果（MD文件、图片文件、引用关系、无效引用、未引用图片），
+    并记录每个本地引用路径被哪些MD文件使用，因此单个文件的变化只需重新解析
+    该文件，图片的增删只需重新检查引用了它的MD文件。所有修改都在 lock 内进行。
+    """
+
+    def __init__(self, root, image_extensions, ignore_patterns=DEFAULT_IGNORE_PATTERNS):
+        self.root = root
+        self.image_extensions = image_extensions
+        self.ignore_patterns = ignore_patterns
+        self.ignore_re = compile_ignore_patterns(ignore_patterns)
+        self.lock = threading.RLock()
+        
+        self.md_files = []
+        self.image_files = []
+        self.file_refs = {}         # {md_file: [原始引用路径]}
+        self.image_references = {}  # {md_file: [图片绝对路径或URL]}
+        self.invalid_images = {}    # {md_file: [无效的原始引用]}
+        self.ref_targets = {}       # {本地引用的绝对路径(索引键): {md_file}}
+        self.file_targets = {}      # {md_file: {本地引用的绝对路径(索引键)}}
+        self.ref_counts = {}        # {已存在图片路径: 被引用次数}
+        self.existence_index = None
+
+    def build(self, walk, file_refs):
+        """由遍历结果和各文件的原始引用建立完整索引"""
+        with self.lock:
+            self.md_files = list(walk.md_files)
+            self.image_files = list(walk.image_files)
+            self.file_refs = {}
+            self.image_references = {}
+            self.invalid_images = {}
+            self.ref_targets = {}
+            self.file_targets = {}
+            self.ref_counts = {}
+            self.existence_index = ExistenceIndex(self.root, self.image_files, self.image_extensions, walk.pruned_dirs)
+            for md_file in self.md_files:
+                if md_file in file_refs:
+                    self.file_refs[md_file] = file_refs[md_file]
+                    self._resolve_file(md_file)
+
+    @property
+    def stat_calls(self):
+        return self.existence_index.stat_calls if self.existence_index else 0
+
+    def _resolve_file(self, md_file):
+        """解析单个MD文件的引用并登记到索引中"""
+        file_images = []
+        file_invalid = []
+        file_targets = set()
+        md_dir = os.path.dirname(md_file)
+        
+        for img_path in self.file_refs.get(md_file, []):
+            if is_remote_path(img_path):
+                # 远程图片
+                file_images.append(img_path)
+                continue
+            
+            # 相对于MD文件的路径
+            abs_img_path = resolve_ref_path(md_dir, img_path)
+            target_key = self.existence_index._key(abs_img_path)
+            self.ref_targets.setdefault(target_key, set()).add(md_file)
+            file_targets.add(target_key)
+            
+            resolved = self.existence_index.resolve(abs_img_path)
+            if resolved:
+                file_images.append(resolved)
+                self.ref_counts[resolved] = self.ref_counts.get(resolved, 0) + 1
+            else:
+                file_invalid.append(img_path)
+        
+        if file_images:
+            self.image_references[md_file] = file_images
+        if file_invalid:
+            self.invalid_images[md_file] = file_invalid
+        self.file_targets[md_file] = file_targets
+
+    def _unresolve_file(self, md_file):
+        """撤销单个MD文件在索引中的登记"""
+        for img in self.image_references.pop(md_file, []):
+            if img in self.ref_counts:
+                self.ref_counts[img] -= 1
+                if self.ref_counts[img] <= 0:
+                    del self.ref_counts[img]
+        self.invalid_images.pop(md_file, None)
+        for target_key in self.file_targets.pop(md_file, ()):
+            targets = self.ref_targets.get(target_key)
+            if targets is not None:
+                targets.discard(md_file)
+                if not targets:
+                    del self.ref_targets[target_key]
+
+    def _refresh_targets(self, path):
+        """重新检查引用了指定路径的MD文件"""
+        for md_file in list(self.ref_targets.get(self.existence_index._key(path), ())):
+            self._unresolve_file(md_file)
+            self._resolve_file(md_file)
+
+    def update_md(self, md_file, refs):
+        """新增或更新一个MD文件的引用"""
+        with self.lock:
+            if md_file in self.file_targets:
+                self._unresolve_file(md_file)
+            if md_file not in self.md_files:
+                self.md_files.append(md_file)
+            self.file_refs[md_file] = refs
+            self._resolve_file(md_file)
+
+    def remove_md(self, md_file):
+        """移除一个MD文件，返回索引是否有变化"""
+        with self.lock:
+            if md_file not in self.md_files:
+                return False
+            self._unresolve_file(md_file)
+            self.md_files.remove(md_file)
+            self.file_refs.pop(md_file, None)
+            return True
+
+    def add_image(self, path):
+        """新增一个图片文件，返回索引是否有变化"""
+        with self.lock:
+            if path in self.image_files:
+                return False
+            self.image_files.append(path)
+            self.existence_index.add(path)
+            self._refresh_targets(path)
+            return True
+
+    def remove_image(self, path):
+        """移除一个图片文件，返回索引是否有变化"""
+        with self.lock:
+            if path not in self.image_files:
+                return False
+            self.image_files.remove(path)
+            self.existence_index.discard(path)
+            self._refresh_targets(path)
+            return True
+
+    def remove_tree(self, dir_path):
+        """移除某个目录下的全部MD文件和图片，返回索引是否有变化"""
+        prefix = dir_path.rstrip('/') + '/'
+        with self.lock:
+            md_files = [p for p in self.md_files if p.startswith(prefix)]
+            images = [p for p in self.image_files if p.startswith(prefix)]
+            for md_file in md_files:
+                self.remove_md(md_file)
+            for img in images:
+                self.remove_image(img)
+            return bool(md_files or images)
+
+    def referenced_local_images(self):
+        """被引用的本地图片"""
+        with self.lock:
+            return list(self.ref_counts)
+
+    def unused_images(self):
+        """未被引用的本地图片"""
+        with self.lock:
+            return [img for img in self.image_files if img not in self.ref_counts]
+
+    def remote_images(self):
+        """去重后的远程图片URL"""
+        with self.lock:
+            remote = {}
+            for images in self.image_references.values():
+                for img in images:
+                    if is_remote_path(img):
+                        remote[img] = None
+            return list(remote)
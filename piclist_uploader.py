@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+PicList 批量上传
+通过 PicList 内置的HTTP上传服务（默认 http://127.0.0.1:36677/upload）上传图片：
+1. 一次请求上传一批文件 {"list": [本地路径, ...]}，不再每张图片启动一个进程
+2. 按顺序把返回的URL对应到每个文件
+3. 只有确定没有文件被接收（无法连接、请求被拒绝）时才重新发送：整批被拒绝时逐个重新上传；
+   超时等结果未知的情况不重试，避免在图床上重复上传
+4. 失败就是失败，不会生成占位URL写入映射表
+"""
+
+import os
+import requests
+from urllib3.exceptions import NewConnectionError
+
+DEFAULT_ENDPOINT = "http://127.0.0.1:36677/upload"
+DEFAULT_BATCH_SIZE = 20  # 每次请求上传的文件数
+
+
+class UploadError(Exception):
+    """PicList 上传服务不可用或返回了无法解析的结果"""
+
+
+class ServiceUnavailable(UploadError):
+    """无法连接 PicList 上传服务（请求没有发出）"""
+
+
+class UploadRejected(UploadError):
+    """上传服务拒绝了请求（HTTP 4xx），没有文件被接收"""
+
+
+def request_sent(error):
+    """连接错误发生时请求是否可能已经发出：连接被拒绝、DNS失败、连接超时时还没有发出"""
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return False
+    reason = getattr(error.args[0], 'reason', None) if error.args else None
+    return not isinstance(reason, NewConnectionError)
+
+
+class PicListUploader:
+    """PicList HTTP上传服务的客户端
+
+    endpoint: 上传地址
+    key: PicList 设置的上传密钥（作为 key 参数发送），没有设置时为空
+    timeout: 单次请求的超时时间（秒），一批文件共用
+    """
+
+    def __init__(self, endpoint=DEFAULT_ENDPOINT, key=None, timeout=120, session=None):
+        self.endpoint = endpoint
+        self.key = key
+        self.timeout = timeout
+        self.session = session or requests.Session()
+
+    def close(self):
+        self.session.close()
+
+    def upload_batch(self, paths):
+        """上传一批文件，返回 [(路径, URL, 错误信息)]，成功时错误信息为 None，失败时URL为 None
+
+        整批被拒绝（确定没有文件被接收）时逐个重新上传，避免一个文件连累整批；
+        其他错误（超时、服务器出错、无法解析的结果）时文件可能已经上传，不重试，每个文件都带有错误信息。
+        不抛出异常。
+        """
+        paths = list(paths)
+        if not paths:
+            return []
+        try:
+            urls = self.request(paths)
+        except UploadRejected as e:
+            if len(paths) == 1:
+                return [(paths[0], None, str(e))]
+            results = []
+            for path in paths:
+                results.extend(self.upload_batch([path]))
+            return results
+        except UploadError as e:
+            return [(path, None, str(e)) for path in paths]
+        return [(path, url, None if url else "PicList 没有返回这个文件的URL") for path, url in zip(paths, urls)]
+
+    def request(self, paths):
+        """发送一次上传请求，返回与 paths 一一对应的URL列表（某个文件失败时对应 None）"""
+        params = {'key': self.key} if self.key else None
+        try:
+            response = self.session.post(self.endpoint, json={'list': [os.path.abspath(path) for path in paths]},
+                                         params=params, timeout=self.timeout)
+        except requests.exceptions.ConnectionError as e:
+            if not request_sent(e):
+                raise ServiceUnavailable(f"无法连接 PicList 上传服务 {self.endpoint}，请确认 PicList 已启动并开启了上传服务")
+            raise UploadError(f"与 PicList 的连接中断，上传结果未知（文件可能已经上传），请在图床确认后再上传: {e}")
+        except requests.exceptions.Timeout:
+            raise UploadError("等待 PicList 响应超时，上传结果未知（文件可能已经上传），请在图床确认后再上传")
+        except requests.exceptions.RequestException as e:
+            raise UploadError(f"上传请求失败，结果未知: {e}")
+        if 400 <= response.status_code < 500:
+            raise UploadRejected(f"PicList 上传服务拒绝了请求: HTTP {response.status_code}")
+        if response.status_code != 200:
+            raise UploadError(f"PicList 上传服务返回 HTTP {response.status_code}，上传结果未知")
+        try:
+            data = response.json()
+        except ValueError:
+            raise UploadError("PicList 返回的不是JSON")
+        if not isinstance(data, dict) or not data.get('success'):
+            message = data.get('message') if isinstance(data, dict) else None
+            raise UploadError(f"PicList 上传失败: {message or '未知原因'}")
+        return self.parse_result(data, len(paths))
+
+    @staticmethod
+    def parse_result(data, count):
+        """解析成功响应中的每个文件的URL
+
+        优先使用 fullResult（每个文件一项，失败的文件没有 imgUrl），其次使用 result（URL列表）；
+        数量与上传的文件数不一致时无法确定对应关系，整批记为失败。
+        """
+        full = data.get('fullResult')
+        if isinstance(full, list) and len(full) == count:
+            return [item.get('imgUrl') if isinstance(item, dict) else None for item in full]
+        result = data.get('result')
+        if isinstance(result, str):
+            result = [result]
+        if isinstance(result, list) and len(result) == count:
+            return [url if isinstance(url, str) and url.startswith(('http://', 'https://')) else None for url in result]
+        raise UploadError(f"PicList 返回了 {len(result) if isinstance(result, list) else 0} 个结果，"
+                          f"与上传的 {count} 个文件对应不上")
+
+    def upload(self, paths, batch_size=DEFAULT_BATCH_SIZE):
+        """分批上传，逐个产出 (路径, URL, 错误信息)；不存在的文件不发送"""
+        batch = []
+        for path in paths:
+            if not os.path.isfile(path):
+                yield path, None, "文件不存在"
+                continue
+            batch.append(path)
+            if len(batch) >= batch_size:
+                yield from self.upload_batch(batch)
+                batch = []
+        if batch:
+            yield from self.upload_batch(batch)
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+按主机限流
+下载、链接检查和 Gitee 修复工具的请求都经过同一个限流器（挂在 requests.Session 上的 HTTPAdapter）：
+1. 每个主机一个令牌桶，限制每秒请求数，可以按域名单独设置（Gitee 默认更低）
+2. 自适应并发：收到 429/503 时该主机的并发上限减半，之后请求连续成功时逐步恢复
+3. 遵守 Retry-After：服务器要求的时间之前不再向该主机发送请求；需要等待太久时请求推迟（RequestDeferred），
+   调用方把这类结果报告为"推迟"而不是"失败"
+"""
+
+import time
+import threading
+import email.utils
+from urllib.parse import urlparse
+
+from requests.adapters import HTTPAdapter
+
+THROTTLE_STATUSES = (429, 503)  # 表示请求过多、需要放慢的状态码
+DEFAULT_RATE = 10.0  # 每个主机每秒请求数
+DEFAULT_HOST_RATES = {'gitee.com': 2.0}  # 按域名（含子域名）单独设置的每秒请求数
+MAX_WAIT = 60.0  # 需要等待超过这个时间（秒）的请求推迟
+DEFAULT_PENALTY = 2.0  # 没有 Retry-After 时的等待时间（秒），连续被限流时加倍
+
+
+def url_host(url):
+    """URL的主机部分（小写），用于按主机排队、限流和复用连接"""
+    return urlparse(url).netloc.lower()
+
+
+def parse_retry_after(value):
+    """解析 Retry-After（秒数或HTTP日期），返回需要等待的秒数，没有或无法解析时返回 None"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+class RequestDeferred(Exception):
+    """主机要求等待的时间过长，请求推迟到以后"""
+
+    def __init__(self, host, wait):
+        super().__init__(f"{host} 要求等待 {wait:.0f} 秒" if wait >= 1 else f"{host} 请求过多，已被限流")
+        self.host = host
+        self.wait = wait
+
+
+class RateLimiter:
+    """按主机的令牌桶和自适应并发上限（线程安全）
+
+    rate: 每个主机每秒请求数，0 表示不限制
+    host_rates: {域名: 每秒请求数}，匹配域名本身和子域名
+    max_concurrency: 每个主机并发上限的最大值，被限流后从这里减半，成功后逐步恢复
+    max_wait: 需要等待超过这个时间（秒）时抛出 RequestDeferred
+    """
+
+    def __init__(self, rate=DEFAULT_RATE, host_rates=None, max_concurrency=4, max_wait=MAX_WAIT):
+        self.rate = rate
+        self.host_rates = dict(DEFAULT_HOST_RATES if host_rates is None else host_rates)
+        self.max_concurrency = max_concurrency
+        self.max_wait = max_wait
+        self.lock = threading.Lock()
+        self.hosts = {}  # host -> 状态
+
+    def rate_for(self, host):
+        hostname = host.split(':')[0]
+        for domain, rate in self.host_rates.items():
+            if hostname == domain or hostname.endswith('.' + domain):
+                return rate
+        return self.rate
+
+    def _state(self, host):
+        state = self.hosts.get(host)
+        if state is None:
+            state = self.hosts[host] = {
+                'tokens': 1.0, 'updated': time.monotonic(), 'blocked_until': 0.0,
+                'concurrency': self.max_concurrency, 'successes': 0, 'penalty': DEFAULT_PENALTY, 'throttled': 0,
+            }
+        return state
+
+    def acquire(self, host):
+        """取得向主机发送一个请求的许可，必要时等待；需要等待超过 max_wait 时抛出 RequestDeferred"""
+        while True:
+            with self.lock:
+                state = self._state(host)
+                now = time.monotonic()
+                rate = self.rate_for(host)
+                if state['blocked_until'] > now:
+                    wait = state['blocked_until'] - now
+                elif rate <= 0:
+                    return
+                else:
+                    # 按经过的时间补充令牌，最多攒够一秒的量
+                    burst = max(1.0, rate)
+                    state['tokens'] = min(burst, state['tokens'] + (now - state['updated']) * rate)
+                    state['updated'] = now
+                    if state['tokens'] >= 1:
+                        state['tokens'] -= 1
+                        return
+                    wait = (1 - state['tokens']) / rate
+            if wait > self.max_wait:
+                raise RequestDeferred(host, wait)
+            time.sleep(wait)
+
+    def record(self, host, status, retry_after=None):
+        """根据响应状态调整主机的限制"""
+        with self.lock:
+            state = self._state(host)
+            if status in THROTTLE_STATUSES:
+                delay = parse_retry_after(retry_after)
+                if delay is None:
+                    delay = state['penalty']
+                    state['penalty'] = min(state['penalty'] * 2, self.max_wait)
+                state['blocked_until'] = max(state['blocked_until'], time.monotonic() + delay)
+                state['concurrency'] = max(1, state['concurrency'] // 2)
+                state['successes'] = 0
+                state['throttled'] += 1
+            else:
+                # 连续成功的请求数达到当前并发上限的4倍时，上限加一
+                state['penalty'] = DEFAULT_PENALTY
+                state['successes'] += 1
+                if state['concurrency'] < self.max_concurrency and state['successes'] >= state['concurrency'] * 4:
+                    state['concurrency'] += 1
+                    state['successes'] = 0
+
+    def concurrency(self, host):
+        """主机当前的并发上限"""
+        with self.lock:
+            return min(self._state(host)['concurrency'], self.max_concurrency)
+
+    def throttled_hosts(self):
+        """被限流过的主机 {host: 次数}"""
+        with self.lock:
+            return {host: state['throttled'] for host, state in self.hosts.items() if state['throttled']}
+
+
+class RateLimitedAdapter(HTTPAdapter):
+    """发送前向限流器取得许可、收到响应后反馈状态的 HTTPAdapter（重定向的每一跳都经过限流）"""
+
+    def __init__(self, limiter, **kwargs):
+        self.limiter = limiter
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        host = url_host(request.url)
+        self.limiter.acquire(host)
+        response = super().send(request, **kwargs)
+        self.limiter.record(host, response.status_code, response.headers.get('Retry-After'))
+        return response
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+图片引用关系库
+用 SQLite 持久保存扫描结果：MD文件、本地图片、远程URL以及引用关系。
+引用表同时按MD文件和引用目标建立索引，既能查询"某个文件引用了哪些图片"，
+也能反查"哪些文件引用了某张图片/某个URL"，程序关闭后结果依然保留。
+"""
+
+import sqlite3
+import threading
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS md_files (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS images (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS remote_urls (
+    id INTEGER PRIMARY KEY,
+    url TEXT NOT NULL UNIQUE
+);
+-- kind: local（已存在的本地图片）/ remote（远程URL）/ broken（无效引用）
+-- target: local 为图片绝对路径，remote 为URL，broken 为原始引用文本
+CREATE TABLE IF NOT EXISTS refs (
+    md_id INTEGER NOT NULL REFERENCES md_files(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    target TEXT NOT NULL,
+    PRIMARY KEY (md_id, position)
+);
+CREATE INDEX IF NOT EXISTS idx_refs_target ON refs(kind, target);
+'''
+
+LOCAL = 'local'
+REMOTE = 'remote'
+BROKEN = 'broken'
+
+
+class ReferenceStore:
+    """基于 SQLite 的引用关系库（线程安全）"""
+
+    SCHEMA_VERSION = 1
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute('PRAGMA foreign_keys = ON')
+        self.conn.execute('PRAGMA journal_mode = WAL')
+        self.conn.execute('PRAGMA synchronous = NORMAL')
+        self._init_schema()
+
+    def _init_schema(self):
+        with self.lock, self.conn:
+            version = self.conn.execute('PRAGMA user_version').fetchone()[0]
+            if version not in (0, self.SCHEMA_VERSION):
+                # 结构不兼容时重建，库中只有可重新扫描得到的数据
+                for table in ('refs', 'md_files', 'images', 'remote_urls'):
+                    self.conn.execute(f'DROP TABLE IF EXISTS {table}')
+            self.conn.executescript(SCHEMA)
+            self.conn.execute(f'PRAGMA user_version = {self.SCHEMA_VERSION}')
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    # ---------- 写入 ----------
+
+    @staticmethod
+    def file_edges(index, md_file):
+        """由引用索引得到某个MD文件的引用边 [(kind, target)]，保持文档顺序"""
+        edges = []
+        for img in index.image_references.get(md_file, []):
+            if img in index.ref_counts:
+                edges.append((LOCAL, img))
+            else:
+                edges.append((REMOTE, img))
+        for raw_path in index.invalid_images.get(md_file, []):
+            edges.append((BROKEN, raw_path))
+        return edges
+
+    def sync_from_index(self, index):
+        """把引用索引增量写入数据库，只改动有变化的文件，返回变化的文件数"""
+        with index.lock:
+            md_files = list(index.md_files)
+            image_files = list(index.image_files)
+            edges_by_file = {md_file: self.file_edges(index, md_file) for md_file in md_files}
+
+        with self.lock, self.conn:
+            cur = self.conn.cursor()
+
+            # MD文件
+            existing = dict(cur.execute('SELECT path, id FROM md_files'))
+            removed = [existing[p] for p in existing.keys() - set(md_files)]
+            cur.executemany('DELETE FROM md_files WHERE id = ?', [(i,) for i in removed])
+            cur.executemany('INSERT OR IGNORE INTO md_files(path) VALUES (?)',
+                            [(p,) for p in md_files if p not in existing])
+            md_ids = dict(cur.execute('SELECT path, id FROM md_files'))
+
+            # 引用边：与库中已有的比较，只替换有变化的文件
+            old_edges = {}
+            for md_id, kind, target in cur.execute('SELECT md_id, kind, target FROM refs ORDER BY md_id, position'):
+                old_edges.setdefault(md_id, []).append((kind, target))
+            changed = 0
+            for md_file, edges in edges_by_file.items():
+                md_id = md_ids[md_file]
+                if old_edges.get(md_id, []) == edges:
+                    continue
+                changed += 1
+                cur.execute('DELETE FROM refs WHERE md_id = ?', (md_id,))
+                cur.executemany('INSERT INTO refs(md_id, position, kind, target) VALUES (?, ?, ?, ?)',
+                                [(md_id, pos, kind, target) for pos, (kind, target) in enumerate(edges)])
+
+            # 本地图片
+            existing_images = {row[0] for row in cur.execute('SELECT path FROM images')}
+            current_images = set(image_files)
+            cur.executemany('DELETE FROM images WHERE path = ?', [(p,) for p in existing_images - current_images])
+            cur.executemany('INSERT OR IGNORE INTO images(path) VALUES (?)',
+                            [(p,) for p in image_files if p not in existing_images])
+
+            # 远程URL（只保留仍被引用的）
+            cur.execute('DELETE FROM remote_urls WHERE url NOT IN (SELECT target FROM refs WHERE kind = ?)', (REMOTE,))
+            cur.execute('INSERT OR IGNORE INTO remote_urls(url) '
+                        'SELECT DISTINCT target FROM refs WHERE kind = ?', (REMOTE,))
+            return changed + len(removed)
+
+    # ---------- 查询 ----------
+
+    def md_files(self):
+        with self.lock:
+            return [row[0] for row in self.conn.execute('SELECT path FROM md_files ORDER BY id')]
+
+    def image_files(self):
+        with self.lock:
+            return [row[0] for row in self.conn.execute('SELECT path FROM images ORDER BY id')]
+
+    def remote_urls(self):
+        with self.lock:
+            return [row[0] for row in self.conn.execute('SELECT url FROM remote_urls ORDER BY id')]
+
+    def references(self):
+        """{md_file: [图片绝对路径或URL]}，与扫描得到的 image_references 相同"""
+        return self._edges_by_file((LOCAL, REMOTE))
+
+    def broken_refs(self):
+        """{md_file: [无效的原始引用]}，与扫描得到的 invalid_images 相同"""
+        return self._edges_by_file((BROKEN,))
+
+    def remote_refs(self):
+        """{md_file: [远程URL]}"""
+        return self._edges_by_file((REMOTE,))
+
+    def _edges_by_file(self, kinds):
+        placeholders = ','.join('?' * len(kinds))
+        result = {}
+        with self.lock:
+            rows = self.conn.execute(
+                f'SELECT m.path, r.target FROM refs r JOIN md_files m ON m.id = r.md_id '
+                f'WHERE r.kind IN ({placeholders}) ORDER BY m.id, r.position', kinds)
+            for md_file, target in rows:
+                result.setdefault(md_file, []).append(target)
+        return result
+
+    def orphan_images(self):
+        """未被任何MD文件引用的本地图片"""
+        with self.lock:
+            return [row[0] for row in self.conn.execute(
+                'SELECT path FROM images i WHERE NOT EXISTS '
+                '(SELECT 1 FROM refs r WHERE r.kind = ? AND r.target = i.path) ORDER BY id', (LOCAL,))]
+
+    def referenced_images(self):
+        """被引用的本地图片"""
+        with self.lock:
+            return [row[0] for row in self.conn.execute(
+                'SELECT path FROM images i WHERE EXISTS '
+                '(SELECT 1 FROM refs r WHERE r.kind = ? AND r.target = i.path) ORDER BY id', (LOCAL,))]
+
+    def files_referencing(self, targets):
+        """反查引用了任一目标（本地图片路径或URL）的MD文件，按扫描顺序返回"""
+        targets = list(targets)
+        result = []
+        with self.lock:
+            seen = set()
+            # 分批查询，避免超过 SQLite 参数个数上限
+            for i in range(0, len(targets), 500):
+                chunk = targets[i:i + 500]
+                placeholders = ','.join('?' * len(chunk))
+                for md_id, path in self.conn.execute(
+                        f'SELECT DISTINCT m.id, m.path FROM refs r JOIN md_files m ON m.id = r.md_id '
+                        f'WHERE r.kind IN (?, ?) AND r.target IN ({placeholders})', [LOCAL, REMOTE] + chunk):
+                    if md_id not in seen:
+                        seen.add(md_id)
+                        result.append((md_id, path))
+        return [path for _, path in sorted(result)]
+
+    def stats(self):
+        """统计信息"""
+        with self.lock:
+            def count(sql, *args):
+                return self.conn.execute(sql, args).fetchone()[0]
+            return {
+                'md_files': count('SELECT COUNT(*) FROM md_files'),
+                'image_files': count('SELECT COUNT(*) FROM images'),
+                'referenced_local_images': count(
+                    'SELECT COUNT(*) FROM images i WHERE EXISTS '
+                    '(SELECT 1 FROM refs r WHERE r.kind = ? AND r.target = i.path)', LOCAL),
+                'remote_images': count('SELECT COUNT(*) FROM remote_urls'),
+                'unused_images': count(
+                    'SELECT COUNT(*) FROM images i WHERE NOT EXISTS '
+                    '(SELECT 1 FROM refs r WHERE r.kind = ? AND r.target = i.path)', LOCAL),
+                'invalid_references': count('SELECT COUNT(*) FROM refs WHERE kind = ?', BROKEN),
+            }
@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+分析结果视图
+分析结果和映射表先整理成内存中的行列表，界面只渲染当前可见的一屏，
+无论结果有多少行，每次刷新的界面开销都相同。
+支持按类型筛选（未引用、无效、远程）和关键字搜索（匹配图片路径或MD文件）。
+"""
+
+import tkinter as tk
+from tkinter import ttk
+import tkinter.font as tkfont
+
+# 行类型，每行为 (kind, md_file, value)
+HEADER = 'header'
+MD = 'md'
+LOCAL = 'local'
+REMOTE = 'remote'
+INVALID = 'invalid'
+ORPHAN = 'orphan'
+STAT = 'stat'
+BLANK = 'blank'
+MAP_LOCAL = 'map_local'
+MAP_REMOTE = 'map_remote'
+SEPARATOR = 'separator'
+
+# 筛选方式
+FILTER_ALL = '全部'
+FILTER_ORPHANS = '未引用图片'
+FILTER_INVALID = '无效引用'
+FILTER_REMOTE = '远程图片'
+FILTERS = [FILTER_ALL, FILTER_ORPHANS, FILTER_INVALID, FILTER_REMOTE]
+
+
+def build_analysis_rows(engine, mode=FILTER_ALL):
+    """按筛选方式把引擎的分析结果整理为行列表"""
+    rows = []
+    if mode in (FILTER_ALL, FILTER_REMOTE):
+        if mode == FILTER_ALL:
+            rows.append((HEADER, None, "=== MD文件图片引用分析 ==="))
+            rows.append((BLANK, None, ""))
+        for md_file, images in engine.image_references.items():
+            if mode == FILTER_REMOTE:
+                images = [img for img in images if img.startswith('http')]
+                if not images:
+                    continue
+            rows.append((MD, md_file, md_file))
+            for img in images:
+                rows.append((REMOTE if img.startswith('http') else LOCAL, md_file, img))
+            rows.append((BLANK, md_file, ""))
+
+    if mode in (FILTER_ALL, FILTER_INVALID) and engine.invalid_images:
+        rows.append((HEADER, None, "=== 无效图片引用 ==="))
+        rows.append((BLANK, None, ""))
+        for md_file, invalid_imgs in engine.invalid_images.items():
+            rows.append((MD, md_file, md_file))
+            for img in invalid_imgs:
+                rows.append((INVALID, md_file, img))
+            rows.append((BLANK, md_file, ""))
+
+    if mode in (FILTER_ALL, FILTER_ORPHANS) and engine.unused_images:
+        rows.append((HEADER, None, "=== 未被引用的图片 ==="))
+        rows.append((BLANK, None, ""))
+        for img in engine.unused_images:
+            rows.append((ORPHAN, None, img))
+
+    if mode == FILTER_ALL:
+        # 使用referenced_local_images的实际大小，因为路径匹配可能有问题
+        referenced_local_count = len(engine.referenced_local_images)
+        unused_count = len(engine.image_files) - referenced_local_count if referenced_local_count > 0 else len(engine.unused_images)
+        rows.append((BLANK, None, ""))
+        for text in ("=== 统计信息 ===",
+                     f"MD文件总数: {len(engine.md_files)}",
+                     f"本地图片文件总数: {len(engine.image_files)}",
+                     f"被引用的本地图片数: {referenced_local_count}",
+                     f"被引用的远程图片数: {len(engine.remote_images)}",
+                     f"未被引用的本地图片数: {unused_count}",
+                     f"无效引用数: {sum(len(imgs) for imgs in engine.invalid_images.values())}",
+                     f"图片映射记录数: {len(engine.image_mapping)}"):
+            rows.append((STAT, None, text))
+    return rows
+
+
+def build_mapping_rows(image_mapping, query=''):
+    """把映射表整理为行列表，每条记录占三行"""
+    query = query.strip().lower()
+    rows = []
+    for local_path, remote_url in image_mapping.items():
+        if query and query not in local_path.lower() and query not in remote_url.lower():
+            continue
+        rows.append((MAP_LOCAL, None, local_path))
+        rows.append((MAP_REMOTE, None, remote_url))
+        rows.append((SEPARATOR, None, "-" * 80))
+    return rows
+
+
+def filter_rows(rows, query, relpath=lambda path: path):
+    """按关键字筛选行：图片路径或所属MD文件包含关键字即保留，并带上所属MD文件的标题行
+
+    relpath 用于去掉工作目录前缀，避免关键字匹配到所有行共有的目录部分
+    """
+    query = query.strip().lower()
+    if not query:
+        return rows
+
+    result = []
+    last_md = None
+    md_matches = {}
+    for row in rows:
+        kind, md_file, value = row
+        if kind in (HEADER, BLANK, STAT):
+            continue
+        if md_file is not None:
+            md_match = md_matches.get(md_file)
+            if md_match is None:
+                md_match = md_matches[md_file] = query in relpath(md_file).lower()
+        else:
+            md_match = False
+        if kind == MD:
+            if md_match:
+                result.append(row)
+                last_md = md_file
+            continue
+        if md_match or query in relpath(value).lower():
+            if md_file is not None and md_file != last_md:
+                result.append((MD, md_file, md_file))
+                last_md = md_file
+            result.append(row)
+    return result
+
+
+def make_root_stripper(root):
+    """返回去掉工作目录前缀的函数（只做字符串处理，供搜索使用）"""
+    prefix = root.replace('\\', '/').rstrip('/') + '/'
+    return lambda path: path[len(prefix):] if path.startswith(prefix) else path
+
+
+def make_row_formatter(relpath):
+    """返回把行转换为显示文本的函数，只对可见行调用"""
+    def format_row(row):
+        kind, md_file, value = row
+        if kind == MD:
+            return f"📄 {relpath(value)}"
+        if kind == LOCAL:
+            return f"  🖼️  {relpath(value)}"
+        if kind == REMOTE:
+            return f"  🌐 {value}"
+        if kind == INVALID:
+            return f"  ❌ {value}"
+        if kind == ORPHAN:
+            return f"🗑️  {relpath(value)}"
+        if kind == MAP_LOCAL:
+            return f"本地: {value}"
+        if kind == MAP_REMOTE:
+            return f"远程: {value}"
+        return value
+    return format_row
+
+
+class VirtualListView(ttk.Frame):
+    """只渲染可见行的只读文本列表
+
+    rows 保存在内存中，滚动时替换文本框中的一屏内容，
+    滚动条按行号换算位置，不依赖文本框中的实际内容。
+    """
+
+    def __init__(self, master, **kwargs):
+        super().__init__(master, **kwargs)
+        self.rows = []
+        self.format_row = str
+        self.offset = 0
+
+        self.text = tk.Text(self, height=15, width=80, wrap=tk.NONE, state=tk.DISABLED)
+        self.vbar = ttk.Scrollbar(self, orient=tk.VERTICAL, command=self.on_scrollbar)
+        self.hbar = ttk.Scrollbar(self, orient=tk.HORIZONTAL, command=self.text.xview)
+        self.text.configure(xscrollcommand=self.hbar.set)
+        self.text.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+        self.vbar.grid(row=0, column=1, sticky=(tk.N, tk.S))
+        self.hbar.grid(row=1, column=0, sticky=(tk.W, tk.E))
+        self.columnconfigure(0, weight=1)
+        self.rowconfigure(0, weight=1)
+
+        self.line_height = max(1, tkfont.nametofont(self.text.cget('font')).metrics('linespace'))
+        self.text.bind('<Configure>', lambda event: self.render())
+        self.text.bind('<MouseWheel>', self.on_mousewheel)
+        self.text.bind('<Button-4>', lambda event: self.scroll(-3))
+        self.text.bind('<Button-5>', lambda event: self.scroll(3))
+        self.text.bind('<Prior>', lambda event: self.scroll(-self.page_size()))
+        self.text.bind('<Next>', lambda event: self.scroll(self.page_size()))
+        self.text.bind('<Home>', lambda event: self.scroll_to(0))
+        self.text.bind('<End>', lambda event: self.scroll_to(len(self.rows)))
+
+    def set_rows(self, rows, format_row=None, keep_position=False):
+        """替换显示的行"""
+        self.rows = rows
+        if format_row:
+            self.format_row = format_row
+        if not keep_position:
+            self.offset = 0
+        self.render()
+
+    def page_size(self):
+        """一屏可以显示的行数"""
+        height = self.text.winfo_height()
+        if height <= 1:
+            height = int(self.text.cget('height')) * self.line_height
+        return max(1, height // self.line_height)
+
+    def scroll(self, delta):
+        self.scroll_to(self.offset + delta)
+        return 'break'
+
+    def scroll_to(self, offset):
+        self.offset = max(0, min(offset, len(self.rows) - self.page_size()))
+        self.render()
+        return 'break'
+
+    def on_mousewheel(self, event):
+        return self.scroll(-3 if event.delta > 0 else 3)
+
+    def on_scrollbar(self, action, value, units=None):
+        if action == tk.MOVETO:
+            self.scroll_to(int(float(value) * len(self.rows)))
+        elif action == tk.SCROLL:
+            step = self.page_size() if units == tk.PAGES else 1
+            self.scroll(int(value) * step)
+
+    def render(self):
+        """只把当前可见的行写入文本框"""
+        page = self.page_size()
+        self.offset = max(0, min(self.offset, len(self.rows) - page))
+        visible = self.rows[self.offset:self.offset + page]
+
+        self.text.configure(state=tk.NORMAL)
+        self.text.delete(1.0, tk.END)
+        self.text.insert(tk.END, "\n".join(self.format_row(row) for row in visible))
+        self.text.configure(state=tk.DISABLED)
+
+        if self.rows:
+            self.vbar.set(self.offset / len(self.rows), min(1.0, (self.offset + page) / len(self.rows)))
+        else:
+            self.vbar.set(0.0, 1.0)
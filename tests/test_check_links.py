@@ -0,0 +1,64 @@
+import socket
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+
+from markdown_image_engine import MarkdownImageEngine
+
+
+class Handler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_HEAD(self):
+        if self.path.startswith('/slow'):
+            time.sleep(1)
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/png')
+        self.end_headers()
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_port}'
+    server.shutdown()
+
+
+def closed_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def check(root, urls, per_host=1):
+    (root / 'note.md').write_text(''.join(f'![]({url})\n' for url in urls), encoding='utf-8')
+    engine = MarkdownImageEngine(str(root))
+    engine.check_timeout = 0.3
+    engine.download_per_host = per_host
+    try:
+        engine.scan()
+        return engine.check_links()
+    finally:
+        engine.close()
+
+
+def test_read_timeout_only_breaks_that_url(tmp_path, server):
+    urls = [f'{server}/slow.png'] + [f'{server}/ok{i}.png' for i in range(6)]
+    result = check(tmp_path, urls)
+    assert [link['url'] for link in result['broken']] == [urls[0]]
+    assert result['unchecked'] == []
+
+
+@pytest.mark.parametrize('per_host', [1, 4])
+def test_refused_host_leaves_every_url_unchecked(tmp_path, per_host):
+    base = f'http://127.0.0.1:{closed_port()}'
+    urls = [f'{base}/{i}.png' for i in range(8)]
+    result = check(tmp_path, urls, per_host)
+    # 不论有几个线程先请求到这个主机，结果都一样
+    assert result['broken'] == []
+    assert sorted(link['url'] for link in result['unchecked']) == sorted(urls)
+    assert all(link['error'] for link in result['unchecked'])
@@ -0,0 +1,101 @@
+import threading
+import time
+
+import pytest
+
+from download_scheduler import DownloadScheduler
+
+
+class Recorder:
+    """记录每次 fetch 调用和每个主机的最大同时下载数"""
+
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.calls = []
+        self.active = {}
+        self.peak = {}
+        self.running = 0
+        self.peak_total = 0
+
+    def __call__(self, url, target, session):
+        host = url.split('/')[2]
+        with self.lock:
+            self.calls.append(target)
+            self.active[host] = self.active.get(host, 0) + 1
+            self.peak[host] = max(self.peak.get(host, 0), self.active[host])
+            self.running += 1
+            self.peak_total = max(self.peak_total, self.running)
+        time.sleep(self.delay)
+        with self.lock:
+            self.active[host] -= 1
+            self.running -= 1
+        if 'fail' in url:
+            raise OSError('boom')
+        return f'ok:{target}'
+
+
+def urls(host, count):
+    return {f'{host}/{i}': f'http://{host}/{i}.png' for i in range(count)}
+
+
+def test_per_host_and_global_limits():
+    fetch = Recorder()
+    scheduler = DownloadScheduler(fetch, max_workers=5, per_host=2)
+    for host in ('a.test', 'b.test', 'c.test'):
+        scheduler.add_group(urls(host, 6), lambda results: None)
+    scheduler.join()
+
+    assert len(fetch.calls) == 18
+    assert sorted(fetch.peak) == ['a.test', 'b.test', 'c.test']
+    assert max(fetch.peak.values()) == 2
+    assert fetch.peak_total <= 5
+
+
+def test_shared_target_is_fetched_once():
+    fetch = Recorder()
+    scheduler = DownloadScheduler(fetch, max_workers=4, per_host=4)
+    seen = []
+    shared = {'shared': 'http://a.test/shared.png'}
+    scheduler.add_group({**shared, 'x': 'http://a.test/x.png'}, seen.append)
+    scheduler.add_group({**shared, 'y': 'http://fail.test/y.png'}, seen.append)
+    scheduler.join()
+
+    assert sorted(fetch.calls) == ['shared', 'x', 'y']
+    # 两组都拿到共享目标的结果，下载出错的目标结果为 False
+    assert sorted(seen, key=sorted) == [{'shared': 'ok:shared', 'x': 'ok:x'}, {'shared': 'ok:shared', 'y': False}]
+    assert scheduler.results() == {'shared': 'ok:shared', 'x': 'ok:x', 'y': False}
+
+
+def test_group_of_finished_targets_completes_immediately():
+    fetch = Recorder(delay=0)
+    scheduler = DownloadScheduler(fetch, max_workers=2, per_host=2)
+    done = threading.Event()
+    scheduler.add_group(urls('a.test', 2), lambda results: done.set())
+    assert done.wait(5)
+
+    # 目标都已完成：在 add_group 中直接回调，不再下载
+    seen = []
+    scheduler.add_group(urls('a.test', 2), seen.append)
+    assert seen == [{'a.test/0': 'ok:a.test/0', 'a.test/1': 'ok:a.test/1'}]
+    scheduler.add_group({}, seen.append)
+    assert seen[-1] == {}
+    scheduler.join()
+    assert len(fetch.calls) == 2
+
+
+def test_callback_error_is_raised_in_join():
+    fetch = Recorder(delay=0.01)
+    scheduler = DownloadScheduler(fetch, max_workers=2, per_host=1)
+    seen = []
+
+    def broken(results):
+        raise ValueError('callback failed')
+
+    scheduler.add_group(urls('a.test', 2), broken)
+    scheduler.add_group(urls('b.test', 2), seen.append)
+    with pytest.raises(ValueError, match='callback failed'):
+        scheduler.join()
+    # 其他组的回调照常执行，所有下载都已完成
+    assert len(seen) == 1
+    assert len(scheduler.results()) == 4
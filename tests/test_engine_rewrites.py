@@ -0,0 +1,165 @@
+import os
+
+from markdown_image_engine import MarkdownImageEngine
+
+URL = 'https://img.example.com/a.png'
+
+
+def make_engine(root):
+    engine = MarkdownImageEngine(str(root))
+    engine.mapping_file = str(root / 'mapping.json')
+    return engine
+
+
+def setup_workspace(root):
+    (root / 'img').mkdir()
+    (root / 'img' / 'a.png').write_bytes(b'\x89PNG\r\n\x1a\n')
+    note = root / 'note.md'
+    note.write_text('![](img/a.png)\n', encoding='utf-8')
+    engine = make_engine(root)
+    engine.scan()
+    engine.image_mapping = {engine.image_files[0]: URL}
+    engine.save_mapping()
+    return engine, note
+
+
+def test_rewrites_in_one_session_see_previous_rewrite(tmp_path):
+    engine, note = setup_workspace(tmp_path)
+    assert engine.replace_to_remote()['files_changed'] == 1
+    assert note.read_text(encoding='utf-8') == f'![]({URL})\n'
+    assert engine.remote_images == [URL]
+
+    assert engine.replace_to_local()['files_changed'] == 1
+    assert note.read_text(encoding='utf-8') == '![](img/a.png)\n'
+    engine.close()
+
+
+def test_rewrite_after_loading_saved_results(tmp_path):
+    engine, note = setup_workspace(tmp_path)
+    engine.replace_to_remote()
+    engine.close()
+
+    # 重新打开（界面重启）：只加载保存的结果，不扫描
+    engine = make_engine(tmp_path)
+    engine.load_mapping()
+    assert engine.load_saved_results()
+    assert engine.replace_to_local()['files_changed'] == 1
+    assert engine.replace_to_remote()['files_changed'] == 1
+    assert note.read_text(encoding='utf-8') == f'![]({URL})\n'
+    engine.close()
+
+
+PNG = b'\x89PNG\r\n\x1a\n' + b'\x00' * 64
+
+
+def test_edit_during_download_is_kept(tmp_path):
+    import threading
+    from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+    release = threading.Event()
+    requested = threading.Event()
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            requested.set()
+            release.wait(5)
+            self.send_response(200)
+            self.send_header('Content-Type', 'image/png')
+            self.send_header('Content-Length', str(len(PNG)))
+            self.end_headers()
+            self.wfile.write(PNG)
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{server.server_port}/a.png'
+    note = tmp_path / 'note.md'
+    note.write_text(f'![]({url})\n', encoding='utf-8')
+    engine = make_engine(tmp_path)
+    engine.scan()
+
+    result = {}
+    worker = threading.Thread(target=lambda: result.update(engine.download_images()))
+    worker.start()
+    try:
+        assert requested.wait(5)
+        # 下载进行中用户编辑了文件
+        note.write_text(f'# 标题\n\n![]({url})\n', encoding='utf-8')
+    finally:
+        release.set()
+        worker.join(10)
+        server.shutdown()
+        engine.close()
+
+    assert result['files_changed'] == 1
+    content = note.read_text(encoding='utf-8')
+    assert content.startswith('# 标题\n\n![](assets/')
+    assert url not in content
+
+
+def test_identical_images_keep_every_url(tmp_path):
+    import threading
+    from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header('Content-Type', 'image/png')
+            self.send_header('Content-Length', str(len(PNG)))
+            self.end_headers()
+            self.wfile.write(PNG)
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f'http://127.0.0.1:{server.server_port}'
+    urls = [f'{base}/a.png', f'{base}/b.png']
+    (tmp_path / 'a.md').write_text(f'![]({urls[0]})\n', encoding='utf-8')
+    (tmp_path / 'b.md').write_text(f'![]({urls[1]})\n', encoding='utf-8')
+    engine = make_engine(tmp_path)
+    try:
+        engine.scan()
+        assert engine.download_images()['files_changed'] == 2
+    finally:
+        server.shutdown()
+        engine.close()
+
+    # 两个URL共用图片库中的同一个文件，都能反查到它
+    engine = make_engine(tmp_path)
+    engine.load_mapping()
+    local_by_url = engine.url_to_local()
+    assert set(local_by_url) == set(urls)
+    assert len(set(local_by_url.values())) == 1
+    assert len(engine.image_mapping) == 1
+
+    (tmp_path / 'c.md').write_text(f'![]({urls[1]})\n', encoding='utf-8')
+    engine.scan()
+    assert engine.replace_to_local()['files_changed'] == 1
+    assert (tmp_path / 'c.md').read_text(encoding='utf-8') == (tmp_path / 'b.md').read_text(encoding='utf-8')
+    engine.close()
+
+
+def test_mapping_is_resolved_against_workspace(tmp_path, monkeypatch):
+    import json
+    workspace = tmp_path / 'notes'
+    elsewhere = tmp_path / 'elsewhere'
+    workspace.mkdir()
+    elsewhere.mkdir()
+    monkeypatch.chdir(elsewhere)
+    local = str(workspace / 'img' / 'a.png').replace('\\', '/')
+    (workspace / 'image_mapping.json').write_text(json.dumps({local: URL}), encoding='utf-8')
+    (workspace / 'image_mapping.aliases.json').write_text(json.dumps({URL + '?v=2': local}), encoding='utf-8')
+
+    engine = MarkdownImageEngine(str(workspace))
+    engine.load_mapping()
+    assert engine.url_to_local() == {URL: engine.normalize_path(local), URL + '?v=2': engine.normalize_path(local)}
+    engine.url_aliases = {}
+    engine.save_mapping()
+    engine.close()
+    # 读写的都是工作目录下的映射表，当前目录下不产生文件
+    assert os.listdir(elsewhere) == []
+    assert not (workspace / 'image_mapping.aliases.json').exists()
@@ -0,0 +1,87 @@
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+
+from gitee_image_fixer import GiteeImageFixer, ORIGINAL_RULE, repo_prefix
+from rate_limiter import RateLimiter
+
+
+class Handler(BaseHTTPRequestHandler):
+    """/raw/master/ 下的图片响应慢，good 开头的才存在；/raw/main/ 下的都立即返回"""
+
+    def log_message(self, *args):
+        pass
+
+    def do_HEAD(self):
+        if '/raw/master/' in self.path:
+            time.sleep(0.3)
+            status = 200 if '/good' in self.path else 404
+        elif '/raw/main/' in self.path:
+            status = 200
+        else:
+            status = 404
+        self.send_response(status)
+        self.send_header('Content-Length', '10')
+        self.end_headers()
+
+
+@pytest.fixture
+def base():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_port}/user/repo/raw/master'
+    server.shutdown()
+
+
+def make_fixer():
+    return GiteeImageFixer(limiter=RateLimiter(rate=0), rules_file=None)
+
+
+def test_working_original_wins_over_faster_rewrite(base):
+    fixer = make_fixer()
+    url = f'{base}/good.png'
+    assert fixer.locate(url) == (url, 10)
+    assert fixer.rules[repo_prefix(url)] == ORIGINAL_RULE
+
+
+def test_rewrite_is_learned_only_when_original_fails(base):
+    fixer = make_fixer()
+    url = f'{base}/gone.png'
+    working, _ = fixer.locate(url)
+    assert working == url.replace('/raw/master/', '/raw/main/')
+    assert fixer.rules[repo_prefix(url)] == '主分支修复'
+
+
+def test_run_batch_bounds_pending_entries():
+    import io
+    from gitee_image_fixer import run_batch
+
+    class CountingFixer:
+        def __init__(self):
+            self.lock = threading.Lock()
+            self.produced = 0
+            self.processed = 0
+            self.max_ahead = 0
+
+        def entries(self, count):
+            for i in range(count):
+                with self.lock:
+                    self.produced += 1
+                    self.max_ahead = max(self.max_ahead, self.produced - self.processed)
+                yield {'url': f'u{i}', 'path': f'p{i}'}
+
+        def process_entry(self, entry):
+            time.sleep(0.001)
+            with self.lock:
+                self.processed += 1
+            return {'url': entry['url'], 'status': 'ok'}
+
+    fixer = CountingFixer()
+    out = io.StringIO()
+    counts = run_batch(fixer, fixer.entries(200), out, workers=4)
+    assert counts['ok'] == 200
+    assert len(out.getvalue().splitlines()) == 200
+    # 同时排队的任务不超过并发数的两倍（加上正在读取的一项）
+    assert fixer.max_ahead <= 4 * 2 + 1
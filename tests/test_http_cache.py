@@ -0,0 +1,110 @@
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+import requests
+
+import http_cache
+from http_cache import HttpCache, ERROR_TTL
+
+ETAG = '"v1"'
+LAST_MODIFIED = 'Wed, 01 Jan 2025 00:00:00 GMT'
+
+
+class HeadStub(BaseHTTPRequestHandler):
+    """模拟图片服务器的 HEAD 响应：/429、/503 限流，其余路径支持条件请求"""
+    requests = []
+
+    def log_message(self, *args):
+        pass
+
+    def do_HEAD(self):
+        self.requests.append((self.path, self.headers.get('If-None-Match'), self.headers.get('If-Modified-Since')))
+        if self.path in ('/429', '/503'):
+            self.send_response(int(self.path[1:]))
+        elif self.headers.get('If-None-Match') == ETAG:
+            self.send_response(304)
+        else:
+            self.send_response(200)
+            self.send_header('Content-Type', 'image/png')
+            self.send_header('ETag', ETAG)
+            self.send_header('Last-Modified', LAST_MODIFIED)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+
+@pytest.fixture
+def server():
+    HeadStub.requests = []
+    server = ThreadingHTTPServer(('127.0.0.1', 0), HeadStub)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_port}'
+    server.shutdown()
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = HttpCache(str(tmp_path / 'http_cache.db'))
+    yield cache
+    cache.close()
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """可以拨快的时钟"""
+    now = [time.time()]
+    monkeypatch.setattr(http_cache.time, 'time', lambda: now[0])
+    return now
+
+
+def test_fresh_record_is_served_without_request(cache, server):
+    url = f'{server}/a.png'
+    with requests.Session() as session:
+        assert cache.check(session, url) == (200, False)
+        assert cache.check(session, url) == (200, True)
+    assert len(HeadStub.requests) == 1
+
+
+def test_expired_record_sends_conditional_request(cache, server, clock):
+    url = f'{server}/a.png'
+    cache.store(url, 200, {'etag': ETAG, 'last-modified': LAST_MODIFIED, 'content-length': '68'}, sha256='abc')
+    clock[0] += cache.ttl + 1
+    assert not cache.is_fresh(cache.get(url))
+
+    with requests.Session() as session:
+        assert cache.check(session, url) == (200, False)
+
+    assert HeadStub.requests == [('/a.png', ETAG, LAST_MODIFIED)]
+    # 304 只刷新检查时间，状态、大小和哈希保持不变
+    record = cache.get(url)
+    assert (record['status'], record['content_length'], record['sha256']) == (200, 68, 'abc')
+    assert record['checked'] == clock[0]
+    assert cache.is_fresh(record)
+
+
+@pytest.mark.parametrize('status', [429, 503])
+def test_throttled_response_is_not_stored(cache, server, status):
+    url = f'{server}/{status}'
+    with requests.Session() as session:
+        assert cache.check(session, url) == (status, False)
+        assert cache.check(session, url) == (status, False)
+    assert cache.get(url) is None
+    assert len(HeadStub.requests) == 2
+
+
+def test_error_record_expires_after_error_ttl(cache, server, clock):
+    url = f'{server}/a.png'
+    cache.store(url, error='Read timed out')
+    with requests.Session() as session:
+        assert cache.check(session, url) == ('Read timed out', True)
+        clock[0] += ERROR_TTL - 1
+        assert cache.check(session, url) == ('Read timed out', True)
+        assert HeadStub.requests == []
+
+        # 出错的记录只保留 ERROR_TTL，远早于正常记录的有效期
+        clock[0] += 2
+        assert ERROR_TTL < cache.ttl
+        assert cache.check(session, url) == (200, False)
+    assert HeadStub.requests == [('/a.png', None, None)]
+    assert cache.get(url)['error'] is None
@@ -0,0 +1,199 @@
+import hashlib
+import json
+import os
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+import requests
+
+from image_download import (stream_to_file, sniff_image_type, PartialDownload, DownloadError,
+                            IncompleteDownload)
+from markdown_image_engine import MarkdownImageEngine
+
+BODY = b'\x89PNG\r\n\x1a\n' + bytes(range(256)) * 800  # 超过两个下载块
+ETAG = '"v1"'
+CUT = 150000  # /cut 第一次只发送这么多字节就断开
+
+
+class ImageStub(BaseHTTPRequestHandler):
+    """模拟图片服务器，行为由路径决定：
+
+    cut 不带 Range 时发送一部分后断开，带 Range 时按 If-Range 返回 206；
+    ignore 忽略 Range 总是返回 200；mismatch 返回起始位置不对的 206；
+    gone 对 Range 请求返回 416；nolength 不发送 Content-Length；html 返回错误页
+    """
+    requests = []
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.requests.append((self.path, self.headers.get('Range'), self.headers.get('If-Range')))
+        range_header = self.headers.get('Range')
+        if self.path == '/html':
+            return self.reply(b'<!DOCTYPE html><html><body>Not Found</body></html>' + b' ' * 8000, 'text/html')
+        if self.path == '/nolength':
+            self.send_response(200)
+            self.send_header('Content-Type', 'image/png')
+            self.end_headers()
+            self.wfile.write(BODY)
+            return
+        if range_header and self.path == '/gone':
+            self.send_response(416)
+            self.send_header('Content-Range', f'bytes */{len(BODY)}')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if range_header and self.path in ('/cut', '/mismatch'):
+            start = 0 if self.path == '/mismatch' else int(range_header.split('=')[1].rstrip('-'))
+            if self.headers.get('If-Range') == ETAG:
+                return self.reply(BODY[start:], status=206,
+                                  content_range=f'bytes {start}-{len(BODY) - 1}/{len(BODY)}')
+        if self.path == '/cut' and not range_header:
+            self.send_response(200)
+            self.send_header('Content-Type', 'image/png')
+            self.send_header('Content-Length', str(len(BODY)))
+            self.send_header('ETag', ETAG)
+            self.end_headers()
+            self.wfile.write(BODY[:CUT])
+            self.wfile.flush()
+            return
+        self.reply(BODY)
+
+    def reply(self, body, content_type='image/png', status=200, content_range=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', ETAG)
+        if content_range:
+            self.send_header('Content-Range', content_range)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def server():
+    ImageStub.requests = []
+    server = ThreadingHTTPServer(('127.0.0.1', 0), ImageStub)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_port}'
+    server.shutdown()
+
+
+def fetch(url, headers=None):
+    return requests.get(url, headers=headers or {}, stream=True, timeout=5)
+
+
+def leave_partial(part_path, url, received):
+    """模拟上次运行留下的部分文件和清单"""
+    with open(part_path, 'wb') as f:
+        f.write(b'x' * received)
+    with open(f'{part_path}.json', 'w', encoding='utf-8') as f:
+        json.dump({'url': url, 'etag': ETAG, 'last_modified': None, 'total': len(BODY), 'received': received}, f)
+
+
+def test_interrupted_download_resumes_in_next_run(tmp_path, server):
+    url = f'{server}/cut'
+    part_path = str(tmp_path / 'a.part')
+    target = tmp_path / 'a.png'
+
+    partial = PartialDownload(part_path, url)
+    with pytest.raises(IncompleteDownload):
+        stream_to_file(fetch(url, partial.resume_headers()), str(target), partial=partial)
+    assert not target.exists()
+
+    # 下次运行：从清单恢复已接收的字节数（断开时未读完的最后一块不计入），用 Range + If-Range 续传
+    partial = PartialDownload(part_path, url)
+    received = partial.received
+    assert 0 < received <= CUT
+    assert os.path.getsize(part_path) == received
+    assert partial.resume_headers() == {'Range': f'bytes={received}-', 'If-Range': ETAG}
+    info = stream_to_file(fetch(url, partial.resume_headers()), str(target), partial=partial)
+
+    assert ImageStub.requests[-1] == ('/cut', f'bytes={received}-', ETAG)
+    assert target.read_bytes() == BODY
+    assert info['size'] == len(BODY)
+    assert info['sha256'] == hashlib.sha256(BODY).hexdigest()
+    assert not os.path.exists(part_path) and not os.path.exists(f'{part_path}.json')
+
+
+def test_server_ignoring_range_restarts_from_scratch(tmp_path, server):
+    url = f'{server}/ignore'
+    part_path = str(tmp_path / 'a.part')
+    leave_partial(part_path, url, 120000)
+    partial = PartialDownload(part_path, url)
+
+    info = stream_to_file(fetch(url, partial.resume_headers()), str(tmp_path / 'a.png'), partial=partial)
+
+    # 200 响应覆盖部分文件，哈希只按新内容计算
+    assert ImageStub.requests[-1][1] == 'bytes=120000-'
+    assert (tmp_path / 'a.png').read_bytes() == BODY
+    assert info['size'] == len(BODY)
+    assert info['sha256'] == hashlib.sha256(BODY).hexdigest()
+
+
+def test_mismatched_content_range_discards_partial(tmp_path, server):
+    url = f'{server}/mismatch'
+    part_path = str(tmp_path / 'a.part')
+    leave_partial(part_path, url, 5000)
+    partial = PartialDownload(part_path, url)
+
+    with pytest.raises(IncompleteDownload):
+        stream_to_file(fetch(url, partial.resume_headers()), str(tmp_path / 'a.png'), partial=partial)
+
+    assert not (tmp_path / 'a.png').exists()
+    assert not os.path.exists(part_path) and not os.path.exists(f'{part_path}.json')
+    assert PartialDownload(part_path, url).resume_headers() == {}
+
+
+def test_range_not_satisfiable_restarts_download(tmp_path, server):
+    url = f'{server}/gone'
+    part_path = str(tmp_path / 'a.part')
+    leave_partial(part_path, url, 5000)
+    engine = MarkdownImageEngine(str(tmp_path))
+    engine.retry_backoff = 0.01
+    try:
+        assert engine.download_image_with_retry(url, str(tmp_path / 'a.png'), max_retries=1, log=lambda message: None,
+                                                partial=PartialDownload(part_path, url))
+    finally:
+        engine.close()
+
+    assert [request[1] for request in ImageStub.requests] == ['bytes=5000-', None]
+    assert (tmp_path / 'a.png').read_bytes() == BODY
+
+
+def test_content_length_over_limit_is_rejected_before_reading(tmp_path, server):
+    with pytest.raises(DownloadError):
+        stream_to_file(fetch(f'{server}/image'), str(tmp_path / 'a.png'), max_bytes=1000)
+    assert os.listdir(tmp_path) == []
+
+
+def test_stream_over_limit_is_aborted(tmp_path, server):
+    with pytest.raises(DownloadError):
+        stream_to_file(fetch(f'{server}/nolength'), str(tmp_path / 'a.png'), max_bytes=100000)
+    assert os.listdir(tmp_path) == []
+
+
+def test_error_page_is_rejected_by_magic_bytes(tmp_path, server):
+    with pytest.raises(DownloadError):
+        stream_to_file(fetch(f'{server}/html'), str(tmp_path / 'a.png'))
+    assert os.listdir(tmp_path) == []
+
+
+def test_interrupted_download_without_partial_removes_temp(tmp_path, server):
+    with pytest.raises((IncompleteDownload, requests.exceptions.RequestException)):
+        stream_to_file(fetch(f'{server}/cut'), str(tmp_path / 'a.png'))
+    assert os.listdir(tmp_path) == []
+
+
+@pytest.mark.parametrize('head, kind', [
+    (BODY[:64], 'png'),
+    (b'\xff\xd8\xff\xe0\x00\x10JFIF', 'jpeg'),
+    (b'RIFF\x00\x00\x00\x00WEBPVP8 ', 'webp'),
+    (b'\xef\xbb\xbf<?xml version="1.0"?>\n<svg xmlns="http://www.w3.org/2000/svg">', 'svg'),
+    (b'<!DOCTYPE html><html><head><title>404</title>', None),
+    (b'{"message": "Not Found"}', None),
+])
+def test_sniff_image_type(head, kind):
+    assert sniff_image_type(head) == kind
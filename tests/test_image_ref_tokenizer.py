@@ -0,0 +1,56 @@
+from image_ref_tokenizer import iter_image_refs, MARKDOWN, HTML
+
+
+def paths(content):
+    return [ref.path for ref in iter_image_refs(content)]
+
+
+def test_markdown_and_html_refs_in_order():
+    content = '![a](img/a.png)\n<img alt="b" src="https://x/b.png">\n![ c ]( img/c.png )\n'
+    refs = list(iter_image_refs(content))
+    assert [ref.path for ref in refs] == ['img/a.png', 'https://x/b.png', 'img/c.png']
+    assert [ref.kind for ref in refs] == [MARKDOWN, HTML, MARKDOWN]
+    assert [ref.is_remote for ref in refs] == [False, True, False]
+    assert refs[1].alt == 'b'
+    # 路径位置不含首尾空白
+    assert content[refs[2].path_start:refs[2].path_end] == 'img/c.png'
+
+
+def test_fenced_code_is_skipped():
+    content = '![](a.png)\n```md\n![](in-code.png)\n```\n![](b.png)\n'
+    assert paths(content) == ['a.png', 'b.png']
+
+
+def test_inline_code_with_backticks_does_not_open_fence():
+    # 反引号围栏的信息字符串不能含反引号，这一行不是围栏
+    content = '```inline``` text\n![](a.png)\n![](b.png)\n'
+    assert paths(content) == ['a.png', 'b.png']
+
+
+def test_tilde_info_string_may_contain_backticks():
+    content = '~~~ info `x`\n![](in-code.png)\n~~~\n![](a.png)\n'
+    assert paths(content) == ['a.png']
+
+
+def test_indented_fences():
+    content = '   ```\n![](in-code.png)\n   ```\n![](a.png)\n'
+    assert paths(content) == ['a.png']
+    # 缩进4个空格不是围栏（是缩进代码块，引用照常识别）
+    content = '    ```\n![](a.png)\n![](b.png)\n'
+    assert paths(content) == ['a.png', 'b.png']
+
+
+def test_closer_must_match_fence_character_and_length():
+    content = '```\n~~~\n![](in-code.png)\n```\n![](a.png)\n'
+    assert paths(content) == ['a.png']
+    content = '````\n```\n![](in-code.png)\n`````\n![](a.png)\n'
+    assert paths(content) == ['a.png']
+
+
+def test_unclosed_fence_runs_to_end_of_document():
+    content = '![](a.png)\n```\n![](in-code.png)\n'
+    assert paths(content) == ['a.png']
+
+
+def test_empty_paths_are_skipped():
+    assert paths('![]()\n![]( )\n![](a.png)\n') == ['a.png']
@@ -0,0 +1,29 @@
+import os
+import subprocess
+import sys
+
+from link_rewriter import mapping_fingerprint, LocalRewriter, RemoteRewriter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_fingerprint_is_stable_across_processes():
+    code = "from link_rewriter import mapping_fingerprint; print(mapping_fingerprint({'/w/a.png': 'https://x/a.png'}))"
+    outputs = {subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True,
+                              env=dict(os.environ, PYTHONHASHSEED=str(seed))).stdout for seed in (1, 2)}
+    assert outputs == {mapping_fingerprint({'/w/a.png': 'https://x/a.png'}) + '\n'}
+
+
+def test_fingerprint_changes_with_mapping():
+    assert mapping_fingerprint({'/w/a.png': 'https://x/a.png'}) != mapping_fingerprint({'/w/a.png': 'https://x/b.png'})
+
+
+def test_rewriters_round_trip():
+    mapping = {'/w/img/a.png': 'https://x/a.png'}
+    content = '![a](img/a.png) `![a](img/a.png)`\n'
+    edits = RemoteRewriter(mapping).edits(content, '/w/note.md')
+    assert [edit['new'] for edit in edits] == ['https://x/a.png', 'https://x/a.png']
+
+    remote = '![a](https://x/a.png) https://x/a.png\n'
+    edits = LocalRewriter(mapping, os.path.relpath).edits(remote, '/w/note.md')
+    assert [(edit['old'], edit['new']) for edit in edits] == [('https://x/a.png', 'img/a.png')]
@@ -0,0 +1,171 @@
+import os
+
+import pytest
+
+from markdown_image_engine import MarkdownImageEngine
+from markdown_scanner import (ScanCache, ExistenceIndex, walk_workspace, extract_image_refs, resolve_ref_path,
+                              normalize_path, DEFAULT_IGNORE_PATTERNS)
+from image_ref_tokenizer import is_remote_path
+
+IMAGE_EXTENSIONS = {'.png', '.jpg', '.gif'}
+
+
+@pytest.fixture
+def workspace(tmp_path):
+    root = tmp_path / 'notes'
+    files = {
+        'a.md': ('![](img/a.png)\n![](img/missing.png)\n![](https://x.test/r.png)\n![](../outside/o.png)\n'
+                 '```\n![](img/in-code.png)\n```\n'),
+        'sub/b.md': '![](../img/a.png)\n<img src="../img/b.jpg">\n![](../node_modules/pkg/logo.png)\n',
+        'node_modules/pkg/readme.md': '![](logo.png)\n',
+        '.git/notes.md': '![](../img/unused.gif)\n',
+        'drafts/c.md': '![](../img/unused.gif)\n',
+    }
+    for name, content in files.items():
+        path = root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content, encoding='utf-8')
+    for name in ('img/a.png', 'img/b.jpg', 'img/unused.gif', 'node_modules/pkg/logo.png', '../outside/o.png'):
+        path = root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b'\x89PNG\r\n\x1a\n')
+    return root
+
+
+def make_engine(root):
+    engine = MarkdownImageEngine(str(root))
+    engine.scan_workers = 1
+    engine.ignore_patterns = list(DEFAULT_IGNORE_PATTERNS) + ['drafts']
+    return engine
+
+
+def baseline_scan(root, ignored=('.git', 'node_modules', 'drafts')):
+    """不用缓存和索引的逐个文件扫描，作为对照"""
+    md_files, image_files = [], []
+    for dir_path, dirs, files in os.walk(root):
+        dirs[:] = [d for d in dirs if d not in ignored and not d.startswith('.backup')]
+        for name in files:
+            path = normalize_path(os.path.join(dir_path, name))
+            ext = os.path.splitext(name)[1].lower()
+            if ext == '.md':
+                md_files.append(path)
+            elif ext in IMAGE_EXTENSIONS:
+                image_files.append(path)
+    references, invalid = {}, {}
+    for md_file in md_files:
+        with open(md_file, 'r', encoding='utf-8') as f:
+            refs = extract_image_refs(f.read())
+        for ref in refs:
+            if is_remote_path(ref):
+                references.setdefault(md_file, []).append(ref)
+                continue
+            path = resolve_ref_path(os.path.dirname(md_file), ref)
+            if os.path.exists(path):
+                references.setdefault(md_file, []).append(path)
+            else:
+                invalid.setdefault(md_file, []).append(ref)
+    referenced = {img for imgs in references.values() for img in imgs}
+    return {
+        'md_files': sorted(md_files),
+        'image_references': references,
+        'invalid_images': invalid,
+        'unused_images': sorted(img for img in image_files if img not in referenced),
+    }
+
+
+def test_scan_matches_baseline_and_rescan_parses_nothing(workspace):
+    engine = make_engine(workspace)
+    try:
+        engine.image_extensions = IMAGE_EXTENSIONS
+        for attempt in range(2):
+            engine.scan()
+            assert {
+                'md_files': sorted(engine.md_files),
+                'image_references': engine.image_references,
+                'invalid_images': engine.invalid_images,
+                'unused_images': sorted(engine.unused_images),
+            } == baseline_scan(str(workspace))
+        assert engine.last_scan_cache_stats == {'parsed': 0, 'cached': 2}
+    finally:
+        engine.close()
+
+
+def test_scan_cache_is_invalidated_by_mtime_size_or_inode(workspace):
+    engine = make_engine(workspace)
+    note = workspace / 'a.md'
+    try:
+        engine.scan()
+        assert engine.last_scan_cache_stats == {'parsed': 2, 'cached': 0}
+
+        # 只改修改时间
+        st = os.stat(note)
+        os.utime(note, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000))
+        engine.scan()
+        assert engine.last_scan_cache_stats == {'parsed': 1, 'cached': 1}
+
+        # 修改时间不变、大小改变
+        st = os.stat(note)
+        note.write_text(note.read_text(encoding='utf-8') + '![](img/b.jpg)\n', encoding='utf-8')
+        os.utime(note, ns=(st.st_atime_ns, st.st_mtime_ns))
+        engine.scan()
+        assert engine.last_scan_cache_stats == {'parsed': 1, 'cached': 1}
+        assert engine.image_references[normalize_path(str(note))][-1].endswith('img/b.jpg')
+
+        # 整个文件被替换：修改时间和大小都相同，只有 inode 不同
+        st = os.stat(note)
+        replacement = workspace / 'a.md.new'
+        replacement.write_text(note.read_text(encoding='utf-8').replace('img/a.png', 'img/x.png'), encoding='utf-8')
+        os.utime(replacement, ns=(st.st_atime_ns, st.st_mtime_ns))
+        os.replace(replacement, note)
+        assert os.stat(note).st_ino != st.st_ino
+        engine.scan()
+        assert engine.last_scan_cache_stats == {'parsed': 1, 'cached': 1}
+        assert engine.invalid_images[normalize_path(str(note))][0] == 'img/x.png'
+    finally:
+        engine.close()
+
+
+def test_scan_cache_key_compares_all_fields(tmp_path):
+    cache = ScanCache(str(tmp_path / 'cache.json'))
+    cache.put('/w/a.md', [1, 2, 3], ['a.png'])
+    cache.save()
+    cache = ScanCache(str(tmp_path / 'cache.json'))
+    cache.load()
+    assert cache.get('/w/a.md', [1, 2, 3]) == ['a.png']
+    for key in ([9, 2, 3], [1, 9, 3], [1, 2, 9]):
+        assert cache.get('/w/a.md', key) is None
+    assert (cache.hits, cache.misses) == (1, 3)
+
+
+def test_walk_prunes_ignored_dirs(workspace):
+    (workspace / 'docs' / 'drafts').mkdir(parents=True)
+    (workspace / 'docs' / 'drafts' / 'd.md').write_text('', encoding='utf-8')
+    (workspace / 'docs' / 'e.md').write_text('', encoding='utf-8')
+    root = normalize_path(str(workspace))
+
+    walk = walk_workspace(root, IMAGE_EXTENSIONS, list(DEFAULT_IGNORE_PATTERNS) + ['docs/drafts'])
+    assert sorted(walk.md_files) == [f'{root}/a.md', f'{root}/docs/e.md', f'{root}/drafts/c.md', f'{root}/sub/b.md']
+    assert sorted(walk.pruned_dirs) == [f'{root}/.git', f'{root}/docs/drafts', f'{root}/node_modules']
+    assert f'{root}/node_modules/pkg/logo.png' not in walk.image_files
+    # 按名称匹配的规则在任意层级生效
+    walk = walk_workspace(root, IMAGE_EXTENSIONS, ['drafts'])
+    assert sorted(walk.pruned_dirs) == [f'{root}/docs/drafts', f'{root}/drafts']
+
+
+def test_existence_index_falls_back_to_filesystem_outside_walk(workspace):
+    root = normalize_path(str(workspace))
+    walk = walk_workspace(root, IMAGE_EXTENSIONS)
+    index = ExistenceIndex(root, walk.image_files, IMAGE_EXTENSIONS, walk.pruned_dirs, case_insensitive=False)
+
+    # 工作目录内的图片直接查表
+    assert index.resolve(f'{root}/img/a.png') == f'{root}/img/a.png'
+    assert index.resolve(f'{root}/img/missing.png') is None
+    assert index.stat_calls == 0
+
+    # 工作目录之外、被忽略的目录之内和非图片扩展名的引用访问文件系统
+    outside = resolve_ref_path(root, '../outside/o.png')
+    assert index.resolve(outside) == outside
+    assert index.resolve(resolve_ref_path(root, '../outside/none.png')) is None
+    assert index.resolve(f'{root}/node_modules/pkg/logo.png') == f'{root}/node_modules/pkg/logo.png'
+    assert index.resolve(f'{root}/a.md') == f'{root}/a.md'
+    assert index.stat_calls == 4
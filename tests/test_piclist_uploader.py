@@ -0,0 +1,121 @@
+import json
+import os
+import socket
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+
+from piclist_uploader import PicListUploader
+
+
+class PicListStub(BaseHTTPRequestHandler):
+    """模拟 PicList 上传服务，行为由文件名决定：
+
+    reject 整批返回 400；fail 返回 success=false；slow 超时；short 只返回 result
+    """
+    requests = []
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        paths = body['list']
+        self.requests.append((self.path, paths))
+        names = [os.path.basename(path) for path in paths]
+        urls = [f'https://cdn.test/{name}' for name in names]
+        if any(name.startswith('reject') for name in names):
+            return self.reply({'success': False, 'message': 'bad request'}, status=400)
+        if any(name.startswith('fail') for name in names):
+            return self.reply({'success': False, 'message': 'upload failed'})
+        if any(name.startswith('slow') for name in names):
+            time.sleep(1)
+        if any(name.startswith('short') for name in names):
+            return self.reply({'success': True, 'result': urls})
+        self.reply({'success': True, 'result': urls,
+                    'fullResult': [{'fileName': name, 'imgUrl': url} for name, url in zip(names, urls)]})
+
+    def reply(self, data, status=200):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def endpoint():
+    PicListStub.requests = []
+    server = ThreadingHTTPServer(('127.0.0.1', 0), PicListStub)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_port}/upload'
+    server.shutdown()
+
+
+def images(tmp_path, *names):
+    paths = []
+    for name in names:
+        path = tmp_path / name
+        path.write_bytes(b'\x89PNG\r\n\x1a\n')
+        paths.append(str(path))
+    return paths
+
+
+def test_batches_and_per_file_urls(tmp_path, endpoint):
+    paths = images(tmp_path, *[f'{i}.png' for i in range(5)])
+    uploader = PicListUploader(endpoint, key='secret')
+    missing = str(tmp_path / 'missing.png')
+    results = {path: (url, error) for path, url, error in uploader.upload(paths + [missing], batch_size=2)}
+    assert [len(paths) for _, paths in PicListStub.requests] == [2, 2, 1]
+    assert all(path == '/upload?key=secret' for path, _ in PicListStub.requests)
+    for path in paths:
+        assert results[path] == (f'https://cdn.test/{os.path.basename(path)}', None)
+    assert results[missing][0] is None and results[missing][1]
+
+
+def test_result_list_is_used_without_full_result(tmp_path, endpoint):
+    paths = images(tmp_path, 'short1.png', 'short2.png')
+    results = PicListUploader(endpoint).upload_batch(paths)
+    assert [url for _, url, _ in results] == ['https://cdn.test/short1.png', 'https://cdn.test/short2.png']
+
+
+def test_rejected_batch_is_retried_per_file(tmp_path, endpoint):
+    paths = images(tmp_path, 'a.png', 'reject.png', 'b.png')
+    results = PicListUploader(endpoint).upload_batch(paths)
+    assert len(PicListStub.requests) == 4
+    assert [url for _, url, _ in results] == ['https://cdn.test/a.png', None, 'https://cdn.test/b.png']
+
+
+@pytest.mark.parametrize('name', ['fail.png', 'slow.png'])
+def test_unknown_outcome_is_not_retried(tmp_path, endpoint, name):
+    paths = images(tmp_path, 'a.png', name)
+    results = PicListUploader(endpoint, timeout=0.3).upload_batch(paths)
+    assert len(PicListStub.requests) == 1
+    assert all(url is None and error for _, url, error in results)
+
+
+def test_service_down_fails_without_placeholder(tmp_path):
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    paths = images(tmp_path, 'a.png', 'b.png')
+    results = PicListUploader(f'http://127.0.0.1:{port}/upload').upload_batch(paths)
+    assert all(url is None and '无法连接' in error for _, url, error in results)
+
+
+def test_engine_upload_records_only_real_urls(tmp_path, endpoint):
+    from markdown_image_engine import MarkdownImageEngine
+
+    images(tmp_path, 'ok.png', 'fail.png')
+    (tmp_path / 'note.md').write_text('![](ok.png)\n![](fail.png)\n', encoding='utf-8')
+    engine = MarkdownImageEngine(str(tmp_path))
+    engine.mapping_file = str(tmp_path / 'mapping.json')
+    engine.piclist_endpoint = endpoint
+    engine.upload_batch_size = 1
+    engine.scan()
+    assert engine.upload() == {'uploaded': 1, 'failed': 1, 'skipped': 0}
+    assert list(engine.image_mapping.values()) == ['https://cdn.test/ok.png']
+    engine.close()
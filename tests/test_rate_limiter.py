@@ -0,0 +1,122 @@
+import email.utils
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+import requests
+
+from rate_limiter import RateLimiter, RateLimitedAdapter, RequestDeferred, parse_retry_after
+
+
+def http_date(seconds_from_now):
+    return email.utils.formatdate(time.time() + seconds_from_now, usegmt=True)
+
+
+def test_token_bucket_spaces_requests():
+    limiter = RateLimiter(rate=10, host_rates={})
+    start = time.monotonic()
+    for _ in range(6):
+        limiter.acquire('example.com')
+    # 第一个请求立即发出，之后每 0.1 秒一个
+    assert 0.45 <= time.monotonic() - start < 0.8
+
+
+def test_hosts_have_separate_buckets():
+    limiter = RateLimiter(rate=1, host_rates={})
+    start = time.monotonic()
+    for host in ('a.example', 'b.example', 'c.example'):
+        limiter.acquire(host)
+    assert time.monotonic() - start < 0.1
+
+
+def test_host_rate_overrides_match_subdomains():
+    limiter = RateLimiter(rate=10, host_rates={'gitee.com': 2})
+    assert limiter.rate_for('gitee.com') == 2
+    assert limiter.rate_for('raw.gitee.com:443') == 2
+    assert limiter.rate_for('notgitee.com') == 10
+
+
+def test_parse_retry_after():
+    assert parse_retry_after('120') == 120
+    assert 115 < parse_retry_after(http_date(120)) <= 120
+    assert parse_retry_after(http_date(-60)) == 0
+    assert parse_retry_after(None) is None
+    assert parse_retry_after('soon') is None
+
+
+@pytest.mark.parametrize('retry_after', ['300', http_date(300)])
+def test_long_retry_after_defers(retry_after):
+    limiter = RateLimiter(rate=0, max_wait=60)
+    limiter.record('example.com', 429, retry_after)
+    with pytest.raises(RequestDeferred) as info:
+        limiter.acquire('example.com')
+    assert info.value.wait > 60
+    assert limiter.throttled_hosts() == {'example.com': 1}
+
+
+def test_throttling_halves_concurrency_and_recovers():
+    limiter = RateLimiter(rate=0, max_concurrency=4)
+    limiter.record('example.com', 503, '0')
+    assert limiter.concurrency('example.com') == 2
+    for _ in range(8):
+        limiter.record('example.com', 200)
+    assert limiter.concurrency('example.com') == 3
+
+
+class ThrottlingHandler(BaseHTTPRequestHandler):
+    """每个路径第一次请求返回 429，之后返回 200"""
+    seen = set()
+    retry_after = {}
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.path not in self.seen:
+            self.seen.add(self.path)
+            self.send_response(429)
+            self.send_header('Retry-After', self.retry_after[self.path]())
+        else:
+            self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+
+@pytest.fixture
+def stub():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), ThrottlingHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_port}'
+    server.shutdown()
+
+
+@pytest.mark.parametrize('path, retry_after', [
+    ('/seconds', lambda: '1'),
+    ('/date', lambda: http_date(2)),
+])
+def test_adapter_waits_for_retry_after(stub, path, retry_after):
+    ThrottlingHandler.retry_after[path] = retry_after
+    limiter = RateLimiter(rate=0)
+    session = requests.Session()
+    session.mount('http://', RateLimitedAdapter(limiter))
+
+    assert session.get(stub + path).status_code == 429
+    start = time.monotonic()
+    assert session.get(stub + path).status_code == 200
+    # HTTP日期只精确到秒
+    assert time.monotonic() - start >= 0.9
+    session.close()
+
+
+def test_pooled_sessions_defer_after_long_retry_after(stub):
+    from download_scheduler import HostSessionPool
+
+    ThrottlingHandler.retry_after['/long'] = lambda: '300'
+    limiter = RateLimiter(rate=0, max_wait=60)
+    pool = HostSessionPool(limiter=limiter)
+    session = pool.get(stub + '/long')
+    assert session.get(stub + '/long').status_code == 429
+    with pytest.raises(RequestDeferred):
+        pool.get(stub + '/other').get(stub + '/other')
+    pool.close()
@@ -0,0 +1,79 @@
+import os
+
+import pytest
+
+from markdown_scanner import ReferenceIndex, WalkResult, walk_workspace, read_file_refs, normalize_path
+from reference_store import ReferenceStore
+
+IMAGE_EXTENSIONS = {'.png'}
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ReferenceStore(str(tmp_path / 'refs.db'))
+    yield store
+    store.close()
+
+
+def index_workspace(root):
+    root = normalize_path(str(root))
+    walk = walk_workspace(root, IMAGE_EXTENSIONS)
+    index = ReferenceIndex(root, IMAGE_EXTENSIONS)
+    index.build(walk, {md_file: read_file_refs(md_file)[1] for md_file in walk.md_files})
+    return index
+
+
+def synthetic_index(file_refs):
+    """只含远程引用的索引，不需要磁盘上的文件"""
+    index = ReferenceIndex('/w', IMAGE_EXTENSIONS)
+    index.build(WalkResult(list(file_refs), [], {}, [], 0), file_refs)
+    return index
+
+
+def test_sync_only_touches_changed_files(tmp_path, store):
+    root = tmp_path / 'notes'
+    (root / 'img').mkdir(parents=True)
+    (root / 'img' / 'a.png').write_bytes(b'\x89PNG\r\n\x1a\n')
+    (root / 'a.md').write_text('![](img/a.png)\n![](https://x.test/a.png)\n', encoding='utf-8')
+    (root / 'b.md').write_text('![](https://x.test/b.png)\n![](missing.png)\n', encoding='utf-8')
+    base = normalize_path(str(root))
+
+    assert store.sync_from_index(index_workspace(root)) == 2
+    assert store.sync_from_index(index_workspace(root)) == 0
+    assert store.references() == {f'{base}/a.md': [f'{base}/img/a.png', 'https://x.test/a.png'],
+                                  f'{base}/b.md': ['https://x.test/b.png']}
+    assert store.broken_refs() == {f'{base}/b.md': ['missing.png']}
+
+    # 新增文件
+    (root / 'c.md').write_text('![](img/a.png)\n', encoding='utf-8')
+    assert store.sync_from_index(index_workspace(root)) == 1
+    assert store.references()[f'{base}/c.md'] == [f'{base}/img/a.png']
+
+    # 删除文件：引用和只被它使用的URL一起移除
+    os.remove(root / 'b.md')
+    assert store.sync_from_index(index_workspace(root)) == 1
+    assert f'{base}/b.md' not in store.md_files()
+    assert store.broken_refs() == {}
+    assert store.remote_urls() == ['https://x.test/a.png']
+
+    # 改名：旧文件移除、新文件加入
+    os.rename(root / 'a.md', root / 'd.md')
+    assert store.sync_from_index(index_workspace(root)) == 2
+    assert store.md_files() == [f'{base}/c.md', f'{base}/d.md']
+    assert store.files_referencing([f'{base}/img/a.png']) == [f'{base}/c.md', f'{base}/d.md']
+    assert store.files_referencing(['https://x.test/a.png']) == [f'{base}/d.md']
+
+
+@pytest.mark.parametrize('count', [499, 500, 501, 1001])
+def test_files_referencing_spans_query_chunks(store, count):
+    md_files = [f'/w/{i:04d}.md' for i in range(count)]
+    file_refs = {md_file: [f'https://x.test/{i}.png'] for i, md_file in enumerate(md_files)}
+    # 第一个文件还引用一个排在最后一批的URL
+    file_refs[md_files[0]].append('https://x.test/last.png')
+    store.sync_from_index(synthetic_index(file_refs))
+
+    targets = [f'https://x.test/{i}.png' for i in reversed(range(count))] + ['https://x.test/last.png']
+    # 结果按扫描顺序返回，跨批次命中同一文件时不重复
+    assert store.files_referencing(targets) == md_files
+    assert store.files_referencing(targets[-2:]) == [md_files[0]]
+    assert store.files_referencing(['https://x.test/none.png'] * 600) == []
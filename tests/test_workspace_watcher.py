@@ -0,0 +1,60 @@
+import time
+import threading
+
+import pytest
+
+from markdown_image_engine import MarkdownImageEngine
+from workspace_watcher import WorkspaceWatcher, _WatchdogHandler, Observer
+
+
+class FakeEvent:
+    def __init__(self, event_type, src_path, is_directory=False):
+        self.event_type = event_type
+        self.src_path = src_path
+        self.is_directory = is_directory
+
+
+def scan_workspace(root):
+    (root / 'img').mkdir()
+    (root / 'img' / 'a.png').write_bytes(b'\x89PNG\r\n\x1a\n')
+    (root / 'note.md').write_text('![](img/a.png)\n', encoding='utf-8')
+    engine = MarkdownImageEngine(str(root))
+    engine.scan()
+    return engine
+
+
+def test_read_events_are_ignored(tmp_path):
+    engine = scan_workspace(tmp_path)
+    watcher = WorkspaceWatcher(engine.reference_index)
+    handler = _WatchdogHandler(watcher)
+    note = str(tmp_path / 'note.md')
+    handler.on_any_event(FakeEvent('opened', note))
+    handler.on_any_event(FakeEvent('closed_no_write', note))
+    assert not watcher.pending
+    handler.on_any_event(FakeEvent('closed', note))
+    assert watcher.pending == {note}
+
+
+@pytest.mark.skipif(Observer is None, reason="需要 watchdog")
+def test_single_edit_produces_single_update(tmp_path):
+    engine = scan_workspace(tmp_path)
+    updates = []
+    updated = threading.Event()
+
+    def on_update(paths):
+        updates.append(paths)
+        updated.set()
+
+    watcher = WorkspaceWatcher(engine.reference_index, on_update=on_update, debounce=0.2)
+    watcher.start()
+    try:
+        assert watcher.mode == 'native'
+        time.sleep(0.3)
+        note = tmp_path / 'note.md'
+        note.write_text('![](img/a.png)\n![](img/b.png)\n', encoding='utf-8')
+        assert updated.wait(5)
+        # 监视器读取文件产生的事件不能再次触发更新
+        time.sleep(1.5)
+    finally:
+        watcher.stop()
+    assert updates == [[str(note)]]
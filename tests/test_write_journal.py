@@ -0,0 +1,68 @@
+import os
+
+import pytest
+
+from write_journal import WriteJournal, StaleFileError, prune_journals, find_journals, file_sha256, COMMITTED
+
+
+def test_stage_rejects_file_changed_since_read(tmp_path):
+    target = tmp_path / 'a.md'
+    target.write_text('old', encoding='utf-8')
+    read_hash = file_sha256(str(target))
+    target.write_text('edited', encoding='utf-8')
+
+    journal = WriteJournal.create(str(tmp_path / 'journal'), 'test')
+    with pytest.raises(StaleFileError):
+        journal.stage(str(target), 'new', expected_hash=read_hash)
+    assert target.read_text(encoding='utf-8') == 'edited'
+
+
+def test_commit_skips_file_changed_after_stage(tmp_path):
+    edited = tmp_path / 'a.md'
+    untouched = tmp_path / 'b.md'
+    edited.write_text('a', encoding='utf-8')
+    untouched.write_text('b', encoding='utf-8')
+
+    journal = WriteJournal.create(str(tmp_path / 'journal'), 'test')
+    entry = journal.stage(str(edited), 'a2')
+    journal.stage(str(untouched), 'b2')
+    edited.write_text('user edit', encoding='utf-8')
+
+    assert journal.commit() == [str(edited)]
+    assert edited.read_text(encoding='utf-8') == 'user edit'
+    assert untouched.read_text(encoding='utf-8') == 'b2'
+    assert not os.path.exists(entry['temp'])
+    assert [e['file'] for e in WriteJournal.load(journal.journal_dir).entries] == [str(untouched)]
+
+
+def test_prune_keeps_latest_journals(tmp_path):
+    backup = tmp_path / '.backup'
+    dirs = []
+    for i in range(5):
+        journal = WriteJournal.create(str(backup / f'journal_{i}'), 'test')
+        journal.state = COMMITTED
+        journal.save()
+        dirs.append(journal.journal_dir)
+    # 中断的日志不清除
+    WriteJournal.create(str(backup / 'journal_staged'), 'test')
+
+    assert prune_journals(str(backup), keep=2) == dirs[:4]
+    assert find_journals(str(backup)) == [dirs[4], str(backup / 'journal_staged')]
+
+
+def test_find_journals_orders_by_recorded_creation_time(tmp_path):
+    backup = tmp_path / '.backup'
+    created = {
+        'journal_b': '2026-01-01T10:00:00.000002',
+        'journal_a': '2026-01-01T10:00:00.000001',
+        'journal_c': '2026-01-01T09:59:59',  # 旧版本只记录到秒
+    }
+    for name, stamp in created.items():
+        os.makedirs(backup / name, exist_ok=True)
+        WriteJournal(str(backup / name), 'test', state=COMMITTED, created=stamp).save()
+    # 目录按 b、a、c 的顺序建立，其时间戳与记录的创建顺序无关
+    os.utime(backup / 'journal_c', (0, 0))
+    (backup / 'journal_b' / 'touch').write_text('x')
+
+    assert find_journals(str(backup)) == [str(backup / n) for n in ('journal_c', 'journal_a', 'journal_b')]
+    assert prune_journals(str(backup), keep=1) == [str(backup / 'journal_c'), str(backup / 'journal_a')]
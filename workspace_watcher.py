@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+工作目录监视
+监听工作目录中的文件变化，合并短时间内的连续事件后，
+只对发生变化的路径增量更新引用索引，分析结果无需重新扫描即可保持最新。
+
+安装了 watchdog 时使用系统文件通知（Linux 上为 inotify），否则定时轮询。
+不依赖界面，可以直接对临时目录使用。
+"""
+
+import os
+import time
+import threading
+from markdown_scanner import normalize_path, walk_workspace, read_file_refs, is_ignored_path
+
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:
+    Observer = None
+    FileSystemEventHandler = object
+
+# 表示内容或目录结构发生变化的事件；opened / closed_no_write 只是读取（包括监视器自己读取文件），不处理
+CHANGE_EVENTS = {'created', 'modified', 'deleted', 'moved', 'closed'}
+
+
+class _WatchdogHandler(FileSystemEventHandler):
+    """把 watchdog 事件转交给 WorkspaceWatcher"""
+
+    def __init__(self, watcher):
+        self.watcher = watcher
+
+    def on_any_event(self, event):
+        if event.event_type not in CHANGE_EVENTS:
+            return
+        # 目录的修改事件只表示其中的文件有变化，文件本身会产生独立事件
+        if event.is_directory and event.event_type == 'modified':
+            return
+        self.watcher.notify(event.src_path)
+        dest_path = getattr(event, 'dest_path', None)
+        if dest_path:
+            self.watcher.notify(dest_path)
+
+
+class WorkspaceWatcher:
+    """监视工作目录并增量更新 ReferenceIndex
+
+    index: 扫描得到的引用索引
+    on_update: 索引更新后的回调，参数为实际发生变化的路径列表（在监视线程中调用）
+    debounce: 最后一个事件之后等待的秒数，期间的事件合并为一批处理
+    poll_interval: 轮询模式下的扫描间隔（秒）
+    use_native: 是否优先使用系统文件通知
+    """
+
+    def __init__(self, index, on_update=None, debounce=0.5, poll_interval=2.0, use_native=True, log=None):
+        self.index = index
+        self.root = index.root
+        self.root_prefix = index.root.rstrip('/') + '/'
+        self.on_update = on_update
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.use_native = use_native
+        self.log = log or (lambda message: None)
+
+        self.mode = None  # 'native' 或 'polling'
+        self.running = False
+        self.pending = set()
+        self.last_event_time = 0
+        self.condition = threading.Condition()
+        self.stop_event = threading.Event()
+        self.observer = None
+        self.snapshot = None
+
+    def start(self):
+        """开始监视"""
+        self.running = True
+        self.stop_event.clear()
+        if self.use_native and Observer is not None:
+            self.observer = Observer()
+            self.observer.schedule(_WatchdogHandler(self), self.root, recursive=True)
+            self.observer.daemon = True
+            self.observer.start()
+            self.mode = 'native'
+        else:
+            self.snapshot = self.take_snapshot()
+            threading.Thread(target=self._poll_loop, daemon=True).start()
+            self.mode = 'polling'
+        threading.Thread(target=self._debounce_loop, daemon=True).start()
+
+    def stop(self):
+        """停止监视，未处理的事件会被丢弃"""
+        with self.condition:
+            self.running = False
+            self.pending.clear()
+            self.condition.notify_all()
+        self.stop_event.set()
+        if self.observer:
+            self.observer.stop()
+            self.observer.join(timeout=5)
+            self.observer = None
+
+    def notify(self, path):
+        """登记一个发生变化的路径"""
+        path = normalize_path(os.path.normpath(path))
+        if self.is_ignored(path):
+            return
+        with self.condition:
+            self.pending.add(path)
+            self.last_event_time = time.monotonic()
+            self.condition.notify_all()
+
+    def is_ignored(self, path):
+        """工作目录之外或位于忽略目录中的路径不处理"""
+        if not path.startswith(self.root_prefix):
+            return True
+        return is_ignored_path(path[len(self.root_prefix):], self.index.ignore_re)
+
+    def _debounce_loop(self):
+        """等待事件停止一段时间后批量处理"""
+        while True:
+            with self.condition:
+                while self.running and not self.pending:
+                    self.condition.wait()
+                while self.running:
+                    remaining = self.last_event_time + self.debounce - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.condition.wait(remaining)
+                if not self.running:
+                    return
+                paths = sorted(self.pending)
+                self.pending.clear()
+
+            try:
+                changed = self.apply_changes(paths)
+            except Exception as e:
+                self.log(f"❌ 监视更新失败: {e}")
+                continue
+            if changed and self.on_update:
+                self.on_update(changed)
+
+    def apply_changes(self, paths):
+        """把一批变化的路径应用到引用索引，返回实际引起变化的路径"""
+        return [path for path in paths if self._apply_path(path)]
+
+    def _apply_path(self, path):
+        index = self.index
+        ext = os.path.splitext(path)[1].lower()
+
+        if os.path.isdir(path):
+            # 新建或移入的目录：只遍历该目录
+            walk = walk_workspace(path, index.image_extensions, index.ignore_patterns,
+                                  rel_root=path[len(self.root_prefix):])
+            changed = False
+            for md_file in walk.md_files:
+                changed = self._update_md(md_file) or changed
+            for img in walk.image_files:
+                changed = index.add_image(img) or changed
+            return changed
+
+        if os.path.isfile(path):
+            if ext == '.md':
+                return self._update_md(path)
+            if ext in index.image_extensions:
+                return index.add_image(path)
+            return False
+
+        # 路径已不存在：可能是文件，也可能是整个目录
+        if ext == '.md' and index.remove_md(path):
+            return True
+        if ext in index.image_extensions and index.remove_image(path):
+            return True
+        return index.remove_tree(path)
+
+    def _update_md(self, md_file):
+        _, refs, error = read_file_refs(md_file)
+        if error:
+            self.log(f"❌ 读取 {md_file} 失败: {error}")
+            return False
+        self.index.update_md(md_file, refs)
+        return True
+
+    def take_snapshot(self):
+        """轮询模式：记录MD文件状态和图片文件列表"""
+        walk = walk_workspace(self.root, self.index.image_extensions, self.index.ignore_patterns)
+        return walk.md_stats, set(walk.image_files)
+
+    def _poll_loop(self):
+        """轮询模式：定时比较快照，把差异作为事件登记"""
+        while not self.stop_event.wait(self.poll_interval):
+            try:
+                md_stats, images = self.take_snapshot()
+            except Exception as e:
+                self.log(f"❌ 轮询工作目录失败: {e}")
+                continue
+            old_md_stats, old_images = self.snapshot
+            self.snapshot = (md_stats, images)
+
+            for md_file, key in md_stats.items():
+                if old_md_stats.get(md_file) != key:
+                    self.notify(md_file)
+            for md_file in old_md_stats.keys() - md_stats.keys():
+                self.notify(md_file)
+            for img in images ^ old_images:
+                self.notify(img)
@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+写入日志（事务式多文件写入）
+修改MD文件的操作都通过这里写入：
+1. 新内容先写到目标文件旁的临时文件
+2. 提交时统一 fsync 所有临时文件，再逐个原子替换（os.replace）目标文件
+3. 每个操作一个日志目录，记录每个文件修改前后的 SHA-256，并保存修改前的内容
+4. 中断的操作在下次运行时自动清理或回滚，已完成的操作也可以整体回滚
+5. 提交前核对目标文件的哈希，读取之后又被修改的文件不覆盖
+6. 只保留最近的若干个日志，更早的连同修改前的内容一起清除
+
+只保存实际被修改的文件，不再需要单独复制整个目录做备份。
+"""
+
+import os
+import json
+import uuid
+import shutil
+import hashlib
+import datetime
+import threading
+
+JOURNAL_FILE = "journal.json"
+STAGED_FILE = "staged.jsonl"  # 暂存阶段逐条追加的记录，中断后据此清理临时文件
+
+# 日志状态
+STAGED = 'staged'            # 已写入临时文件，目标文件未改动
+COMMITTING = 'committing'    # 正在替换目标文件
+COMMITTED = 'committed'      # 全部替换完成
+ABORTED = 'aborted'          # 已放弃，临时文件已删除
+ROLLED_BACK = 'rolled_back'  # 已回滚到修改前的内容
+
+DEFAULT_KEEP = 20  # 保留的日志数
+
+
+class StaleFileError(Exception):
+    """目标文件在读取之后被修改，新内容基于旧版本，不能写入"""
+
+
+def file_sha256(path):
+    """文件内容的 SHA-256，文件不存在时返回 None"""
+    try:
+        with open(path, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except FileNotFoundError:
+        return None
+
+
+def fsync_path(path, directory=False):
+    """把文件（或目录项）刷到磁盘，目录 fsync 在 Windows 上不支持，直接跳过"""
+    if directory and os.name == 'nt':
+        return
+    fd = os.open(path, os.O_RDONLY if directory else os.O_RDWR)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def atomic_write_bytes(path, data):
+    """单个文件的原子写入：临时文件 + fsync + 替换"""
+    temp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+    with open(temp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+
+class WriteJournal:
+    """一次操作的写入日志
+
+    journal_dir: 日志目录，保存 journal.json 和修改前的文件内容（按哈希命名）
+    operation: 操作名称，仅用于记录
+    """
+
+    def __init__(self, journal_dir, operation='', entries=None, state=STAGED, created=None):
+        self.journal_dir = journal_dir
+        self.operation = operation
+        self.entries = entries if entries is not None else []
+        self.state = state
+        self.created = created or datetime.datetime.now().isoformat(timespec='microseconds')
+        self.lock = threading.Lock()
+
+    @classmethod
+    def create(cls, journal_dir, operation):
+        os.makedirs(journal_dir, exist_ok=True)
+        journal = cls(journal_dir, operation)
+        journal.save()
+        return journal
+
+    @classmethod
+    def load(cls, journal_dir):
+        with open(os.path.join(journal_dir, JOURNAL_FILE), 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        entries = data.get('entries', [])
+        if data.get('state', STAGED) == STAGED and not entries:
+            # 暂存阶段中断，记录只在追加文件中
+            try:
+                with open(os.path.join(journal_dir, STAGED_FILE), 'r', encoding='utf-8') as f:
+                    entries = [json.loads(line) for line in f if line.strip()]
+            except (FileNotFoundError, ValueError):
+                entries = []
+        return cls(journal_dir, data.get('operation', ''), entries,
+                   data.get('state', STAGED), data.get('created'))
+
+    def save(self):
+        """原子写入 journal.json"""
+        data = {
+            'operation': self.operation,
+            'created': self.created,
+            'state': self.state,
+            'entries': self.entries,
+        }
+        atomic_write_bytes(os.path.join(self.journal_dir, JOURNAL_FILE),
+                           json.dumps(data, ensure_ascii=False, indent=2).encode('utf-8'))
+
+    def blob_path(self, sha256):
+        """修改前内容的保存位置"""
+        return os.path.join(self.journal_dir, f"{sha256}.orig")
+
+    # ---------- 写入 ----------
+
+    def stage(self, path, content, encoding='utf-8', expected_hash=None):
+        """登记一个文件的新内容（写入临时文件，目标文件暂不改动），可在多个线程中调用
+
+        expected_hash: 计算新内容时读到的文件哈希，文件已经变化时抛出 StaleFileError
+        返回登记的记录（包含修改前后的哈希）
+        """
+        try:
+            with open(path, 'rb') as f:
+                pre_image = f.read()
+        except FileNotFoundError:
+            pre_image = None
+        pre_hash = hashlib.sha256(pre_image).hexdigest() if pre_image is not None else None
+        if expected_hash is not None and pre_hash != expected_hash:
+            raise StaleFileError(f"文件在读取之后被修改: {path}")
+        if pre_image is not None and not os.path.exists(self.blob_path(pre_hash)):
+            with open(self.blob_path(pre_hash), 'wb') as f:
+                f.write(pre_image)
+
+        temp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+        with open(temp_path, 'w', encoding=encoding) as f:
+            f.write(content)
+        post_hash = file_sha256(temp_path)
+
+        entry = {
+            'file': path,
+            'temp': temp_path,
+            'pre_hash': pre_hash,
+            'post_hash': post_hash,
+        }
+        with self.lock:
+            self.entries.append(entry)
+            with open(os.path.join(self.journal_dir, STAGED_FILE), 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        return entry
+
+    def commit(self):
+        """提交所有登记的文件：批量 fsync 后逐个原子替换
+
+        登记之后又被修改的文件（哈希与登记时不同）不替换，从日志中移除并删除其临时文件。
+        返回这些被跳过的文件列表。
+        """
+        stale = [entry for entry in self.entries if file_sha256(entry['file']) != entry['pre_hash']]
+        for entry in stale:
+            self.entries.remove(entry)
+            try:
+                os.remove(entry['temp'])
+            except FileNotFoundError:
+                pass
+
+        # 临时文件和修改前内容统一刷盘，之后才开始替换目标文件
+        for entry in self.entries:
+            fsync_path(entry['temp'])
+        for pre_hash in {entry['pre_hash'] for entry in self.entries if entry['pre_hash']}:
+            fsync_path(self.blob_path(pre_hash))
+        self.state = COMMITTING
+        self.save()
+
+        for entry in self.entries:
+            os.replace(entry['temp'], entry['file'])
+        for directory in {os.path.dirname(entry['file']) for entry in self.entries}:
+            fsync_path(directory, directory=True)
+
+        self.state = COMMITTED
+        self.save()
+        return [entry['file'] for entry in stale]
+
+    def abort(self):
+        """放弃尚未提交的修改，删除临时文件"""
+        for entry in self.entries:
+            try:
+                os.remove(entry['temp'])
+            except FileNotFoundError:
+                pass
+        self.state = ABORTED
+        self.save()
+
+    def rollback(self, force=False):
+        """把本次操作修改过的文件恢复为修改前的内容
+
+        文件在操作之后又被修改过时默认跳过（force 为 True 时仍然恢复）。
+        返回 (恢复的文件列表, 跳过的文件列表)
+        """
+        restored = []
+        conflicts = []
+        for entry in reversed(self.entries):
+            path = entry['file']
+            current_hash = file_sha256(path)
+            if current_hash == entry['pre_hash']:
+                continue
+            if current_hash != entry['post_hash'] and not force:
+                conflicts.append(path)
+                continue
+            if entry['pre_hash'] is None:
+                os.remove(path)
+            else:
+                with open(self.blob_path(entry['pre_hash']), 'rb') as f:
+                    atomic_write_bytes(path, f.read())
+            restored.append(path)
+
+        # 中断时可能残留临时文件
+        for entry in self.entries:
+            try:
+                os.remove(entry['temp'])
+            except FileNotFoundError:
+                pass
+        self.state = ROLLED_BACK
+        self.save()
+        return restored, conflicts
+
+
+def journal_created(journal_dir):
+    """日志记录的创建时间（ISO 格式字符串，可直接比较），读取失败时返回空串"""
+    try:
+        with open(os.path.join(journal_dir, JOURNAL_FILE), 'r', encoding='utf-8') as f:
+            return json.load(f).get('created') or ''
+    except (OSError, ValueError, AttributeError):
+        return ''
+
+
+def find_journals(backup_base):
+    """返回备份目录下所有写入日志的目录，按日志中记录的创建时间排序
+
+    不使用目录的 ctime：复制、恢复备份或修改目录属性都会改变它。
+    创建时间相同时按目录名排序。
+    """
+    if not os.path.isdir(backup_base):
+        return []
+    journal_dirs = []
+    for item in os.listdir(backup_base):
+        journal_dir = os.path.join(backup_base, item)
+        if os.path.isfile(os.path.join(journal_dir, JOURNAL_FILE)):
+            journal_dirs.append(journal_dir)
+    return sorted(journal_dirs, key=lambda d: (journal_created(d), os.path.basename(d)))
+
+
+def recover_journals(backup_base, skip=()):
+    """处理上次中断的操作：未开始替换的直接清理，替换到一半的回滚
+
+    skip: 正在进行中的日志目录，不做处理
+    返回 [(日志目录, 处理前的状态)]
+    """
+    recovered = []
+    for journal_dir in find_journals(backup_base):
+        if journal_dir in skip:
+            continue
+        journal = WriteJournal.load(journal_dir)
+        if journal.state == STAGED:
+            journal.abort()
+            recovered.append((journal_dir, STAGED))
+        elif journal.state == COMMITTING:
+            journal.rollback()
+            recovered.append((journal_dir, COMMITTING))
+    return recovered
+
+
+def prune_journals(backup_base, keep=DEFAULT_KEEP, skip=()):
+    """清除较早的已结束日志（已提交、已放弃或已回滚），只保留最近 keep 个日志
+
+    skip: 正在进行中的日志目录，不做处理
+    返回清除的日志目录
+    """
+    journal_dirs = [d for d in find_journals(backup_base) if d not in skip]
+    removed = []
+    for journal_dir in journal_dirs[:max(0, len(journal_dirs) - keep)]:
+        try:
+            state = WriteJournal.load(journal_dir).state
+        except (OSError, ValueError):
+            continue
+        if state in (STAGED, COMMITTING):
+            # 中断的操作由 recover_journals 处理
+            continue
+        shutil.rmtree(journal_dir, ignore_errors=True)
+        removed.append(journal_dir)
+    return removed